@@ -0,0 +1,181 @@
+"""Anthropic Message Batches for structured extractions.
+
+process_all sends one live request per review through instructor, a few at
+a time, so a refresh with thousands of reviews waits out thousands of round
+trips. The Message Batches API instead takes up to MAX_BATCH_REQUESTS
+requests at once, processes them asynchronously (usually within the hour)
+and costs half as much per token.
+
+MessageBatchRunner submits requests in batches of batch_size, polls until
+each batch has ended and returns every request's result by custom_id.
+Tool-call requests are built the way instructor builds them for a
+response_model, so parse_result gives back the same pydantic object a live
+call would:
+
+    runner = MessageBatchRunner(anthropic.AsyncAnthropic())
+    params = {
+        custom_id: message_params(model, max_tokens, prompt, QuoteExtraction)
+        for custom_id, prompt in prompts.items()
+    }
+    results = await runner.run(params)
+    extraction = parse_result(results[custom_id], QuoteExtraction)
+
+Submitted batch IDs are kept in submitted (e.g. a store namespace) until
+their results are read, so a run interrupted while waiting picks the same
+batches back up instead of paying for them twice.
+
+client is an anthropic.AsyncAnthropic; the stand-in in
+anthropic_batch_standin serves the same endpoints offline.
+"""
+
+import asyncio
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+import cache_keys
+
+# The API's limits are 100,000 requests or 256 MB per batch
+MAX_BATCH_REQUESTS = 100_000
+DEFAULT_BATCH_SIZE = 10_000
+DEFAULT_POLL_SECONDS = 30.0
+# Batches expire after 24 hours
+DEFAULT_MAX_WAIT_SECONDS = 24 * 60 * 60
+
+SUBMITTED_BATCHES_NAMESPACE = "anthropic_submitted_batches"
+
+
+class BatchTimeout(Exception):
+    pass
+
+
+def custom_id(*parts) -> str:
+    """A custom_id (letters, digits, - and _, at most 64) identifying parts."""
+    return "req_" + cache_keys.input_digest(parts)
+
+
+def tool_definition(response_model) -> dict:
+    schema = response_model.model_json_schema()
+    return {
+        "name": response_model.__name__,
+        "description": schema.get("description")
+        or f"Correctly extracted `{response_model.__name__}` with all the required parameters with correct types",
+        "input_schema": schema,
+    }
+
+
+def message_params(model: str, max_tokens: int, prompt: str, response_model, system=None) -> dict:
+    """Messages API parameters forcing one tool call shaped like response_model."""
+    tool = tool_definition(response_model)
+    params = {
+        "model": model,
+        "max_tokens": max_tokens,
+        "messages": [{"role": "user", "content": prompt}],
+        "tools": [tool],
+        "tool_choice": {"type": "tool", "name": tool["name"]},
+    }
+    if system is not None:
+        params["system"] = system
+    return params
+
+
+def parse_result(result: dict, response_model):
+    """The response_model from a succeeded result's tool call.
+
+    Raises ValueError for errored, canceled or expired results and for
+    messages without a valid tool call.
+    """
+    if result["type"] != "succeeded":
+        raise ValueError(f"Batch request {result['type']}: {result.get('error')}")
+    for block in result["message"]["content"]:
+        if block["type"] == "tool_use" and block["name"] == response_model.__name__:
+            return response_model.model_validate(block["input"])
+    raise ValueError("No tool call in batch result")
+
+
+def _as_dict(value) -> dict:
+    return value.model_dump() if hasattr(value, "model_dump") else value
+
+
+class MessageBatchRunner:
+    def __init__(
+        self,
+        client,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        poll_seconds: float = DEFAULT_POLL_SECONDS,
+        max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS,
+        submitted=None,
+        metrics=None,
+        stats: Counter | None = None,
+        clock=time.monotonic,
+    ):
+        assert 0 < batch_size <= MAX_BATCH_REQUESTS
+        self.client = client
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_wait_seconds = max_wait_seconds
+        # batch key -> batch ID, for batches whose results weren't read yet
+        self.submitted = submitted if submitted is not None else {}
+        self.metrics = metrics
+        self.stats = stats if stats is not None else Counter()
+        self.clock = clock
+
+    def _api_call(self, endpoint):
+        return self.metrics.api_call(endpoint) if self.metrics is not None else nullcontext()
+
+    async def run(self, requests: dict[str, dict]) -> dict[str, dict]:
+        """Results ({"type": ..., "message" or "error": ...}) by custom_id.
+
+        requests maps custom_id to Messages API parameters. All batches are
+        submitted before any is waited for, so they are processed together.
+        """
+        custom_ids = list(requests)
+        batches = []
+        for start in range(0, len(custom_ids), self.batch_size):
+            chunk = custom_ids[start : start + self.batch_size]
+            batches.append(await self._submit({i: requests[i] for i in chunk}))
+
+        results = {}
+        for key, batch_id in batches:
+            await self._wait(batch_id)
+            async for entry in await self.client.messages.batches.results(batch_id):
+                entry = _as_dict(entry)
+                if entry["custom_id"] in requests:
+                    results[entry["custom_id"]] = entry["result"]
+                    self.stats[f"batch_results_{entry['result']['type']}"] += 1
+            self.submitted.pop(key, None)
+            self._flush_submitted()
+        return results
+
+    async def _submit(self, requests: dict[str, dict]) -> tuple[str, str]:
+        """(batch key, batch ID), reusing a batch already submitted for requests."""
+        key = cache_keys.input_digest([requests])
+        batch_id = self.submitted.get(key)
+        if batch_id is not None:
+            self.stats["batches_resumed"] += 1
+            return key, batch_id
+        with self._api_call("anthropic.batches.create"):
+            batch = await self.client.messages.batches.create(
+                requests=[{"custom_id": i, "params": params} for i, params in requests.items()]
+            )
+        self.stats["batches_submitted"] += 1
+        self.stats["batch_requests"] += len(requests)
+        self.submitted[key] = batch.id
+        self._flush_submitted()
+        return key, batch.id
+
+    def _flush_submitted(self):
+        if hasattr(self.submitted, "flush"):
+            self.submitted.flush()
+
+    async def _wait(self, batch_id: str):
+        deadline = self.clock() + self.max_wait_seconds
+        while True:
+            with self._api_call("anthropic.batches.retrieve"):
+                batch = await self.client.messages.batches.retrieve(batch_id)
+            if batch.processing_status == "ended":
+                return batch
+            if self.clock() >= deadline:
+                raise BatchTimeout(f"Batch {batch_id} still {batch.processing_status}")
+            self.stats["batch_polls"] += 1
+            await asyncio.sleep(self.poll_seconds)
@@ -0,0 +1,194 @@
+"""Local stand-in for the Anthropic Message Batches API.
+
+MessageBatches keeps batches in memory and answers each request with
+answer(params), a Messages API response or None for an errored request. A
+batch reports in_progress for its first polls_to_end retrieves, so clients
+exercise their polling. ReplayStandIn serves batches the same way, answered
+from the quote cache.
+
+MessageBatchStandIn is a StandInServer around MessageBatches, answering
+tool calls with respond(params), so MessageBatchRunner can be tested and
+benchmarked through the real SDK without an API key:
+
+    python anthropic_batch_standin.py bench --requests 5000 --latency-ms 400
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+import time
+
+from standin_server import StandInServer
+
+BATCHES_PATH = ["v1", "messages", "batches"]
+
+
+def tool_use_message(params: dict, tool_input: dict, message_id: str) -> dict:
+    """A Messages API response calling params' first tool with tool_input."""
+    return {
+        "id": message_id,
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model"),
+        "content": [
+            {
+                "type": "tool_use",
+                "id": "toolu_" + message_id,
+                "name": (params.get("tools") or [{"name": "tool"}])[0]["name"],
+                "input": tool_input,
+            }
+        ],
+        "stop_reason": "tool_use",
+        "stop_sequence": None,
+        "usage": {"input_tokens": len(json.dumps(params)) // 4, "output_tokens": len(json.dumps(tool_input)) // 4},
+    }
+
+
+class MessageBatches:
+    def __init__(self, answer, polls_to_end: int = 1):
+        self.answer = answer
+        self.polls_to_end = polls_to_end
+        self.batches = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def route(self, standin: StandInServer, handler, rest: list[str], base_url: str):
+        """Handles rest (the path after the service prefix) if it is a batches endpoint."""
+        if rest[:3] != BATCHES_PATH:
+            return standin.not_found(handler)
+        batch_rest = rest[3:]
+        if handler.command == "POST" and not batch_rest:
+            standin.count("batches.create")
+            return standin.send(handler, 200, self.create(json.loads(handler.body), base_url))
+        batch = self.batches.get(batch_rest[0]) if batch_rest else None
+        if batch is None:
+            return standin.not_found(handler)
+        if len(batch_rest) == 1:
+            standin.count("batches.retrieve")
+            return standin.send(handler, 200, self.retrieve(batch))
+        if batch_rest[1:] == ["results"] and batch["processing_status"] == "ended":
+            standin.count("batches.results")
+            data = "".join(json.dumps(result) + "\n" for result in batch["results"])
+            return standin.send_bytes(handler, 200, data.encode("utf-8"), content_type="application/binary")
+        return standin.not_found(handler)
+
+    def create(self, body: dict, base_url: str) -> dict:
+        with self._lock:
+            batch_id = f"msgbatch_standin_{next(self._ids):06d}"
+        results = []
+        for request in body["requests"]:
+            message = self.answer(request["params"])
+            if message is None:
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "not_found_error", "message": "No answer"}}}
+            else:
+                result = {"type": "succeeded", "message": message}
+            results.append({"custom_id": request["custom_id"], "result": result})
+        batch = {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "in_progress",
+            "request_counts": {"processing": len(results), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": "2025-01-01T00:00:00Z",
+            "expires_at": "2025-01-02T00:00:00Z",
+            "ended_at": None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": None,
+            "results": results,
+            "polls": 0,
+            "base_url": base_url.rstrip("/"),
+        }
+        self.batches[batch_id] = batch
+        return self._public(batch)
+
+    def retrieve(self, batch: dict) -> dict:
+        with self._lock:
+            batch["polls"] += 1
+            if batch["processing_status"] != "ended" and batch["polls"] >= self.polls_to_end:
+                counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+                for result in batch["results"]:
+                    counts[result["result"]["type"]] += 1
+                batch.update(
+                    processing_status="ended",
+                    request_counts=counts,
+                    ended_at="2025-01-01T00:10:00Z",
+                    results_url=f"{batch['base_url']}/v1/messages/batches/{batch['id']}/results",
+                )
+        return self._public(batch)
+
+    @staticmethod
+    def _public(batch: dict) -> dict:
+        return {k: v for k, v in batch.items() if k not in ("results", "polls", "base_url")}
+
+
+class MessageBatchStandIn(StandInServer):
+    """respond(params) returns a tool call's input, or None to error the request."""
+
+    def __init__(self, respond, polls_to_end: int = 1, **kwargs):
+        super().__init__(**kwargs)
+        self.respond = respond
+        self._message_ids = itertools.count(1)
+        self.batches = MessageBatches(self._answer, polls_to_end)
+
+    @property
+    def url(self) -> str:
+        """Base URL to pass to anthropic.AsyncAnthropic."""
+        return self.base_url.rstrip("/")
+
+    def _answer(self, params):
+        tool_input = self.respond(params)
+        if tool_input is None:
+            return None
+        return tool_use_message(params, tool_input, f"msg_standin_{next(self._message_ids):06d}")
+
+    def route(self, handler, parts, params):
+        return self.batches.route(self, handler, parts, self.url)
+
+
+def benchmark(num_requests: int, latency_ms: float, live_concurrency: int):
+    import anthropic
+    from pydantic import BaseModel
+
+    from anthropic_batch import MessageBatchRunner, message_params
+
+    class Extraction(BaseModel):
+        quote: str
+
+    def respond(params):
+        return {"quote": params["messages"][0]["content"][:20]}
+
+    requests = {f"req_{i}": message_params("model", 64, f"Review {i}", Extraction) for i in range(num_requests)}
+    with MessageBatchStandIn(respond, latency_seconds=latency_ms / 1000.0) as standin:
+        client = anthropic.AsyncAnthropic(api_key="stand-in-key", base_url=standin.url, max_retries=0)
+        runner = MessageBatchRunner(client, poll_seconds=0.1)
+        start = time.perf_counter()
+        results = asyncio.run(runner.run(requests))
+        batch_seconds = time.perf_counter() - start
+        assert len(results) == num_requests
+
+    # Live requests at live_concurrency each wait out one round trip
+    live_seconds = num_requests / live_concurrency * latency_ms / 1000.0
+    print(f"{num_requests} requests, {latency_ms} ms latency")
+    print(f"  {'batch':>12}: {standin.total_requests():5d} requests, {batch_seconds:7.2f} s")
+    print(f"  {'live (est.)':>12}: {num_requests:5d} requests, {live_seconds:7.2f} s")
+    return batch_seconds, live_seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Anthropic Message Batches API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("bench", help="Time a batch run against live request latency")
+    bench.add_argument("--requests", type=int, default=5000)
+    bench.add_argument("--latency-ms", type=float, default=400.0)
+    bench.add_argument("--live-concurrency", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        benchmark(args.requests, args.latency_ms, args.live_concurrency)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
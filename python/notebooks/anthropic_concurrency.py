@@ -0,0 +1,113 @@
+"""Adaptive concurrency for live Anthropic calls.
+
+process_all ran a fixed max_concurrent requests at once and left retries to
+the SDK's max_retries, so the guessed constant either left most of the rate
+limit unused or hid a stream of 429s behind the SDK's backoff.
+AnthropicConcurrency puts one AdaptiveConcurrencyLimiter per model in front
+of the client (each model has its own limits): concurrency grows while
+responses stay fast and error-free, halves on 429 and overloaded (529)
+responses, and each overload pauses new requests for its Retry-After.
+
+    concurrency = AnthropicConcurrency(metrics=metrics)
+    result = await concurrency.call(model, client.messages.create, model=model, ...)
+
+Create the client with max_retries=0 so overloads reach the limiter instead
+of being retried blindly by the SDK. Errors raised through instructor are
+classified by the API error they wrap.
+"""
+
+import asyncio
+import random
+from collections import Counter
+
+import anthropic
+
+from rate_limit import AdaptiveConcurrencyLimiter, parse_retry_after
+
+DEFAULT_INITIAL_CONCURRENCY = 3
+DEFAULT_MAX_CONCURRENCY = 50
+DEFAULT_MAX_RETRIES = 5
+
+OVERLOAD_STATUSES = (429, 529)
+# Statuses the SDK would retry besides overloads
+TRANSIENT_STATUSES = (408, 409, 500, 502, 503, 504)
+
+
+def api_error(error: BaseException) -> anthropic.APIError | None:
+    """The anthropic.APIError error is or wraps, if any."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, anthropic.APIError):
+            return error
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def classify(error: BaseException) -> tuple[str, float | None]:
+    """("overload", Retry-After or None), ("transient", None) or ("error", None)."""
+    cause = api_error(error)
+    if isinstance(cause, anthropic.APIConnectionError):
+        return "transient", None
+    status = getattr(cause, "status_code", None)
+    if status in OVERLOAD_STATUSES:
+        retry_after = cause.response.headers.get("retry-after")
+        return "overload", parse_retry_after(retry_after) if retry_after is not None else None
+    if status in TRANSIENT_STATUSES:
+        return "transient", None
+    return "error", None
+
+
+class AnthropicConcurrency:
+    def __init__(
+        self,
+        initial_limit: int = DEFAULT_INITIAL_CONCURRENCY,
+        min_limit: int = 1,
+        max_limit: int = DEFAULT_MAX_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_backoff_seconds: float = 1.0,
+        metrics=None,
+        **limiter_kwargs,
+    ):
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.metrics = metrics
+        self.limiter_kwargs = limiter_kwargs
+        self.limiters: dict[str, AdaptiveConcurrencyLimiter] = {}
+
+    def limiter(self, model: str) -> AdaptiveConcurrencyLimiter:
+        """model's limiter, created on first use with its stats in the metrics."""
+        if model not in self.limiters:
+            stats = self.metrics.counter(f"anthropic_concurrency.{model}") if self.metrics else Counter()
+            self.limiters[model] = AdaptiveConcurrencyLimiter(
+                self.initial_limit, self.min_limit, self.max_limit, stats=stats, **self.limiter_kwargs
+            )
+        return self.limiters[model]
+
+    async def call(self, model: str, func, /, *args, **kwargs):
+        """await func(*args, **kwargs) within model's limit, retrying overloads and transient errors."""
+        limiter = self.limiter(model)
+        for attempt in range(self.max_retries + 1):
+            started = await limiter.acquire_async()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                kind, retry_after = classify(e)
+                if kind == "overload":
+                    limiter.on_overload(started, retry_after)
+                else:
+                    limiter.on_error(started)
+                if kind == "error" or attempt == self.max_retries:
+                    raise
+                limiter.stats[f"{kind}_retries"] += 1
+                if kind == "transient":
+                    await asyncio.sleep(self.retry_backoff_seconds * 2**attempt * (1 + random.random()))
+                continue
+            except BaseException:
+                limiter.on_error(started)
+                raise
+            limiter.on_success(started)
+            return result
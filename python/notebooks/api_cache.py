@@ -0,0 +1,465 @@
+"""Shared SQLite store for the external API caches.
+
+Every cache used to be a JSON file that was loaded whole with json.load and
+rewritten whole with json.dump(indent=4) on each save. That made startup and
+save cost grow with the cache, and anything not yet saved was lost if the
+kernel died.
+
+Here every API gets a namespace in one SQLite database. A namespace behaves
+like the dict it replaces (get, [], in, items, ...), but values are read per
+key on first access and writes are buffered and committed in batched
+transactions. A crash loses at most the writes since the last batch.
+
+Existing JSON caches are imported into their namespace the first time they
+are opened, so nothing needs to be migrated by hand.
+
+Lookups that found nothing are remembered in a NegativeCache next to the
+namespace, so songs that really aren't on a service aren't searched again
+on every rebuild. Negative entries expire after a TTL, and force_refresh
+ignores them all for one run.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+API_CACHE_FILENAME = "caches/api_cache.sqlite3"
+
+SPOTIFY_NAMESPACE = "spotify"
+SPOTIFY_ARTIST_NAMESPACE = "spotify_artist0"
+APPLE_MUSIC_NAMESPACE = "apple_music"
+YOUTUBE_MUSIC_SEARCH_NAMESPACE = "youtube_music_search"
+YOUTUBE_VIDEO_SEARCH_NAMESPACE = "youtube_video_search"
+ANTHROPIC_EXTRACT_QUOTE_NAMESPACE = "anthropic_extract_quote"
+
+# Number of buffered writes after which a namespace commits on its own
+DEFAULT_AUTOFLUSH_EVERY = 50
+
+# Negative entries live in "<namespace>:not_found"
+NEGATIVE_CACHE_SUFFIX = ":not_found"
+DEFAULT_NEGATIVE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# Environment overrides, e.g. API_CACHE_FORCE_REFRESH=1 for one rebuild
+FORCE_REFRESH_ENV = "API_CACHE_FORCE_REFRESH"
+NEGATIVE_TTL_DAYS_ENV = "API_CACHE_NEGATIVE_TTL_DAYS"
+
+_MISSING = object()
+_DELETED = object()
+
+
+class CacheStore:
+    """One SQLite database holding any number of cache namespaces."""
+
+    def __init__(
+        self,
+        filename=API_CACHE_FILENAME,
+        autoflush_every=DEFAULT_AUTOFLUSH_EVERY,
+        negative_ttl_seconds: float | None = None,
+        force_refresh: bool | None = None,
+    ):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.filename = filename
+        self.autoflush_every = autoflush_every
+        if negative_ttl_seconds is None:
+            days = os.getenv(NEGATIVE_TTL_DAYS_ENV)
+            negative_ttl_seconds = (
+                float(days) * 24 * 60 * 60 if days else DEFAULT_NEGATIVE_TTL_SECONDS
+            )
+        if force_refresh is None:
+            force_refresh = os.getenv(FORCE_REFRESH_ENV, "") not in ("", "0", "false")
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.force_refresh = force_refresh
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID
+            """
+        )
+        self._namespaces: dict[str, "CacheNamespace"] = {}
+        self._negative: dict[str, "NegativeCache"] = {}
+        # Don't lose buffered writes when the interpreter exits normally
+        atexit.register(_close_if_alive, weakref.ref(self))
+
+    def namespace(self, name: str) -> "CacheNamespace":
+        with self._lock:
+            if name not in self._namespaces:
+                self._namespaces[name] = CacheNamespace(self, name)
+            return self._namespaces[name]
+
+    def negative(self, name: str) -> "NegativeCache":
+        """The negative cache for namespace name."""
+        with self._lock:
+            key = name + NEGATIVE_CACHE_SUFFIX
+            if key not in self._negative:
+                self._negative[key] = NegativeCache(self, self.namespace(key))
+            return self._negative[key]
+
+    def namespaces(self) -> dict[str, int]:
+        """Names of all namespaces on disk with their entry counts."""
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute(
+                "SELECT namespace, COUNT(*) FROM entries GROUP BY namespace ORDER BY namespace"
+            ).fetchall()
+        return dict(rows)
+
+    def flush(self):
+        with self._lock:
+            for namespace in self._namespaces.values():
+                namespace.flush()
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+
+def _close_if_alive(store_ref):
+    store = store_ref()
+    if store is not None:
+        store.close()
+
+
+class CacheNamespace(MutableMapping):
+    """Dict-like view of one namespace with lazy reads and batched writes."""
+
+    def __init__(self, store: CacheStore, name: str):
+        self.store = store
+        self.name = name
+        # Decoded values already read from disk
+        self._loaded: dict = {}
+        # Writes not yet committed; _DELETED marks a pending delete
+        self._pending: dict = {}
+        self._batch_depth = 0
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def _lookup(self, key):
+        with self.store._lock:
+            value = self._pending.get(key, _MISSING)
+            if value is _DELETED:
+                return _MISSING
+            if value is not _MISSING:
+                return value
+            value = self._loaded.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            rows = self.store._execute(
+                "SELECT value FROM entries WHERE namespace = ? AND key = ?",
+                (self.name, key),
+            )
+            if not rows:
+                return _MISSING
+            value = json.loads(rows[0][0])
+            self._loaded[key] = value
+            return value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _MISSING
+
+    def get_many(self, keys) -> dict:
+        """Looks up many keys with one query per 500 keys. Missing keys are omitted."""
+        found = {}
+        to_query = []
+        with self.store._lock:
+            for key in keys:
+                value = self._pending.get(key, _MISSING)
+                if value is _MISSING:
+                    value = self._loaded.get(key, _MISSING)
+                if value is _DELETED:
+                    continue
+                if value is _MISSING:
+                    to_query.append(key)
+                else:
+                    found[key] = value
+
+            for i in range(0, len(to_query), 500):
+                chunk = to_query[i : i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.store._execute(
+                    f"SELECT key, value FROM entries WHERE namespace = ? AND key IN ({placeholders})",
+                    (self.name, *chunk),
+                )
+                for key, raw in rows:
+                    value = json.loads(raw)
+                    self._loaded[key] = value
+                    found[key] = value
+        return found
+
+    def keys_on_disk(self):
+        rows = self.store._execute(
+            "SELECT key FROM entries WHERE namespace = ? ORDER BY key", (self.name,)
+        )
+        return [row[0] for row in rows]
+
+    def __iter__(self):
+        with self.store._lock:
+            keys = self.keys_on_disk()
+            pending = dict(self._pending)
+        seen = set()
+        for key in keys:
+            seen.add(key)
+            if pending.get(key, _MISSING) is not _DELETED:
+                yield key
+        for key, value in pending.items():
+            if key not in seen and value is not _DELETED:
+                yield key
+
+    def __len__(self):
+        with self.store._lock:
+            count = self.store._execute(
+                "SELECT COUNT(*) FROM entries WHERE namespace = ?", (self.name,)
+            )[0][0]
+            for key, value in self._pending.items():
+                on_disk = bool(
+                    self.store._execute(
+                        "SELECT 1 FROM entries WHERE namespace = ? AND key = ?",
+                        (self.name, key),
+                    )
+                )
+                if value is _DELETED and on_disk:
+                    count -= 1
+                elif value is not _DELETED and not on_disk:
+                    count += 1
+            return count
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def __setitem__(self, key, value):
+        with self.store._lock:
+            self._pending[key] = value
+            self._loaded.pop(key, None)
+            self._maybe_autoflush()
+
+    def __delitem__(self, key):
+        with self.store._lock:
+            if key not in self:
+                raise KeyError(key)
+            self._pending[key] = _DELETED
+            self._loaded.pop(key, None)
+            self._maybe_autoflush()
+
+    def update_many(self, items):
+        """Writes many entries in a single transaction."""
+        with self.batch():
+            for key, value in items:
+                self[key] = value
+
+    def _maybe_autoflush(self):
+        if self._batch_depth == 0 and len(self._pending) >= self.store.autoflush_every:
+            self.flush()
+
+    @contextmanager
+    def batch(self):
+        """Defers commits until the block exits, then writes everything at once."""
+        with self.store._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self.store._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.flush()
+
+    def flush(self):
+        """Commits buffered writes in one transaction."""
+        with self.store._lock:
+            if not self._pending:
+                return
+            now = time.time()
+            upserts = []
+            deletes = []
+            for key, value in self._pending.items():
+                if value is _DELETED:
+                    deletes.append((self.name, key))
+                else:
+                    upserts.append((self.name, key, json.dumps(value, ensure_ascii=False), now))
+            with self.store.transaction() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                    upserts,
+                )
+                conn.executemany(
+                    "DELETE FROM entries WHERE namespace = ? AND key = ?", deletes
+                )
+            for key, value in self._pending.items():
+                if value is not _DELETED:
+                    self._loaded[key] = value
+            self._pending.clear()
+
+    def clear(self):
+        with self.store._lock:
+            self._pending.clear()
+            self._loaded.clear()
+            with self.store.transaction() as conn:
+                conn.execute("DELETE FROM entries WHERE namespace = ?", (self.name,))
+
+    def __repr__(self):
+        return f"CacheNamespace({self.name!r}, {self.store.filename!r})"
+
+
+class NegativeCache:
+    """Keys an API returned nothing for, each remembered for the store's TTL."""
+
+    def __init__(self, store: CacheStore, namespace: CacheNamespace, clock=time.time):
+        self.store = store
+        self.namespace = namespace
+        self.clock = clock
+
+    def __contains__(self, key) -> bool:
+        if self.store.force_refresh:
+            return False
+        entry = self.namespace.get(key)
+        if entry is None:
+            return False
+        return self.clock() - entry["at"] < self.store.negative_ttl_seconds
+
+    def add(self, key):
+        self.namespace[key] = {"at": self.clock()}
+
+    def discard(self, key):
+        if key in self.namespace:
+            del self.namespace[key]
+
+    def __len__(self):
+        return len(self.namespace)
+
+    def flush(self):
+        self.namespace.flush()
+
+    def purge_expired(self) -> int:
+        """Deletes expired entries, returning how many were removed."""
+        now = self.clock()
+        expired = [
+            key
+            for key, entry in self.namespace.items()
+            if now - entry["at"] >= self.store.negative_ttl_seconds
+        ]
+        with self.namespace.batch():
+            for key in expired:
+                del self.namespace[key]
+        return len(expired)
+
+
+def import_json_cache(namespace: CacheNamespace, filename: str) -> int:
+    """Copies a legacy JSON cache file into namespace. Returns the entry count."""
+    with open(filename, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    namespace.update_many(data.items())
+    return len(data)
+
+
+def export_json_cache(namespace: CacheNamespace, filename: str):
+    """Writes namespace out in the legacy JSON cache format."""
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(dict(namespace.items()), f, indent=4)
+
+
+def open_cache(store: CacheStore, name: str, legacy_json_filename: str | None = None):
+    """Opens a namespace, importing the legacy JSON cache the first time."""
+    namespace = store.namespace(name)
+    if (
+        legacy_json_filename is not None
+        and os.path.exists(legacy_json_filename)
+        and not store._execute(
+            "SELECT 1 FROM entries WHERE namespace = ? LIMIT 1", (name,)
+        )
+    ):
+        count = import_json_cache(namespace, legacy_json_filename)
+        print(f"Imported {count} entries from {legacy_json_filename} into {name}")
+    return namespace
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or migrate the API cache store")
+    parser.add_argument("--db", default=API_CACHE_FILENAME)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("stats")
+    purge = subparsers.add_parser(
+        "purge-negative", help="Delete negative entries (all of them with --all)"
+    )
+    purge.add_argument("namespace")
+    purge.add_argument("--all", action="store_true")
+    for command in ("import", "export"):
+        sub = subparsers.add_parser(command)
+        sub.add_argument("namespace")
+        sub.add_argument("filename")
+
+    args = parser.parse_args(argv)
+    store = CacheStore(args.db)
+    try:
+        if args.command == "stats":
+            for name, count in store.namespaces().items():
+                print(f"{name}: {count}")
+        elif args.command == "import":
+            count = import_json_cache(store.namespace(args.namespace), args.filename)
+            print(f"Imported {count} entries into {args.namespace}")
+        elif args.command == "purge-negative":
+            negative = store.negative(args.namespace)
+            if args.all:
+                count = len(negative)
+                negative.namespace.clear()
+            else:
+                count = negative.purge_expired()
+            print(f"Removed {count} negative entries from {args.namespace}")
+        elif args.command == "export":
+            export_json_cache(store.namespace(args.namespace), args.filename)
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,215 @@
+"""Pooled, concurrent Apple Music API client.
+
+The notebook used a bare requests.get per call, so every request paid for
+a new TLS handshake, and signed a new developer token for every batch. ISRC
+batches and text searches also ran strictly one after another.
+
+AppleMusicClient keeps one requests.Session with a connection pool sized
+for its worker threads. It runs independent requests concurrently under a
+shared TokenBucket, and reuses the developer token until it is close to
+expiring.
+"""
+
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from random import random
+
+import jwt
+import requests
+
+from rate_limit import TokenBucket, parse_retry_after
+
+APPLE_MUSIC_API_BASE = "https://api.music.apple.com/v1/"
+
+# The catalog songs endpoint accepts at most 25 ISRCs per filter
+APPLE_MUSIC_MAX_ISRCS_PER_REQUEST = 25
+
+# Apple allows developer tokens to live for up to six months
+DEFAULT_TOKEN_LIFETIME_SECONDS = 12 * 60 * 60
+DEFAULT_TOKEN_REFRESH_MARGIN_SECONDS = 5 * 60
+
+DEFAULT_APPLE_MUSIC_RATE_PER_SECOND = 10.0
+DEFAULT_APPLE_MUSIC_MAX_WORKERS = 8
+
+
+class DeveloperTokenProvider:
+    """Signs an ES256 developer token and reuses it until it nears expiry."""
+
+    def __init__(
+        self,
+        key_id: str,
+        team_id: str,
+        auth_key: str,
+        lifetime_seconds=DEFAULT_TOKEN_LIFETIME_SECONDS,
+        refresh_margin_seconds=DEFAULT_TOKEN_REFRESH_MARGIN_SECONDS,
+        clock=time.time,
+    ):
+        self.key_id = key_id
+        self.team_id = team_id
+        self.auth_key = auth_key
+        self.lifetime_seconds = lifetime_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.clock = clock
+        self.tokens_signed = 0
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def _sign(self, now: int) -> str:
+        headers = {"alg": "ES256", "kid": self.key_id}
+        payload = {"iss": self.team_id, "iat": now, "exp": now + self.lifetime_seconds}
+        return jwt.encode(payload, self.auth_key, algorithm="ES256", headers=headers)
+
+    def __call__(self) -> str:
+        with self._lock:
+            now = int(self.clock())
+            if self._token is None or now >= self._expires_at - self.refresh_margin_seconds:
+                self._token = self._sign(now)
+                self._expires_at = now + self.lifetime_seconds
+                self.tokens_signed += 1
+            return self._token
+
+
+class AppleMusicClient:
+    def __init__(
+        self,
+        token_provider,
+        base_url=APPLE_MUSIC_API_BASE,
+        storefront="us",
+        rate_per_second=DEFAULT_APPLE_MUSIC_RATE_PER_SECOND,
+        max_workers=DEFAULT_APPLE_MUSIC_MAX_WORKERS,
+        max_retries=5,
+        bucket: TokenBucket | None = None,
+        metrics=None,
+        stats: Counter | None = None,
+        timeout=30,
+    ):
+        self.token_provider = token_provider
+        self.base_url = base_url
+        self.storefront = storefront
+        self.bucket = bucket or TokenBucket(rate_per_second)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self.stats = stats if stats is not None else Counter()
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def catalog_url(self, endpoint: str) -> str:
+        return f"{self.base_url}catalog/{self.storefront}/{endpoint}"
+
+    def fetch(self, url, params, max_retries=None):
+        """GET with rate limiting and backoff. Returns the JSON body or None."""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        endpoint = "apple_music." + url.rstrip("/").rsplit("/", 1)[-1]
+        for attempt in range(max_retries):
+            self.bucket.acquire()
+            headers = {"Authorization": f"Bearer {self.token_provider()}"}
+            with self.metrics.api_call(endpoint) if self.metrics else nullcontext():
+                response = self.session.get(
+                    url, headers=headers, params=params, timeout=self.timeout
+                )
+
+            if response.status_code == 200:
+                return response.json()
+
+            if response.status_code == 429:
+                wait_time = parse_retry_after(
+                    response.headers.get("Retry-After"), default=(2**attempt) + random()
+                )
+                self.bucket.pause(wait_time)
+                self.stats["rate_limited"] += 1
+                print(f"\n[!] Error 429. Retrying in {wait_time:.2f}s...")
+            elif 500 <= response.status_code < 600:
+                wait_time = (2**attempt) + random()  # Exponential backoff + jitter
+                self.stats["server_errors"] += 1
+                print(f"\n[!] Error {response.status_code}. Retrying in {wait_time:.2f}s...")
+                time.sleep(wait_time)
+            else:
+                # For 400, 401, 403, etc., retrying usually won't help
+                print(f"\n[!] Permanent Error {response.status_code}: {response.text}")
+                break
+
+        return None
+
+    def fetch_many(self, requests_list, on_result=None, max_retries=None) -> list:
+        """Runs [(url, params), ...] concurrently, returning results in order.
+
+        on_result(index, result) is called on the calling thread as each
+        request finishes, e.g. to advance a progress bar or write the cache.
+        """
+        results = [None] * len(requests_list)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.fetch, url, params, max_retries): i
+                for i, (url, params) in enumerate(requests_list)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                if on_result is not None:
+                    on_result(i, results[i])
+        return results
+
+    def songs_by_isrc(
+        self,
+        isrcs,
+        batch_size=APPLE_MUSIC_MAX_ISRCS_PER_REQUEST,
+        on_batch=None,
+        max_retries=None,
+    ) -> dict:
+        """Returns {isrc: song} for every ISRC the catalog knows.
+
+        on_batch(batch, ok) is called after each batch of ISRCs finishes, ok
+        being False if the request failed. ISRCs missing from a failed batch
+        may still be in the catalog.
+        """
+        isrcs = list(isrcs)
+        batches = [isrcs[i : i + batch_size] for i in range(0, len(isrcs), batch_size)]
+        url = self.catalog_url("songs")
+        isrc_to_song = {}
+
+        def on_result(i, response_data):
+            self.stats["isrc_batches"] += 1
+            ok = response_data is not None
+            if not ok:
+                self.stats["failed_isrc_batches"] += 1
+            elif "data" in response_data:
+                # Map the returned data back to its ISRC
+                for item in response_data["data"]:
+                    isrc = item["attributes"].get("isrc")
+                    if isrc:
+                        isrc_to_song[isrc] = item
+            if on_batch is not None:
+                on_batch(batches[i], ok)
+
+        self.fetch_many(
+            [(url, {"filter[isrc]": ",".join(batch)}) for batch in batches],
+            on_result,
+            max_retries,
+        )
+        return isrc_to_song
+
+    def search_songs(self, terms, limit=5, on_result=None) -> dict:
+        """Returns {term: search response or None} for every term."""
+        terms = list(dict.fromkeys(terms))
+        url = self.catalog_url("search")
+
+        def forward(i, result):
+            if on_result is not None:
+                on_result(terms[i], result)
+
+        results = self.fetch_many(
+            [(url, {"term": term, "types": "songs", "limit": limit}) for term in terms],
+            forward,
+        )
+        return dict(zip(terms, results))
@@ -0,0 +1,116 @@
+"""Local stand-in for the Apple Music catalog API.
+
+Serves the catalog songs-by-ISRC and search endpoints from in-memory data,
+so AppleMusicClient can be tested and benchmarked without a developer key.
+
+    python apple_music_standin.py bench --isrcs 873 --latency-ms 150
+"""
+
+import argparse
+import time
+
+from apple_music_client import APPLE_MUSIC_MAX_ISRCS_PER_REQUEST, AppleMusicClient
+from standin_server import StandInServer
+
+
+def make_fake_song(index: int) -> dict:
+    return {
+        "id": str(1_000_000 + index),
+        "type": "songs",
+        "attributes": {
+            "isrc": f"USXX1{index:07d}",
+            "name": f"Song {index}",
+            "artistName": f"Artist {index % 97}",
+            "albumName": f"Album {index}",
+            "releaseDate": "2025-01-01",
+            "genreNames": ["Pop", "Music"],
+            "url": f"https://music.apple.com/us/album/{index}?i={1_000_000 + index}",
+        },
+    }
+
+
+class AppleMusicStandIn(StandInServer):
+    """searches maps a search term to the list of song IDs it returns."""
+
+    def __init__(self, songs=None, searches=None, latency_seconds=0.0):
+        super().__init__(latency_seconds)
+        self.songs = {s["id"]: s for s in (songs or [])}
+        self.songs_by_isrc = {s["attributes"]["isrc"]: s for s in self.songs.values()}
+        self.searches = dict(searches or {})
+
+    @property
+    def url(self) -> str:
+        """Base URL to pass to AppleMusicClient."""
+        return self.base_url + "v1/"
+
+    def route(self, handler, parts, params):
+        if not handler.headers.get("Authorization", "").startswith("Bearer "):
+            return self.send(handler, 401, self.error_body(401, "Unauthorized"))
+        if len(parts) != 4 or parts[:2] != ["v1", "catalog"]:
+            return self.not_found(handler)
+
+        endpoint = parts[3]
+        if endpoint == "songs":
+            self.count("songs")
+            isrcs = params.get("filter[isrc]", [""])[0].split(",")
+            if len(isrcs) > APPLE_MUSIC_MAX_ISRCS_PER_REQUEST:
+                return self.send(handler, 400, self.error_body(400, "Too many ISRCs"))
+            data = [self.songs_by_isrc[i] for i in isrcs if i in self.songs_by_isrc]
+            return self.send(handler, 200, {"data": data})
+
+        if endpoint == "search":
+            self.count("search")
+            term = params.get("term", [""])[0]
+            limit = int(params.get("limit", ["5"])[0])
+            ids = self.searches.get(term, [])[:limit]
+            if not ids:
+                return self.send(handler, 200, {"results": {}})
+            data = [self.songs[i] for i in ids if i in self.songs]
+            return self.send(handler, 200, {"results": {"songs": {"data": data}}})
+
+        return self.not_found(handler)
+
+
+def benchmark(num_isrcs: int, latency_ms: float, rate: float, max_workers: int):
+    songs = [make_fake_song(i) for i in range(num_isrcs)]
+    isrcs = [s["attributes"]["isrc"] for s in songs]
+
+    with AppleMusicStandIn(songs, latency_seconds=latency_ms / 1000.0) as standin:
+        rows = []
+        for name, workers in (("sequential", 1), ("concurrent", max_workers)):
+            standin.requests.clear()
+            client = AppleMusicClient(
+                lambda: "stand-in-token",
+                base_url=standin.url,
+                rate_per_second=rate,
+                max_workers=workers,
+            )
+            start = time.perf_counter()
+            found = client.songs_by_isrc(isrcs)
+            rows.append((name, standin.total_requests(), time.perf_counter() - start))
+            client.close()
+            assert len(found) == num_isrcs
+
+    print(f"{num_isrcs} ISRCs, {latency_ms} ms latency, rate {rate}/s")
+    for name, requests, seconds in rows:
+        print(f"  {name:>12}: {requests:5d} requests, {seconds:7.2f} s")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Apple Music API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("bench", help="Compare sequential and concurrent ISRC lookups")
+    bench.add_argument("--isrcs", type=int, default=873)
+    bench.add_argument("--latency-ms", type=float, default=150.0)
+    bench.add_argument("--rate", type=float, default=10.0)
+    bench.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        benchmark(args.isrcs, args.latency_ms, args.rate, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
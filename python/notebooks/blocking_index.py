@@ -0,0 +1,100 @@
+"""Blocking index for fuzzy comparisons that shouldn't look at every pair.
+
+Comparing every record with every other grows with the square of the
+record count. A blocking index maps cheap keys (an artist token, a title
+trigram, an artist ID) to the records that have them, and only records
+sharing a key are compared. With keys that any true match shares, this
+finds the same matches in near-linear time.
+
+    index = BlockingIndex()
+    for position, record in enumerate(records):
+        index.add(position, keys_for(record))
+    pairs = index.candidate_pairs(len(records))
+
+Keys so common that their block would be most of the data (e.g. the artist
+token "the" with the title trigram "the") are skipped when the block is
+larger than max_block_size. That bounds the pair count, at the price of
+matches that only share such keys, so compare the result against an
+exhaustive run on real data before relying on it.
+"""
+
+import re
+from collections import Counter, defaultdict
+
+import numpy
+from rapidfuzz import utils as fuzz_utils
+
+DEFAULT_MAX_BLOCK_SIZE = 500
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def artist_tokens(artist: str) -> set[str]:
+    """Casefolded word tokens of an artist name."""
+    return set(_WORD_PATTERN.findall(artist.casefold()))
+
+
+def common_tokens(token_sets, limit: int) -> set[str]:
+    """Tokens in more than limit of token_sets, like "the" or "band"."""
+    counts = Counter(token for tokens in token_sets for token in tokens)
+    return {token for token, n in counts.items() if n > limit}
+
+
+def trigrams(text: str) -> set[str]:
+    """Character trigrams of text after rapidfuzz's default_process.
+
+    Text shorter than three characters is its own single key.
+    """
+    processed = fuzz_utils.default_process(text)
+    if len(processed) < 3:
+        return {processed} if processed else set()
+    return {processed[i : i + 3] for i in range(len(processed) - 2)}
+
+
+class BlockingIndex:
+    def __init__(self, max_block_size: int = DEFAULT_MAX_BLOCK_SIZE):
+        self.max_block_size = max_block_size
+        self.blocks: dict[object, list[int]] = defaultdict(list)
+        self.stats = Counter()
+
+    def add(self, position: int, keys):
+        for key in keys:
+            self.blocks[key].append(position)
+
+    def candidates(self, keys) -> set[int]:
+        """Positions sharing at least one of keys, skipping oversized blocks."""
+        found = set()
+        for key in keys:
+            block = self.blocks.get(key)
+            if block is not None and len(block) <= self.max_block_size:
+                found.update(block)
+        return found
+
+    def candidate_pairs(self, count: int) -> numpy.ndarray:
+        """Sorted, distinct (i, j) pairs with i < j sharing a block.
+
+        count is the number of positions added, used to encode pairs.
+        """
+        by_size = defaultdict(list)
+        for block in self.blocks.values():
+            if len(block) < 2:
+                continue
+            if len(block) > self.max_block_size:
+                self.stats["oversized_blocks"] += 1
+                continue
+            by_size[len(block)].append(block)
+
+        # Blocks of one size stack into a matrix, so each size is one numpy step
+        encoded = []
+        for size, blocks in by_size.items():
+            positions = numpy.sort(numpy.asarray(blocks, dtype=numpy.int64), axis=1)
+            rows, cols = numpy.triu_indices(size, k=1)
+            encoded.append((positions[:, rows] * count + positions[:, cols]).ravel())
+        if not encoded:
+            return numpy.zeros((0, 2), dtype=numpy.int64)
+        # numpy.unique sorts, so pairs come out in (i, j) order
+        unique = numpy.unique(numpy.concatenate(encoded))
+        # A position added twice under one key pairs with itself
+        unique = unique[unique // count != unique % count]
+        self.stats["candidate_pairs"] = len(unique)
+        return numpy.column_stack([unique // count, unique % count])
@@ -0,0 +1,204 @@
+"""Versioned cache keys with selective invalidation.
+
+Cache keys used to be built ad hoc per API (the raw query, "search_v3:...",
+"artist ::: name ::: review_col ::: model"), so nothing recorded what a
+cached value depended on. A prompt change either went unnoticed or needed a
+full cache wipe.
+
+A KeyBuilder makes keys of the form
+
+    <builder>@v<version>:<fingerprint>:<input digest>
+
+- version is bumped by hand when the meaning of the inputs changes
+- fingerprint hashes the config the result depends on but that isn't a
+  per-lookup input, e.g. the prompt template or request parameters
+- the input digest hashes the normalized lookup inputs
+
+A lookup after a prompt change misses on its own, and only for the builders
+whose fingerprint changed. Builders are registered in the cache store with
+their current version and fingerprint, so the CLI can find and delete
+exactly the stale entries:
+
+    python cache_keys.py list
+    python cache_keys.py invalidate anthropic_extract_quote anthropic_extract_quote --stale
+    python cache_keys.py invalidate apple_music apple_music_search --input "artist:song"
+"""
+
+import argparse
+import hashlib
+import json
+import time
+import unicodedata
+from dataclasses import dataclass
+
+from api_cache import API_CACHE_FILENAME, CacheNamespace, CacheStore
+
+KEY_BUILDERS_NAMESPACE = "cache_key_builders"
+
+# Fingerprint for builders whose results depend only on their inputs
+NO_FINGERPRINT = "-"
+
+
+def normalize_input(value):
+    """Unicode-normalized, whitespace-trimmed strings; other values as JSON."""
+    if isinstance(value, str):
+        return unicodedata.normalize("NFC", value).strip()
+    return value
+
+
+def input_digest(inputs) -> str:
+    normalized = [normalize_input(v) for v in inputs]
+    data = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:24]
+
+
+def fingerprint(*parts) -> str:
+    """Short hash of prompts, request parameters, schemas etc."""
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=repr)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:12]
+
+
+@dataclass(frozen=True)
+class KeyBuilder:
+    name: str
+    version: int
+    fingerprint: str = NO_FINGERPRINT
+
+    def __post_init__(self):
+        assert "@" not in self.name and ":" not in self.name
+
+    @property
+    def prefix(self) -> str:
+        return f"{self.name}@v{self.version}:{self.fingerprint}:"
+
+    def key(self, *inputs) -> str:
+        return self.prefix + input_digest(inputs)
+
+    def owns(self, key: str) -> bool:
+        return key.startswith(self.name + "@")
+
+    def is_current(self, key: str) -> bool:
+        return key.startswith(self.prefix)
+
+
+def register_builder(store: CacheStore, namespace: str, builder: KeyBuilder):
+    """Records the builder's current version and fingerprint for the CLI."""
+    registry = store.namespace(KEY_BUILDERS_NAMESPACE)
+    registry[f"{namespace}/{builder.name}"] = {
+        "namespace": namespace,
+        "name": builder.name,
+        "version": builder.version,
+        "fingerprint": builder.fingerprint,
+        "registered_at": time.time(),
+    }
+    registry.flush()
+
+
+def registered_builders(store: CacheStore) -> list[tuple[str, KeyBuilder]]:
+    registry = store.namespace(KEY_BUILDERS_NAMESPACE)
+    return [
+        (entry["namespace"], KeyBuilder(entry["name"], entry["version"], entry["fingerprint"]))
+        for entry in registry.values()
+    ]
+
+
+def migrate_legacy_keys(namespace: CacheNamespace, builder: KeyBuilder, legacy_inputs) -> int:
+    """Rewrites entries with pre-builder keys to builder keys, in place.
+
+    legacy_inputs(key, value) returns the builder inputs for a legacy entry,
+    or None to leave it alone. Keys already owned by any builder are skipped.
+    """
+    moves = []
+    for key in namespace.keys_on_disk():
+        if "@v" in key.split(":", 1)[0]:
+            continue
+        value = namespace[key]
+        inputs = legacy_inputs(key, value)
+        if inputs is not None:
+            moves.append((key, builder.key(*inputs), value))
+
+    with namespace.batch():
+        for old_key, new_key, value in moves:
+            if new_key not in namespace:
+                namespace[new_key] = value
+            del namespace[old_key]
+    if moves:
+        print(f"Migrated {len(moves)} {namespace.name} keys to {builder.name}@v{builder.version}")
+    return len(moves)
+
+
+def stale_keys(namespace: CacheNamespace, builder: KeyBuilder) -> list[str]:
+    """Keys made by an older version or fingerprint of builder."""
+    return [
+        key
+        for key in namespace.keys_on_disk()
+        if builder.owns(key) and not builder.is_current(key)
+    ]
+
+
+def builder_keys(namespace: CacheNamespace, builder: KeyBuilder) -> list[str]:
+    return [key for key in namespace.keys_on_disk() if builder.owns(key)]
+
+
+def invalidate(namespace: CacheNamespace, keys, dry_run=False) -> int:
+    keys = [key for key in keys if key in namespace]
+    if not dry_run:
+        with namespace.batch():
+            for key in keys:
+                del namespace[key]
+    return len(keys)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and invalidate versioned cache keys")
+    parser.add_argument("--db", default=API_CACHE_FILENAME)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="Registered builders with current and stale counts")
+
+    inv = subparsers.add_parser("invalidate", help="Delete entries made by a builder")
+    inv.add_argument("namespace")
+    inv.add_argument("builder")
+    which = inv.add_mutually_exclusive_group(required=True)
+    which.add_argument("--stale", action="store_true", help="Older versions or fingerprints")
+    which.add_argument("--all", action="store_true", help="Every entry from the builder")
+    which.add_argument("--input", nargs="+", help="The entry for these exact inputs")
+    inv.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args(argv)
+    store = CacheStore(args.db)
+    try:
+        builders = registered_builders(store)
+        if args.command == "list":
+            for namespace, builder in builders:
+                keys = builder_keys(store.namespace(namespace), builder)
+                current = sum(1 for k in keys if builder.is_current(k))
+                print(
+                    f"{namespace}/{builder.name} v{builder.version} {builder.fingerprint}: "
+                    f"{current} current, {len(keys) - current} stale"
+                )
+            return 0
+
+        matches = [b for ns, b in builders if ns == args.namespace and b.name == args.builder]
+        if not matches:
+            print(f"No builder {args.builder} registered for {args.namespace}")
+            return 1
+        builder = matches[0]
+        namespace = store.namespace(args.namespace)
+        if args.stale:
+            keys = stale_keys(namespace, builder)
+        elif args.all:
+            keys = builder_keys(namespace, builder)
+        else:
+            keys = [builder.key(*args.input)]
+
+        count = invalidate(namespace, keys, dry_run=args.dry_run)
+        verb = "Would remove" if args.dry_run else "Removed"
+        print(f"{verb} {count} entries from {args.namespace}")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,263 @@
+"""Cache-miss planning and dry-run cost estimates for the API lookups.
+
+Before a phase of lookups touches the network, CachePlanner.plan() works out
+which of its keys would miss the cache. Keys are deduplicated across
+listings, so a song cited by 16 sources counts once. From the misses it
+estimates the request count (after batching), the wall time under the
+client's rate limit and concurrency, and for LLM calls the token count and
+cost.
+
+    plan = cache_planner.plan(
+        "spotify.search", queries, lambda q: q in spotify_cache,
+        is_negative=lambda q: q in spotify_not_found,
+    )
+    cache_planner.check(plan)
+
+check() stops the run before any request is sent when:
+
+- it is a dry run (PIPELINE_DRY_RUN=1) and the phase would miss, or
+- the phase would miss more than max_misses keys
+  (PIPELINE_MAX_PLANNED_MISSES), e.g. after an accidental cache key change
+
+A phase's lookups often depend on the results of the one before, e.g. Apple
+Music ISRCs come from Spotify. So each phase is planned just before it
+runs, and a dry run stops at the first phase that would hit the network.
+"""
+
+import math
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+
+from anthropic_batch import DEFAULT_BATCH_SIZE as ANTHROPIC_BATCH_SIZE
+from apple_music_client import (
+    APPLE_MUSIC_MAX_ISRCS_PER_REQUEST,
+    DEFAULT_APPLE_MUSIC_MAX_WORKERS,
+    DEFAULT_APPLE_MUSIC_RATE_PER_SECOND,
+)
+from request_scheduler import DEFAULT_YOUTUBE_INITIAL_RATE, DEFAULT_YOUTUBE_MAX_WORKERS
+from spotify_async import DEFAULT_SPOTIFY_MAX_IN_FLIGHT, DEFAULT_SPOTIFY_RATE_PER_SECOND
+from spotify_batch import SPOTIFY_MAX_IDS_PER_REQUEST
+
+DRY_RUN_ENV = "PIPELINE_DRY_RUN"
+MAX_PLANNED_MISSES_ENV = "PIPELINE_MAX_PLANNED_MISSES"
+
+# USD per million input and output tokens, matched by model name prefix
+ANTHROPIC_PRICES_PER_MTOK = {
+    "claude-haiku-4-5": (1.0, 5.0),
+    "claude-sonnet-4-5": (3.0, 15.0),
+    "claude-opus-4-5": (5.0, 25.0),
+}
+
+
+@dataclass(frozen=True)
+class ServiceLimits:
+    """How a client sends requests. latency_seconds is a typical round trip."""
+
+    rate_per_second: float
+    max_in_flight: int
+    latency_seconds: float
+    batch_size: int = 1
+
+
+SPOTIFY_SEARCH_LIMITS = ServiceLimits(
+    DEFAULT_SPOTIFY_RATE_PER_SECOND, DEFAULT_SPOTIFY_MAX_IN_FLIGHT, 0.3
+)
+# sp.tracks/sp.artists are called one batch at a time
+SPOTIFY_BATCH_LIMITS = ServiceLimits(
+    DEFAULT_SPOTIFY_RATE_PER_SECOND, 1, 0.3, SPOTIFY_MAX_IDS_PER_REQUEST
+)
+APPLE_MUSIC_ISRC_LIMITS = ServiceLimits(
+    DEFAULT_APPLE_MUSIC_RATE_PER_SECOND,
+    DEFAULT_APPLE_MUSIC_MAX_WORKERS,
+    0.3,
+    APPLE_MUSIC_MAX_ISRCS_PER_REQUEST,
+)
+APPLE_MUSIC_SEARCH_LIMITS = ServiceLimits(
+    DEFAULT_APPLE_MUSIC_RATE_PER_SECOND, DEFAULT_APPLE_MUSIC_MAX_WORKERS, 0.3
+)
+YOUTUBE_LIMITS = ServiceLimits(DEFAULT_YOUTUBE_INITIAL_RATE, DEFAULT_YOUTUBE_MAX_WORKERS, 1.0)
+ANTHROPIC_LIMITS = ServiceLimits(50.0, 3, 4.0)
+# Message Batches are submitted together and most end within the hour
+ANTHROPIC_BATCH_LIMITS = ServiceLimits(1.0, 100, 3600.0, ANTHROPIC_BATCH_SIZE)
+# Batched tokens cost half the live price
+ANTHROPIC_BATCH_PRICE_FACTOR = 0.5
+
+
+class PlannedMissesExceeded(Exception):
+    pass
+
+
+class DryRunStop(Exception):
+    pass
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token for English."""
+    return math.ceil(len(text) / 4)
+
+
+def model_price(model: str) -> tuple[float, float] | None:
+    for prefix, price in ANTHROPIC_PRICES_PER_MTOK.items():
+        if model.startswith(prefix):
+            return price
+    return None
+
+
+def estimate_wall_seconds(requests: int, limits: ServiceLimits) -> float:
+    """Whichever is slower: the rate limit or latency at full concurrency."""
+    if requests == 0:
+        return 0.0
+    rate_bound = requests / limits.rate_per_second
+    latency_bound = math.ceil(requests / limits.max_in_flight) * limits.latency_seconds
+    return max(rate_bound, latency_bound)
+
+
+@dataclass
+class LookupPlan:
+    service: str
+    listings: int
+    unique: int
+    hits: int
+    negative_hits: int
+    misses: list = field(repr=False)
+    requests: int
+    wall_seconds: float
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float | None = None
+
+    @property
+    def miss_count(self) -> int:
+        return len(self.misses)
+
+    def summary(self) -> str:
+        line = (
+            f"{self.service}: {self.listings} lookups, {self.unique} unique, "
+            f"{self.hits} cached, {self.negative_hits} known missing, "
+            f"{self.miss_count} to fetch in {self.requests} requests, "
+            f"~{self.wall_seconds:.0f} s"
+        )
+        if self.input_tokens:
+            line += f", ~{self.input_tokens + self.output_tokens} tokens"
+        if self.cost_usd is not None:
+            line += f", ~${self.cost_usd:.2f}"
+        return line
+
+
+class CachePlanner:
+    def __init__(self, metrics=None, dry_run: bool | None = None, max_misses: int | None = None):
+        if dry_run is None:
+            dry_run = os.getenv(DRY_RUN_ENV, "") not in ("", "0", "false")
+        if max_misses is None and os.getenv(MAX_PLANNED_MISSES_ENV):
+            max_misses = int(os.getenv(MAX_PLANNED_MISSES_ENV))
+        self.metrics = metrics
+        self.dry_run = dry_run
+        self.max_misses = max_misses
+        self.plans: dict[str, LookupPlan] = {}
+
+    def plan(
+        self,
+        service: str,
+        keys,
+        is_cached,
+        is_negative=None,
+        limits: ServiceLimits = SPOTIFY_SEARCH_LIMITS,
+        tokens=None,
+        model: str | None = None,
+        price_factor: float = 1.0,
+    ) -> LookupPlan:
+        """Plans the lookups for keys, one per listing.
+
+        is_cached(key) and is_negative(key) check the positive and negative
+        caches without any network access. For LLM calls, tokens(key) returns
+        the estimated (input, output) tokens of one request and model picks
+        the price, scaled by price_factor (e.g. for batches).
+        """
+        listing_counts = Counter(keys)
+        hits = negative_hits = 0
+        misses = []
+        for key in listing_counts:
+            if is_cached(key):
+                hits += 1
+            elif is_negative is not None and is_negative(key):
+                negative_hits += 1
+            else:
+                misses.append(key)
+
+        requests = math.ceil(len(misses) / limits.batch_size)
+        plan = LookupPlan(
+            service=service,
+            listings=sum(listing_counts.values()),
+            unique=len(listing_counts),
+            hits=hits,
+            negative_hits=negative_hits,
+            misses=misses,
+            requests=requests,
+            wall_seconds=estimate_wall_seconds(requests, limits),
+        )
+        if tokens is not None:
+            for key in misses:
+                input_tokens, output_tokens = tokens(key)
+                plan.input_tokens += input_tokens
+                plan.output_tokens += output_tokens
+            price = model_price(model) if model else None
+            if price is not None:
+                plan.cost_usd = (
+                    (plan.input_tokens * price[0] + plan.output_tokens * price[1])
+                    * price_factor
+                    / 1_000_000
+                )
+
+        self.plans[service] = plan
+        if self.metrics is not None:
+            counter = self.metrics.counter("cache_plan")
+            counter[f"{service}.unique"] = plan.unique
+            counter[f"{service}.planned_misses"] = plan.miss_count
+            counter[f"{service}.planned_requests"] = plan.requests
+        print(plan.summary())
+        return plan
+
+    def check(self, plan: LookupPlan):
+        """Stops the run before plan's requests go out, if it shouldn't proceed."""
+        if self.max_misses is not None and plan.miss_count > self.max_misses:
+            raise PlannedMissesExceeded(
+                f"{plan.service} would fetch {plan.miss_count} keys, more than "
+                f"{MAX_PLANNED_MISSES_ENV}={self.max_misses}. A changed cache key? "
+                f"First few: {plan.misses[:5]}"
+            )
+        if self.dry_run and plan.miss_count:
+            self.report()
+            raise DryRunStop(f"Dry run: stopping before {plan.requests} {plan.service} requests")
+
+    def total_cost_usd(self) -> float:
+        return sum(p.cost_usd or 0.0 for p in self.plans.values())
+
+    def report(self):
+        print("Cache plan:")
+        for plan in self.plans.values():
+            print("  " + plan.summary())
+        wall = sum(p.wall_seconds for p in self.plans.values())
+        print(f"  total: ~{wall:.0f} s, ~${self.total_cost_usd():.2f}")
+
+    def to_frame(self):
+        import pandas
+
+        return pandas.DataFrame(
+            [
+                {
+                    "service": p.service,
+                    "listings": p.listings,
+                    "unique": p.unique,
+                    "hits": p.hits,
+                    "negative_hits": p.negative_hits,
+                    "misses": p.miss_count,
+                    "requests": p.requests,
+                    "wall_seconds": p.wall_seconds,
+                    "input_tokens": p.input_tokens,
+                    "output_tokens": p.output_tokens,
+                    "cost_usd": p.cost_usd,
+                }
+                for p in self.plans.values()
+            ]
+        )
@@ -0,0 +1,339 @@
+"""Local catalog of the tracks the API caches already hold.
+
+The Spotify, Apple Music and YouTube Music caches hold thousands of track
+records, but only under the exact query that fetched them. A change to
+clean_string or create_clean_spotify_query turned every listing into a new
+query, and so into a fresh Spotify search, even for songs already cached.
+
+CatalogIndex gathers the cached records into one table (source, ID, ISRC,
+Spotify ID, YouTube ID, artist, name, release year) with an inverted index
+from title trigrams to records, and answers a listing's search locally
+when it can:
+
+1. A listing resolved before is remembered under its raw artist and name,
+   casefolded and stripped, which no cleaning rule changes.
+2. Otherwise a Spotify record whose cleaned artist and title (see
+   text_normalize.clean_query_text) equal the listing's is the answer.
+3. Otherwise records sharing title trigrams with the listing are scored
+   like match_audit scores a Spotify match, and one clear match is the
+   answer. Apple Music records reach Spotify through their ISRC.
+
+Listings none of these answer are the true unknowns left for the API.
+
+    catalog = CatalogIndex.from_caches(spotify_cache, apple_music_cache, youtube_music_cache)
+    spotify_id = catalog.lookup_spotify_id(artist, name)
+
+match() also says which of the three answered. Only listing and exact
+answers (SEARCH_RESULT_MATCHES) are as good as a search's; a fuzzy match
+is a guess, to use for the run but not to cache as the search's answer or
+remember() as what a search found.
+
+As with the year-filtered Spotify search, only tracks released in
+YEAR_FILTER_YEARS match unless include_year_filter is False.
+"""
+
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass
+
+import pandas
+from rapidfuzz import fuzz
+from rapidfuzz.utils import default_process
+
+import match_audit
+import text_normalize
+from blocking_index import BlockingIndex, trigrams
+from spotify_cache import item_isrc
+
+SPOTIFY_LISTING_IDS_NAMESPACE = "spotify_listing_ids"
+# Search queries answered from the catalog -> {"spotify_id", "match"}
+SPOTIFY_CATALOG_ANSWERS_NAMESPACE = "spotify_catalog_answers"
+
+LISTING_MATCH = "listing"
+EXACT_MATCH = "exact"
+FUZZY_MATCH = "fuzzy"
+SEARCH_RESULT_MATCHES = (LISTING_MATCH, EXACT_MATCH)
+
+YEAR_FILTER_YEARS = (2024, 2025)
+
+# Fuzzy matches need the artist's token_set_ratio and the title's ratio at
+# or above these, besides passing match_audit's full-text thresholds
+ARTIST_THRESHOLD = 90
+NAME_THRESHOLD = 90
+# Share of the listing's title trigrams a record must have to be scored
+MIN_TRIGRAM_OVERLAP = 0.5
+MAX_BLOCK_SIZE = 2000
+
+
+@dataclass(frozen=True)
+class CatalogRecord:
+    source: str
+    id: str
+    artist: str
+    name: str
+    isrc: str | None = None
+    spotify_id: str | None = None
+    youtube_id: str | None = None
+    year: int | None = None
+    popularity: int = 0
+
+
+def _year(date) -> int | None:
+    if not date or not str(date)[:4].isdigit():
+        return None
+    return int(str(date)[:4])
+
+
+def default_canonical_artist(item: dict) -> str:
+    return ", ".join(artist["name"] for artist in item["artists"])
+
+
+def spotify_record(item: dict, canonical_artist=default_canonical_artist) -> CatalogRecord:
+    return CatalogRecord(
+        source="spotify",
+        id=item["id"],
+        artist=canonical_artist(item),
+        name=item["name"],
+        isrc=item_isrc(item),
+        spotify_id=item["id"],
+        year=_year((item.get("album") or {}).get("release_date")),
+        popularity=item.get("popularity") or 0,
+    )
+
+
+def apple_music_records(value) -> list[CatalogRecord]:
+    """Records in an Apple Music cache value: an ISRC lookup's song or a search."""
+    if not isinstance(value, dict):
+        return []
+    if "attributes" in value:
+        songs = [value]
+    else:
+        songs = ((value.get("results") or {}).get("songs") or {}).get("data") or []
+    records = []
+    for song in songs:
+        attributes = song.get("attributes") or {}
+        if "artistName" not in attributes or "name" not in attributes:
+            continue
+        records.append(
+            CatalogRecord(
+                source="apple_music",
+                id=song["id"],
+                artist=attributes["artistName"],
+                name=attributes["name"],
+                isrc=attributes.get("isrc"),
+                year=_year(attributes.get("releaseDate")),
+            )
+        )
+    return records
+
+
+def youtube_music_records(value) -> list[CatalogRecord]:
+    """Records in a YouTube Music search cache value, a list of results."""
+    if not isinstance(value, list):
+        return []
+    records = []
+    for result in value:
+        if not isinstance(result, dict) or not result.get("videoId") or not result.get("title"):
+            continue
+        records.append(
+            CatalogRecord(
+                source="youtube_music",
+                id=result["videoId"],
+                artist=", ".join(a["name"] for a in result.get("artists") or []),
+                name=result["title"],
+                youtube_id=result["videoId"],
+                year=_year(result.get("year")),
+            )
+        )
+    return records
+
+
+def listing_key(artist, name, include_year_filter=True) -> str:
+    """A listing's raw artist and name, casefolded and stripped."""
+    prefix = "year:" if include_year_filter else ""
+    return f"{prefix}{str(artist).casefold().strip()} -- {str(name).casefold().strip()}"
+
+
+def _same_version(title: str, record: CatalogRecord) -> bool:
+    """Whether a casefolded title and record agree on every danger word.
+
+    "Song" and "Song (Remix)" clean to the same query text.
+    """
+    record_title = record.name.casefold()
+    return all((word in title) == (word in record_title) for word in match_audit.MATCH_AUDIT_DANGER_WORDS)
+
+
+class CatalogIndex:
+    def __init__(self, listing_ids=None, canonical_artist=default_canonical_artist):
+        self.canonical_artist = canonical_artist
+        self.records: list[CatalogRecord] = []
+        self.seen = set()
+        # (cleaned artist, cleaned name) -> record positions
+        self.by_key = defaultdict(list)
+        self.spotify_by_id = {}
+        self.spotify_by_isrc = defaultdict(list)
+        self.name_index = BlockingIndex(MAX_BLOCK_SIZE)
+        # listing_key -> Spotify ID, e.g. a store namespace so it persists
+        self.listing_ids = listing_ids if listing_ids is not None else {}
+        self.stats = Counter()
+
+    @classmethod
+    def from_caches(
+        cls,
+        spotify_cache,
+        apple_music_cache=None,
+        youtube_music_cache=None,
+        listing_ids=None,
+        canonical_artist=default_canonical_artist,
+    ):
+        """A catalog of every track in the caches; any of them may be None."""
+        catalog = cls(listing_ids, canonical_artist)
+        if spotify_cache is not None:
+            for item in spotify_cache.items_by_id.values():
+                catalog.add_spotify_item(item)
+        if apple_music_cache is not None:
+            for value in apple_music_cache.values():
+                for record in apple_music_records(value):
+                    catalog.add(record)
+        if youtube_music_cache is not None:
+            for value in youtube_music_cache.values():
+                for record in youtube_music_records(value):
+                    catalog.add(record)
+        return catalog
+
+    def __len__(self):
+        return len(self.records)
+
+    def add_spotify_item(self, item: dict):
+        self.add(spotify_record(item, self.canonical_artist))
+
+    def add(self, record: CatalogRecord):
+        """Adds record, unless a record with its source and ID is already in."""
+        if (record.source, record.id) in self.seen:
+            return
+        self.seen.add((record.source, record.id))
+        position = len(self.records)
+        self.records.append(record)
+        artist_key = text_normalize.clean_query_text(record.artist)
+        name_key = text_normalize.clean_query_text(record.name)
+        self.by_key[(artist_key, name_key)].append(position)
+        self.name_index.add(position, trigrams(name_key))
+        if record.source == "spotify":
+            self.spotify_by_id[record.spotify_id] = record
+            if record.isrc:
+                self.spotify_by_isrc[record.isrc].append(record)
+
+    def to_frame(self) -> pandas.DataFrame:
+        return pandas.DataFrame([asdict(record) for record in self.records])
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def _spotify_records(self, record: CatalogRecord) -> list[CatalogRecord]:
+        """Spotify records for record, through its ISRC if it isn't one."""
+        if record.source == "spotify":
+            return [record]
+        return self.spotify_by_isrc.get(record.isrc, []) if record.isrc else []
+
+    @staticmethod
+    def _in_year_filter(record: CatalogRecord, include_year_filter: bool) -> bool:
+        return not include_year_filter or record.year in YEAR_FILTER_YEARS
+
+    def _best(self, scored: list[tuple[float, CatalogRecord]]) -> CatalogRecord | None:
+        """The top scored record, None if a different song ties with it.
+
+        Records sharing an ISRC are one song, released as a single and on
+        an album, and the most popular release wins as in Spotify search.
+        """
+        if not scored:
+            return None
+        top = max(score for score, _ in scored)
+        best = [record for score, record in scored if score == top]
+        if len({record.isrc or record.spotify_id for record in best}) > 1:
+            self.stats["ambiguous"] += 1
+            return None
+        return max(best, key=lambda record: (record.popularity, record.spotify_id))
+
+    def lookup(self, artist, name, include_year_filter=True) -> CatalogRecord | None:
+        """The Spotify record a search for the listing would find, if known."""
+        return self.match(artist, name, include_year_filter)[0]
+
+    def match(self, artist, name, include_year_filter=True) -> tuple[CatalogRecord | None, str | None]:
+        """lookup's record with LISTING_MATCH, EXACT_MATCH or FUZZY_MATCH, or (None, None)."""
+        spotify_id = self.listing_ids.get(listing_key(artist, name, include_year_filter))
+        if spotify_id is not None and spotify_id in self.spotify_by_id:
+            self.stats["listing_hits"] += 1
+            return self.spotify_by_id[spotify_id], LISTING_MATCH
+
+        artist_key = text_normalize.clean_query_text(str(artist))
+        name_key = text_normalize.clean_query_text(str(name))
+        title = str(name).casefold()
+        exact = [
+            (0, spotify)
+            for position in self.by_key.get((artist_key, name_key), [])
+            if _same_version(title, self.records[position])
+            for spotify in self._spotify_records(self.records[position])
+            if self._in_year_filter(spotify, include_year_filter)
+        ]
+        if exact:
+            found = self._best(exact)
+            if found is None:
+                return None, None
+            self.stats["exact_hits"] += 1
+            return found, EXACT_MATCH
+
+        found = self._best(self._fuzzy_matches(artist, name, artist_key, name_key, include_year_filter))
+        if found is None:
+            self.stats["misses"] += 1
+            return None, None
+        self.stats["fuzzy_hits"] += 1
+        return found, FUZZY_MATCH
+
+    def _fuzzy_matches(self, artist, name, artist_key, name_key, include_year_filter):
+        name_trigrams = trigrams(name_key)
+        if not name_trigrams:
+            return []
+        overlap = Counter()
+        for trigram in name_trigrams:
+            block = self.name_index.blocks.get(trigram)
+            if block is not None and len(block) <= MAX_BLOCK_SIZE:
+                overlap.update(block)
+
+        title = str(name).casefold()
+        full, processed_name = match_audit.preprocess([f"{artist} {name}", str(name)])
+        scored = []
+        for position, shared in overlap.items():
+            if shared < MIN_TRIGRAM_OVERLAP * len(name_trigrams):
+                continue
+            record = self.records[position]
+            artist_score = fuzz.token_set_ratio(
+                artist_key, text_normalize.clean_query_text(record.artist), processor=default_process
+            )
+            # Cleaning drops bracketed parts, so "Song (Remix)" is also
+            # compared with "Song - Remix" as written
+            name_score = max(
+                fuzz.ratio(name_key, text_normalize.clean_query_text(record.name)),
+                fuzz.ratio(processed_name, match_audit.preprocess([record.name])[0]),
+            )
+            if artist_score < ARTIST_THRESHOLD or name_score < NAME_THRESHOLD:
+                continue
+            if not _same_version(title, record):
+                continue
+            record_full = match_audit.preprocess([f"{record.artist} {record.name}"])[0]
+            if (
+                fuzz.token_set_ratio(full, record_full) < match_audit.TOKEN_SET_THRESHOLD
+                or fuzz.token_sort_ratio(full, record_full) < match_audit.TOKEN_SORT_THRESHOLD
+            ):
+                continue
+            for spotify in self._spotify_records(record):
+                if self._in_year_filter(spotify, include_year_filter):
+                    scored.append((artist_score + name_score, spotify))
+        return scored
+
+    def lookup_spotify_id(self, artist, name, include_year_filter=True) -> str | None:
+        record = self.lookup(artist, name, include_year_filter)
+        return record.spotify_id if record is not None else None
+
+    def remember(self, artist, name, spotify_id: str, include_year_filter=True):
+        """Records which Spotify track a listing's search found."""
+        self.listing_ids[listing_key(artist, name, include_year_filter)] = spotify_id
@@ -0,0 +1,223 @@
+"""Union-find resolution of song identity across identifier kinds.
+
+A song listing can carry an ISRC, a Spotify ID, a YouTube ID, another URL
+and, once canonicalized, a canonical artist and name. Two listings are the
+same song if they share any of these, directly or through other listings.
+EntityResolver keeps one disjoint set per song: each listing is unioned
+with its identifiers, so adding a listing or an override's identifiers is a
+few near-constant-time unions instead of regrouping everything.
+
+    resolver = EntityResolver()
+    listing = resolver.add(song_identifiers(song))
+    song.id = resolver.entity_id(listing)
+
+Identifiers found later are linked to the listing they belong to, merging
+sets as needed. The notebook adds each listing with just its ISRC, so that
+groups() are the ISRC groups its Spotify, YouTube, other URL and artist0
+passes pick one value for. Once those passes have run, it links every
+listing's identifiers and sets the IDs.
+
+Each set's ID is its most trusted identifier, in the order select_id used:
+ISRC, then "SPOTIFY:", "YT:", "OTHER:" and "NAME:". A set with more than
+one ISRC, Spotify ID or canonical name was linked through some other
+identifier, usually a wrong manual override or a video shared by two songs,
+and is reported by conflicts().
+
+Union-find can't split sets, so removing or changing an identifier means
+building a new resolver.
+"""
+
+from dataclasses import dataclass, field
+
+# Identifier kinds from most to least trusted, with their ID prefix
+ID_PREFIXES = {
+    "isrc": "",
+    "spotify": "SPOTIFY:",
+    "youtube": "YT:",
+    "other": "OTHER:",
+    "name": "NAME:",
+}
+ID_PRIORITY = {kind: i for i, kind in enumerate(ID_PREFIXES)}
+
+# One song has one of each of these; more in a set is a conflict
+UNIQUE_KINDS = ("isrc", "spotify", "name")
+
+
+@dataclass(frozen=True)
+class Identifier:
+    kind: str
+    # Matched on key, shown as value
+    key: str
+    value: str
+
+    @property
+    def entity_id(self) -> str:
+        return ID_PREFIXES[self.kind] + self.value
+
+
+def identifier(kind: str, value: str) -> Identifier:
+    return Identifier(kind, value.strip(), value)
+
+
+def name_identifier(canonical_artist: str, canonical_name: str) -> Identifier:
+    """Canonical names match casefolded and stripped."""
+    return Identifier(
+        "name",
+        f"{canonical_artist.casefold().strip()} -- {canonical_name.casefold().strip()}",
+        f"{canonical_artist} -- {canonical_name}",
+    )
+
+
+def song_identifiers(song) -> list[Identifier]:
+    """The identifiers a Song has set, most trusted first."""
+    identifiers = []
+    for kind, attribute in [
+        ("isrc", "isrc"),
+        ("spotify", "spotify_id"),
+        ("youtube", "youtube_id"),
+        ("other", "other_url"),
+    ]:
+        value = getattr(song, attribute)
+        if value is not None and value:
+            identifiers.append(identifier(kind, value))
+    if song.canonical_artist and song.canonical_name:
+        identifiers.append(name_identifier(song.canonical_artist, song.canonical_name))
+    return identifiers
+
+
+class UnionFind:
+    """Disjoint sets over hashable nodes, by size with path halving."""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def __contains__(self, node):
+        return node in self.parent
+
+    def add(self, node):
+        if node not in self.parent:
+            self.parent[node] = node
+            self.size[node] = 1
+
+    def find(self, node):
+        parent = self.parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, a, b):
+        """Merges the sets of a and b. Returns (root, absorbed root or None)."""
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a, None
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a, b
+
+
+@dataclass
+class _Entity:
+    listings: int = 0
+    best: Identifier | None = None
+    # kind -> {key: Identifier}, for the unique kinds only
+    unique: dict = field(default_factory=dict)
+
+    def note(self, ident: Identifier):
+        if self.best is None or ID_PRIORITY[ident.kind] < ID_PRIORITY[self.best.kind]:
+            self.best = ident
+        if ident.kind in UNIQUE_KINDS:
+            self.unique.setdefault(ident.kind, {}).setdefault(ident.key, ident)
+
+    def absorb(self, other: "_Entity"):
+        self.listings += other.listings
+        if other.best is not None:
+            self.note(other.best)
+        for kind, idents in other.unique.items():
+            for key, ident in idents.items():
+                self.unique.setdefault(kind, {}).setdefault(key, ident)
+
+
+class EntityResolver:
+    def __init__(self):
+        self.sets = UnionFind()
+        self.entities: dict = {}
+        self.listing_count = 0
+
+    def _node(self, node, ident: Identifier | None = None):
+        if node not in self.sets:
+            self.sets.add(node)
+            self.entities[node] = _Entity()
+            if ident is not None:
+                self.entities[node].note(ident)
+
+    def _union(self, a, b):
+        root, absorbed = self.sets.union(a, b)
+        if absorbed is not None:
+            self.entities[root].absorb(self.entities.pop(absorbed))
+        return root
+
+    def add(self, identifiers) -> int:
+        """Adds a listing with identifiers. Returns the listing's handle."""
+        listing = ("listing", self.listing_count)
+        self.listing_count += 1
+        self._node(listing)
+        self.entities[listing].listings = 1
+        for ident in identifiers:
+            self.link(listing[1], ident)
+        return listing[1]
+
+    def link(self, listing: int, ident: Identifier):
+        """Adds ident to an existing listing, e.g. from a manual override."""
+        node = (ident.kind, ident.key)
+        self._node(node, ident)
+        self._union(("listing", listing), node)
+
+    def find(self, listing: int):
+        return self.sets.find(("listing", listing))
+
+    def entity_id(self, listing: int) -> str | None:
+        best = self.entities[self.find(listing)].best
+        return best.entity_id if best is not None else None
+
+    def entity_kind(self, listing: int) -> str | None:
+        best = self.entities[self.find(listing)].best
+        return best.kind if best is not None else None
+
+    def groups(self) -> dict[str, list[int]]:
+        """Listings by entity ID, in the order they were added, leaving out listings without identifiers."""
+        groups = {}
+        for listing in range(self.listing_count):
+            entity_id = self.entity_id(listing)
+            if entity_id is not None:
+                groups.setdefault(entity_id, []).append(listing)
+        return groups
+
+    def same_entity(self, a: int, b: int) -> bool:
+        return self.find(a) == self.find(b)
+
+    def entity_count(self) -> int:
+        """Sets with at least one listing."""
+        return sum(1 for entity in self.entities.values() if entity.listings)
+
+    def conflicts(self) -> list[dict]:
+        """Sets with more than one identifier of a UNIQUE_KINDS kind."""
+        found = []
+        for entity in self.entities.values():
+            multiple = {
+                kind: sorted(ident.entity_id for ident in idents.values())
+                for kind, idents in entity.unique.items()
+                if len(idents) > 1
+            }
+            if multiple:
+                found.append(
+                    {
+                        "id": entity.best.entity_id,
+                        "listings": entity.listings,
+                        **multiple,
+                    }
+                )
+        return found
@@ -0,0 +1,132 @@
+"""Index over a manual overrides table, for exact and near-miss lookups.
+
+The notebook matched overrides by filtering the whole overrides DataFrame
+once per listing, and looked for near misses by comparing every listing
+with every override. OverrideIndex keeps the overrides in a dict keyed by
+normalized (artist, name), so applying them is one lookup per listing, and
+groups them by normalized artist. Near misses compare each distinct listing
+artist with the override artists in one cdist, then only compare titles
+under the artists that are already close.
+
+    overrides = OverrideIndex.from_frame(
+        manual_overrides_df, "original_artist", "original_name"
+    )
+    override = overrides.get(song.artist, song.name)
+
+Both manual_overrides.csv and ytm_manual_overrides.csv are served this way.
+"""
+
+from collections import defaultdict
+
+import numpy
+import pandas
+from rapidfuzz import fuzz, process
+from rapidfuzz.process import cdist
+
+# fuzz.ratio a near miss's normalized artist and name must both beat
+NEAR_MISS_CUTOFF = 90
+CLOSE_ARTISTS_CHUNK_SIZE = 1000
+
+
+def normalize_override_key(artist, name) -> tuple[str, str]:
+    """(artist, name) casefolded and stripped, as overrides are matched."""
+    return str(artist).casefold().strip(), str(name).casefold().strip()
+
+
+class OverrideIndex:
+    def __init__(self, records: list[dict], artist_field: str, name_field: str):
+        self.artist_field = artist_field
+        self.name_field = name_field
+        self.records = records
+        self.by_key = {}
+        # normalized artist -> [(normalized name, record position)]
+        self.names_by_artist = defaultdict(list)
+        for position, record in enumerate(records):
+            key = normalize_override_key(record[artist_field], record[name_field])
+            self.names_by_artist[key[0]].append((key[1], position))
+            if key not in self.by_key:
+                self.by_key[key] = record
+            # Spellings differing only in case may repeat the same override
+            elif self._values(self.by_key[key]) != self._values(record):
+                raise ValueError(
+                    f"Multiple overrides for {record[artist_field]} - {record[name_field]}"
+                )
+        self.artists = list(self.names_by_artist)
+
+    def _values(self, record: dict) -> dict:
+        """record without its key fields, with missing values as None."""
+        return {
+            field: None if pandas.isna(value) else value
+            for field, value in record.items()
+            if field not in (self.artist_field, self.name_field)
+        }
+
+    @classmethod
+    def from_frame(cls, df: pandas.DataFrame, artist_column: str, name_column: str):
+        return cls(df.to_dict(orient="records"), artist_column, name_column)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, artist, name, default=None):
+        return self.by_key.get(normalize_override_key(artist, name), default)
+
+    def close_artists(self, artist_keys: list[str], cutoff: float = NEAR_MISS_CUTOFF) -> dict:
+        """{normalized artist: override artists whose fuzz.ratio beats cutoff}.
+
+        Scored with rapidfuzz's multithreaded cdist, in chunks of rows.
+        """
+        close = {}
+        for start in range(0, len(artist_keys), CLOSE_ARTISTS_CHUNK_SIZE):
+            chunk = artist_keys[start : start + CLOSE_ARTISTS_CHUNK_SIZE]
+            scores = cdist(
+                chunk, self.artists, scorer=fuzz.ratio, score_cutoff=cutoff,
+                dtype=numpy.float64, workers=-1,
+            )
+            for row, artist_key in enumerate(chunk):
+                close[artist_key] = [self.artists[c] for c in numpy.flatnonzero(scores[row] > cutoff)]
+        return close
+
+    def _near_miss_positions(self, artist_key, name_key, close_artists, cutoff) -> list[int]:
+        positions = []
+        for ov_artist in close_artists:
+            names = self.names_by_artist[ov_artist]
+            # score_cutoff keeps scores >= cutoff, and near misses must beat it
+            for _, name_score, i in process.extract(
+                name_key, [n for n, _ in names], scorer=fuzz.ratio, score_cutoff=cutoff, limit=None
+            ):
+                if name_score > cutoff and (ov_artist, names[i][0]) != (artist_key, name_key):
+                    positions.append(names[i][1])
+        return sorted(positions)
+
+    def near_misses(self, artist, name, cutoff: float = NEAR_MISS_CUTOFF) -> list[dict]:
+        """Overrides close to, but not exactly, (artist, name), in table order."""
+        artist_key, name_key = normalize_override_key(artist, name)
+        close_artists = self.close_artists([artist_key], cutoff)[artist_key]
+        positions = self._near_miss_positions(artist_key, name_key, close_artists, cutoff)
+        return [self.records[p] for p in positions]
+
+    def audit_missed(self, keys, cutoff: float = NEAR_MISS_CUTOFF) -> list[str]:
+        """Warnings for (artist, name) keys that nearly hit an override.
+
+        Usually a typo like "James K" vs "James K." in the listing or the
+        overrides table. Artists are compared once per distinct artist, and
+        only the titles of close artists are compared.
+        """
+        keys = [(str(artist), str(name)) for artist, name in keys]
+        normalized = [normalize_override_key(artist, name) for artist, name in keys]
+        close = self.close_artists(list(dict.fromkeys(a for a, _ in normalized)), cutoff)
+
+        positions = {}
+        warnings = []
+        for (artist, name), key in zip(keys, normalized):
+            if key not in positions:
+                positions[key] = self._near_miss_positions(*key, close[key[0]], cutoff)
+            for p in positions[key]:
+                override = self.records[p]
+                warnings.append(
+                    f"Possible Missed Override: Source '{artist} - {name}' "
+                    f"is very close to Override Key "
+                    f"'{override[self.artist_field]} - {override[self.name_field]}'"
+                )
+        return warnings
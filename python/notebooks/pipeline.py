@@ -0,0 +1,388 @@
+"""Declarative, incremental runner for the best songs pipeline.
+
+Each stage declares the files it reads and writes. Dependencies are derived
+from those declarations (a stage depends on whichever stage produces one of
+its inputs), so the run order doesn't depend on the order stages are added.
+
+A stage is skipped when the content hashes of its inputs, its code and its
+recorded outputs all match the previous run. Because hashes are compared
+after every upstream stage finishes, a stage whose upstream reran but
+produced byte-identical outputs is also skipped.
+
+Independent stages run concurrently on a thread pool since nearly all of the
+expensive work is waiting on external APIs.
+
+This module is the runner only. best_songs_merge.ipynb still runs cell by
+cell; a definition module supplies the stages, each a function that reads
+its inputs and writes its outputs, for example with Pipeline.from_spec.
+
+Usage:
+    python pipeline.py --definition my_stages:build_pipeline plan
+    python pipeline.py --definition my_stages:build_pipeline run --jobs 4
+    python pipeline.py --definition my_stages:build_pipeline run --target export
+"""
+
+import argparse
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+
+from pipeline_metrics import MetricsRegistry
+
+PIPELINE_STATE_FILENAME = "caches/pipeline_state.json"
+
+def hash_path(path: str) -> str | None:
+    """Content hash of a file or of every file under a directory, None if missing."""
+    if not os.path.exists(path):
+        return None
+
+    digest = hashlib.sha256()
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = []
+        for root, dirs, filenames in os.walk(path):
+            dirs.sort()
+            for filename in sorted(filenames):
+                files.append(os.path.join(root, filename))
+
+    for filename in files:
+        if len(files) > 1:
+            digest.update(os.path.relpath(filename, path).encode("utf-8"))
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_callable(func: Callable) -> str:
+    """Hash of a stage function's source so editing the code reruns the stage."""
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        source = f"{func.__module__}.{getattr(func, '__qualname__', repr(func))}"
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable
+    inputs: list[str] = field(default_factory=list)
+    outputs: list[str] = field(default_factory=list)
+    # Bump to force a rerun when behavior changes outside of func's source
+    version: str = "1"
+
+
+@dataclass
+class StageContext:
+    """What a stage function receives when it runs."""
+
+    stage: Stage
+    pipeline: "Pipeline"
+
+    @property
+    def inputs(self):
+        return self.stage.inputs
+
+    @property
+    def outputs(self):
+        return self.stage.outputs
+
+    @property
+    def metrics(self) -> MetricsRegistry:
+        return self.pipeline.metrics
+
+    @property
+    def stats(self):
+        """This stage's stats Counter in the shared metrics registry."""
+        return self.pipeline.metrics.counter(self.stage.name)
+
+
+class Pipeline:
+    def __init__(self, state_filename=PIPELINE_STATE_FILENAME, metrics=None):
+        self.stages: dict[str, Stage] = {}
+        self.state_filename = state_filename
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+
+    def add_stage(self, name, func, inputs=(), outputs=(), version="1"):
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        for output in outputs:
+            producer = self.producer_of(output)
+            if producer is not None:
+                raise ValueError(
+                    f"Output {output} of {name} is already produced by {producer}"
+                )
+        self.stages[name] = Stage(name, func, list(inputs), list(outputs), version)
+        return self.stages[name]
+
+    def stage(self, name, inputs=(), outputs=(), version="1"):
+        """Decorator form of add_stage."""
+
+        def decorator(func):
+            self.add_stage(name, func, inputs, outputs, version)
+            return func
+
+        return decorator
+
+    @classmethod
+    def from_spec(cls, spec: list[dict], implementations: dict, **kwargs):
+        """Builds a pipeline from [{"name", "inputs", "outputs", "version"}, ...]."""
+        missing = [s["name"] for s in spec if s["name"] not in implementations]
+        if missing:
+            raise ValueError(f"Missing stage implementations: {missing}")
+        pipeline = cls(**kwargs)
+        for s in spec:
+            pipeline.add_stage(
+                s["name"],
+                implementations[s["name"]],
+                s.get("inputs", ()),
+                s.get("outputs", ()),
+                s.get("version", "1"),
+            )
+        return pipeline
+
+    def producer_of(self, path):
+        for stage in self.stages.values():
+            if path in stage.outputs:
+                return stage.name
+        return None
+
+    def dependencies(self, name) -> set[str]:
+        deps = set()
+        for path in self.stages[name].inputs:
+            producer = self.producer_of(path)
+            if producer is not None and producer != name:
+                deps.add(producer)
+        return deps
+
+    def topological_order(self, targets=None) -> list[str]:
+        """Stages in dependency order, limited to the ancestors of targets if given."""
+        if targets:
+            unknown = [t for t in targets if t not in self.stages]
+            if unknown:
+                raise ValueError(f"Unknown stages: {unknown}")
+            wanted = set()
+            todo = list(targets)
+            while todo:
+                name = todo.pop()
+                if name in wanted:
+                    continue
+                wanted.add(name)
+                todo.extend(self.dependencies(name))
+        else:
+            wanted = set(self.stages)
+
+        order = []
+        visiting = set()
+        done = set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected at stage {name}")
+            visiting.add(name)
+            for dep in sorted(self.dependencies(name)):
+                visit(dep)
+            visiting.remove(name)
+            done.add(name)
+            order.append(name)
+
+        # Keep declaration order where dependencies allow it
+        for name in self.stages:
+            if name in wanted:
+                visit(name)
+        return order
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+
+    def load_state(self) -> dict:
+        if not os.path.exists(self.state_filename):
+            return {}
+        with open(self.state_filename, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_state(self, state: dict):
+        directory = os.path.dirname(self.state_filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_filename = self.state_filename + ".tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=4, sort_keys=True)
+        os.replace(tmp_filename, self.state_filename)
+
+    def fingerprint(self, name) -> dict:
+        stage = self.stages[name]
+        return {
+            "version": stage.version,
+            "code": hash_callable(stage.func),
+            "inputs": {path: hash_path(path) for path in stage.inputs},
+        }
+
+    def is_fresh(self, name, state: dict) -> bool:
+        recorded = state.get(name)
+        if recorded is None:
+            return False
+        if recorded["fingerprint"] != self.fingerprint(name):
+            return False
+        for path, output_hash in recorded["outputs"].items():
+            if hash_path(path) != output_hash:
+                return False
+        return True
+
+    def plan(self, targets=None, force=()) -> list[str]:
+        """Stages that would run, assuming every rerun changes its outputs."""
+        state = self.load_state()
+        dirty = set()
+        for name in self.topological_order(targets):
+            if (
+                name in force
+                or self.dependencies(name) & dirty
+                or not self.is_fresh(name, state)
+            ):
+                dirty.add(name)
+        return [name for name in self.topological_order(targets) if name in dirty]
+
+    # ------------------------------------------------------------------
+    # Execution
+    # ------------------------------------------------------------------
+
+    def _run_stage(self, name):
+        stage = self.stages[name]
+        for path in stage.inputs:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Stage {name} is missing input {path}")
+        fingerprint = self.fingerprint(name)
+
+        start = time.perf_counter()
+        with self.metrics.stage(name):
+            stage.func(StageContext(stage, self))
+        elapsed = time.perf_counter() - start
+
+        outputs = {}
+        for path in stage.outputs:
+            output_hash = hash_path(path)
+            if output_hash is None:
+                raise FileNotFoundError(f"Stage {name} did not write output {path}")
+            outputs[path] = output_hash
+        return {"fingerprint": fingerprint, "outputs": outputs, "seconds": elapsed}
+
+    def run(self, targets=None, force=(), max_workers=4) -> dict:
+        """Runs stale stages, concurrently where the graph allows.
+
+        Returns a dict of stage name to "ran" or "skipped".
+        """
+        order = self.topological_order(targets)
+        state = self.load_state()
+        status = {}
+        remaining = {name: self.dependencies(name) & set(order) for name in order}
+
+        def ready():
+            return [
+                name
+                for name in order
+                if name in remaining and not (remaining[name] - set(status))
+            ]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {}
+            try:
+                while remaining or running:
+                    for name in ready():
+                        del remaining[name]
+                        # Checked only once upstream stages are done so that
+                        # unchanged upstream outputs don't cascade reruns
+                        if name not in force and self.is_fresh(name, state):
+                            print(f"[pipeline] {name}: up to date")
+                            status[name] = "skipped"
+                            continue
+                        print(f"[pipeline] {name}: running")
+                        running[executor.submit(self._run_stage, name)] = name
+
+                    if not running:
+                        continue
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        state[name] = future.result()
+                        status[name] = "ran"
+                        print(f"[pipeline] {name}: done in {state[name]['seconds']:.1f}s")
+                        self.save_state(state)
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                raise
+
+        return status
+
+
+def load_definition(definition: str) -> Pipeline:
+    """Loads a pipeline from a "module:attribute" spec.
+
+    The attribute may be a Pipeline or a zero-argument function returning one.
+    """
+    module_name, _, attribute = definition.partition(":")
+    if not attribute:
+        raise ValueError(f"Expected module:attribute, got {definition}")
+    target = getattr(importlib.import_module(module_name), attribute)
+    pipeline = target() if callable(target) else target
+    if not isinstance(pipeline, Pipeline):
+        raise ValueError(f"{definition} did not produce a Pipeline")
+    return pipeline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--definition",
+        required=True,
+        help="module:attribute that builds the Pipeline, e.g. my_stages:build_pipeline",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command in ("plan", "run"):
+        sub = subparsers.add_parser(command)
+        sub.add_argument("--target", action="append", help="Only this stage and its dependencies")
+        sub.add_argument("--force", action="append", default=[], help="Rerun this stage even if fresh")
+        if command == "run":
+            sub.add_argument("--jobs", type=int, default=4, help="Max concurrent stages")
+            sub.add_argument(
+                "--no-report",
+                action="store_true",
+                help="Don't write the metrics report for this run",
+            )
+
+    subparsers.add_parser("status")
+
+    args = parser.parse_args(argv)
+    pipeline = load_definition(args.definition)
+
+    if args.command == "plan":
+        for name in pipeline.plan(args.target, args.force):
+            print(name)
+    elif args.command == "run":
+        pipeline.run(args.target, args.force, max_workers=args.jobs)
+        if not args.no_report:
+            json_path, md_path = pipeline.metrics.write_report()
+            print(f"Wrote metrics report to {json_path} and {md_path}")
+    elif args.command == "status":
+        state = pipeline.load_state()
+        for name in pipeline.topological_order():
+            label = "fresh" if pipeline.is_fresh(name, state) else "stale"
+            print(f"{name}: {label}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,343 @@
+"""Shared metrics registry for pipeline stages.
+
+Stages already count things in ad-hoc `stats = Counter()` objects. The
+registry hands out those Counters (so existing code keeps working) and adds
+what they can't capture: wall time, peak RSS and tracemalloc deltas per
+stage, cache hit ratios, and per-endpoint API call latency histograms.
+
+Each run can be written out as JSON and Markdown. The Markdown report
+includes the change against the previous JSON report in the same directory,
+which makes a falling cache hit rate or a newly slow stage easy to spot.
+"""
+
+import bisect
+import glob
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+METRICS_REPORT_DIR = "outputs/metrics"
+
+# Upper bounds in milliseconds; the last bucket catches everything slower
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Hit/miss key pairs used by the notebook's existing stats Counters that
+# don't follow the <prefix>cache_hits / <prefix>cache_misses convention.
+CACHE_COUNTER_PAIRS = {
+    "main": ("main_cache_hits", "main_api_queries"),
+    "id": ("id_cache_hits", "id_api_queries"),
+    "artist": ("artist_cache_hits", "artist_api_queries"),
+    "ytv": ("ytv_cache_hits", "ytv_api_calls"),
+    "youtube_music_search": ("main_cache_hits", "search_api_calls"),
+}
+
+CACHE_HIT_SUFFIXES = ("cache_hits", "cache_hit")
+CACHE_MISS_SUFFIXES = ("cache_misses", "cache_miss")
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def cache_ratios_from_counter(stats: Counter) -> dict:
+    """Infers {cache name: (hits, misses)} from a stage's stats Counter."""
+    caches = {}
+    for key, hits in stats.items():
+        for hit_suffix, miss_suffix in zip(CACHE_HIT_SUFFIXES, CACHE_MISS_SUFFIXES):
+            if key.endswith(hit_suffix):
+                prefix = key[: -len(hit_suffix)]
+                miss_key = prefix + miss_suffix
+                if miss_key in stats:
+                    caches[prefix.rstrip("_") or "cache"] = (hits, stats[miss_key])
+                break
+
+    for name, (hit_key, miss_key) in CACHE_COUNTER_PAIRS.items():
+        if hit_key in stats and miss_key in stats and name not in caches:
+            caches[name] = (stats[hit_key], stats[miss_key])
+    return caches
+
+
+class LatencyHistogram:
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = list(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.samples_ms = []
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False):
+        ms = seconds * 1000.0
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.samples_ms.append(ms)
+        if error:
+            self.errors += 1
+
+    def percentile(self, pct: float) -> float | None:
+        if not self.samples_ms:
+            return None
+        ordered = sorted(self.samples_ms)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def to_dict(self) -> dict:
+        calls = len(self.samples_ms)
+        labels = [f"<={b}ms" for b in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+        return {
+            "calls": calls,
+            "errors": self.errors,
+            "total_ms": round(sum(self.samples_ms), 3),
+            "mean_ms": round(sum(self.samples_ms) / calls, 3) if calls else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "max_ms": max(self.samples_ms) if calls else None,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class MetricsRegistry:
+    """Collects metrics from every stage of one pipeline run. Thread-safe."""
+
+    def __init__(self, run_id: str | None = None, trace_memory: bool = True):
+        self.run_id = run_id or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        self.trace_memory = trace_memory
+        self.counters: dict[str, Counter] = {}
+        self.stages: dict[str, dict] = {}
+        self.caches: dict[str, dict[str, tuple[int, int]]] = {}
+        self.api: dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+        # Stages inside stage() with tracemalloc on, and whether the first
+        # of them started it
+        self._tracing_stages = 0
+        self._started_tracing = False
+
+    def counter(self, stage: str) -> Counter:
+        """The stats Counter for a stage, created on first use."""
+        with self._lock:
+            if stage not in self.counters:
+                self.counters[stage] = Counter()
+            return self.counters[stage]
+
+    def record_cache(self, stage: str, name: str, hits: int, misses: int):
+        """Explicitly records cache effectiveness when it can't be inferred."""
+        with self._lock:
+            self.caches.setdefault(stage, {})[name] = (hits, misses)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times a stage and records its memory use.
+
+        tracemalloc and RSS are process-wide, so when stages run concurrently
+        the memory numbers include whatever else was running at the time.
+        Tracing starts with the first stage and stops when the last one ends.
+        """
+        if self.trace_memory:
+            self._start_tracing()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        rss_before = peak_rss_bytes()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield self.counter(name)
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            record = {
+                "wall_seconds": round(elapsed, 4),
+                "peak_rss_bytes": peak_rss_bytes(),
+                "peak_rss_growth_bytes": peak_rss_bytes() - rss_before,
+                "error": error,
+            }
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record["tracemalloc_delta_bytes"] = current - traced_before
+                record["tracemalloc_peak_bytes"] = peak - traced_before
+                self._stop_tracing()
+            with self._lock:
+                self.stages[name] = record
+
+    def _start_tracing(self):
+        with self._lock:
+            if self._tracing_stages == 0:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._started_tracing = True
+                # Only when no other stage is measuring its peak
+                tracemalloc.reset_peak()
+            self._tracing_stages += 1
+
+    def _stop_tracing(self):
+        with self._lock:
+            self._tracing_stages -= 1
+            if self._tracing_stages == 0 and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    @contextmanager
+    def api_call(self, endpoint: str):
+        """Times one request to an external endpoint, e.g. "spotify.search"."""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                if endpoint not in self.api:
+                    self.api[endpoint] = LatencyHistogram()
+                self.api[endpoint].observe(elapsed, error=error)
+
+    def timed(self, endpoint: str, func):
+        """Wraps func so every call is recorded as an API call to endpoint."""
+
+        def wrapper(*args, **kwargs):
+            with self.api_call(endpoint):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def report(self) -> dict:
+        with self._lock:
+            caches = {}
+            for stage, stats in self.counters.items():
+                for name, (hits, misses) in cache_ratios_from_counter(stats).items():
+                    caches[f"{stage}.{name}"] = (hits, misses)
+            for stage, explicit in self.caches.items():
+                for name, (hits, misses) in explicit.items():
+                    caches[f"{stage}.{name}"] = (hits, misses)
+
+            return {
+                "run_id": self.run_id,
+                "stages": dict(self.stages),
+                "counters": {s: dict(c) for s, c in self.counters.items()},
+                "caches": {
+                    name: {
+                        "hits": hits,
+                        "misses": misses,
+                        "hit_ratio": (
+                            round(hits / (hits + misses), 4) if hits + misses else None
+                        ),
+                    }
+                    for name, (hits, misses) in sorted(caches.items())
+                },
+                "api": {e: h.to_dict() for e, h in sorted(self.api.items())},
+            }
+
+    def write_report(self, directory: str = METRICS_REPORT_DIR) -> tuple[str, str]:
+        """Writes metrics_<run_id>.json and .md, returns both paths."""
+        os.makedirs(directory, exist_ok=True)
+        report = self.report()
+        json_path = os.path.join(directory, f"metrics_{self.run_id}.json")
+        md_path = os.path.join(directory, f"metrics_{self.run_id}.md")
+
+        previous = load_previous_report(directory, exclude=json_path)
+
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        with open(md_path, "w", encoding="utf-8") as f:
+            f.write(format_markdown_report(report, previous))
+        return json_path, md_path
+
+
+def load_previous_report(directory: str, exclude: str | None = None) -> dict | None:
+    paths = sorted(glob.glob(os.path.join(directory, "metrics_*.json")))
+    paths = [p for p in paths if p != exclude]
+    if not paths:
+        return None
+    with open(paths[-1], "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _format_bytes(value) -> str:
+    if value is None:
+        return ""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(value) < 1024 or unit == "GB":
+            return f"{value:.1f} {unit}" if unit != "B" else f"{value} B"
+        value /= 1024.0
+
+
+def _format_change(current, previous, fmt="{:+.1%}") -> str:
+    if current is None or previous is None:
+        return ""
+    return fmt.format(current - previous)
+
+
+def format_markdown_report(report: dict, previous: dict | None = None) -> str:
+    previous = previous or {"stages": {}, "caches": {}}
+    lines = [f"# Pipeline metrics {report['run_id']}", ""]
+
+    if previous.get("run_id"):
+        lines += [f"Compared with run {previous['run_id']}.", ""]
+
+    lines += [
+        "## Stages",
+        "",
+        "| Stage | Wall time (s) | Δ prev (s) | Peak RSS | tracemalloc Δ | tracemalloc peak |",
+        "| :---- | ------------: | ---------: | -------: | ------------: | ---------------: |",
+    ]
+    stages = sorted(
+        report["stages"].items(), key=lambda kv: kv[1]["wall_seconds"], reverse=True
+    )
+    for name, s in stages:
+        prev = previous["stages"].get(name, {}).get("wall_seconds")
+        lines.append(
+            f"| {name} | {s['wall_seconds']:.2f} | "
+            f"{_format_change(s['wall_seconds'], prev, '{:+.2f}')} | "
+            f"{_format_bytes(s['peak_rss_bytes'])} | "
+            f"{_format_bytes(s.get('tracemalloc_delta_bytes'))} | "
+            f"{_format_bytes(s.get('tracemalloc_peak_bytes'))} |"
+        )
+
+    lines += [
+        "",
+        "## Caches",
+        "",
+        "| Cache | Hits | Misses | Hit ratio | Δ prev |",
+        "| :---- | ---: | -----: | --------: | -----: |",
+    ]
+    for name, c in report["caches"].items():
+        ratio = "" if c["hit_ratio"] is None else f"{c['hit_ratio']:.1%}"
+        prev = previous["caches"].get(name, {}).get("hit_ratio")
+        lines.append(
+            f"| {name} | {c['hits']} | {c['misses']} | {ratio} | "
+            f"{_format_change(c['hit_ratio'], prev)} |"
+        )
+
+    lines += [
+        "",
+        "## API calls",
+        "",
+        "| Endpoint | Calls | Errors | Mean (ms) | p50 (ms) | p95 (ms) | Max (ms) |",
+        "| :------- | ----: | -----: | --------: | -------: | -------: | -------: |",
+    ]
+    for endpoint, a in report["api"].items():
+        lines.append(
+            f"| {endpoint} | {a['calls']} | {a['errors']} | {a['mean_ms']:.1f} | "
+            f"{a['p50_ms']:.1f} | {a['p95_ms']:.1f} | {a['max_ms']:.1f} |"
+        )
+
+    for endpoint, a in report["api"].items():
+        lines += ["", f"### {endpoint} latency", ""]
+        lines += ["| Bucket | Calls |", "| :----- | ----: |"]
+        for label, count in a["buckets"].items():
+            lines.append(f"| {label} | {count} |")
+
+    return "\n".join(lines) + "\n"
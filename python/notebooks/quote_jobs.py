@@ -0,0 +1,146 @@
+"""Job table for the primary -> fallback quote extraction cascade.
+
+Each review to quote is a job keyed by (artist, name, source). The old
+cascade found the reviews to retry with the fallback model by comparing
+every input with every primary failure, three DataFrame columns at a
+time, and after an interruption it started over: only usable quotes are in
+the extraction cache, so every primary failure went to the primary model
+again. Here each job records its state:
+
+    pending -> primary-ok
+            -> primary-failed -> fallback-ok
+                              -> fallback-failed
+
+Picking the jobs for a step is a pass over the table, and recording a
+result is a dict lookup. With a store namespace as the table's backing
+mapping, states survive the kernel, so a rerun picks up each job where it
+stopped. A stored job whose review, models or prompt changed (see
+QuoteJobTable.digest) starts over as pending. A failed API call says
+nothing about the review, so it moves the job on for this run only: the
+stored state stays where it was and the next run sends the job again.
+
+    jobs = QuoteJobTable(songs, primary_model, fallback_model, stored=namespace)
+    for chunk in jobs.chunks(PENDING):
+        ...
+        jobs.record(results_rows, fallback=False)
+"""
+
+from collections import Counter
+
+import pandas
+
+import cache_keys
+
+QUOTE_JOBS_NAMESPACE = "quote_jobs"
+
+PENDING = "pending"
+PRIMARY_OK = "primary-ok"
+PRIMARY_FAILED = "primary-failed"
+FALLBACK_OK = "fallback-ok"
+FALLBACK_FAILED = "fallback-failed"
+STATES = (PENDING, PRIMARY_OK, PRIMARY_FAILED, FALLBACK_OK, FALLBACK_FAILED)
+
+DEFAULT_CHUNK_SIZE = 500
+
+REVIEW_COL_PREFIX = "description_"
+
+# quote_errors of requests that failed rather than reviews that did
+TRANSIENT_ERRORS = ("Not usable: api_error",)
+
+
+def review_source(review_col: str) -> str:
+    return review_col[len(REVIEW_COL_PREFIX) :]
+
+
+def job_key(artist, name, source) -> tuple:
+    return (artist, name, source)
+
+
+def stored_job_key(key: tuple) -> str:
+    return " ::: ".join(str(part) for part in key)
+
+
+class QuoteJobTable:
+    def __init__(self, songs, primary_model, fallback_model, stored=None, fingerprint=""):
+        """songs are dicts with artist, name, review and review_col.
+
+        stored is a mapping of job states from an earlier run, e.g. a store
+        namespace, and is kept up to date by record().
+        """
+        self.primary_model = primary_model
+        self.fallback_model = fallback_model
+        self.fingerprint = fingerprint
+        self.stored = stored if stored is not None else {}
+        self.songs = {}
+        self.jobs = {}
+        self.stats = Counter()
+        for song in songs:
+            key = job_key(song["artist"], song["name"], review_source(song["review_col"]))
+            if key in self.songs:
+                raise ValueError(f"Multiple reviews for {key}")
+            self.songs[key] = song
+            self.jobs[key] = self._resume(key, song)
+
+    def digest(self, song) -> str:
+        """Changes when the job's review, models or prompt do."""
+        return cache_keys.input_digest(
+            [song["review"], self.primary_model, self.fallback_model, self.fingerprint]
+        )
+
+    def _resume(self, key, song) -> dict:
+        job = self.stored.get(stored_job_key(key))
+        if job is not None and job["digest"] == self.digest(song):
+            self.stats[f"resumed_{job['state']}"] += 1
+            return job
+        if job is not None:
+            self.stats["restarted"] += 1
+        return {"digest": self.digest(song), "state": PENDING, "result": None}
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def state(self, artist, name, source) -> str:
+        return self.jobs[job_key(artist, name, source)]["state"]
+
+    def state_counts(self) -> dict:
+        counts = Counter(job["state"] for job in self.jobs.values())
+        return {state: counts[state] for state in STATES if counts[state]}
+
+    def songs_in(self, state: str) -> list[dict]:
+        """The songs of jobs in state, in input order."""
+        return [self.songs[key] for key, job in self.jobs.items() if job["state"] == state]
+
+    def chunks(self, state: str, size: int = DEFAULT_CHUNK_SIZE):
+        """songs_in(state) in lists of up to size, to record as each finishes."""
+        songs = self.songs_in(state)
+        for start in range(0, len(songs), size):
+            yield songs[start : start + size]
+
+    def record(self, rows, fallback: bool):
+        """Records verified result rows from build_verified_quote_result_dict_df.
+
+        A row without a quote_error is a success. The jobs move from
+        pending, or from primary-failed if fallback, and are stored unless
+        the row's error is in TRANSIENT_ERRORS.
+        """
+        expected = PRIMARY_FAILED if fallback else PENDING
+        ok, failed = (FALLBACK_OK, FALLBACK_FAILED) if fallback else (PRIMARY_OK, PRIMARY_FAILED)
+        for row in rows:
+            key = job_key(row["artist"], row["name"], row["source"])
+            job = self.jobs[key]
+            assert job["state"] == expected, f"{key} is {job['state']}, not {expected}"
+            row = {k: None if pandas.isna(v) else v for k, v in row.items()}
+            job = {**job, "state": failed if row["quote_error"] else ok, "result": row}
+            self.jobs[key] = job
+            if row["quote_error"] in TRANSIENT_ERRORS:
+                self.stats["transient_failures"] += 1
+                continue
+            self.stored[stored_job_key(key)] = job
+
+    def results_df(self) -> pandas.DataFrame:
+        """Final results: primary successes, then fallback results, in input order."""
+        jobs = self.jobs.values()
+        rows = [job["result"] for job in jobs if job["state"] == PRIMARY_OK] + [
+            job["result"] for job in jobs if job["state"] in (FALLBACK_OK, FALLBACK_FAILED)
+        ]
+        return pandas.DataFrame.from_records(rows)
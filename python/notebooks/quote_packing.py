@@ -0,0 +1,106 @@
+"""Prompt caching and review packing for quote extraction.
+
+Each extraction used to send one prompt that named the song before about
+1,100 tokens of instructions and worked examples. Since the song came
+first, the provider had nothing to cache, and every review paid for the
+whole block again. Requests now send the instructions as a system prompt
+marked for prompt caching (cached_system), and only the song and review go
+in the user message (review_prompt).
+
+Short reviews can also be packed several to a request. Each request then
+carries the instructions once instead of once per review:
+
+    for songs in pack(misses, lambda song: len(song["review"])):
+        prompt = packed_prompt(songs) if len(songs) > 1 else review_prompt(...)
+
+packed_prompt numbers the reviews, and the response has one numbered
+extraction per review. unpack puts the extractions back in song order. A
+review the model skipped comes back as None so the caller can retry it on
+its own. Verification and the fallback model still work per review.
+"""
+
+import re
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+REVIEW_MARKER = "Review text:\n"
+
+DEFAULT_PACK_SIZE = 8
+# Longer reviews are extracted on their own
+DEFAULT_MAX_PACKED_REVIEW_CHARS = 1500
+DEFAULT_MAX_PACK_CHARS = 8000
+
+PACKED_REVIEW_RE = re.compile(r"^Review (\d+) ([^\n]*):\n<review>\n(.*?)\n</review>$", re.MULTILINE | re.DOTALL)
+
+
+def cached_system(instructions: str) -> list[dict]:
+    """A system prompt of instructions, cached along with the tools before it."""
+    return [{"type": "text", "text": instructions, "cache_control": CACHE_CONTROL}]
+
+
+def review_prompt(artist: str, name: str, review: str) -> str:
+    return f"""Extract a short compelling quote from this review of "{name}" by {artist}.
+
+{REVIEW_MARKER}{review}"""
+
+
+def packed_prompt(songs: list[dict]) -> str:
+    """One user message asking for an extraction from each of songs' reviews."""
+    reviews = "\n\n".join(
+        f'Review {number} of "{song["name"]}" by {song["artist"]}:\n<review>\n{song["review"]}\n</review>'
+        for number, song in enumerate(songs, 1)
+    )
+    return f"""Extract a short compelling quote from each of these {len(songs)} reviews.
+Treat each review on its own: a quote may only use text from its own review.
+Give exactly one extraction per review, with review_id set to the review's number.
+
+{reviews}"""
+
+
+def parse_packed_prompt(text: str) -> list[tuple[int, str, str]]:
+    """(number, "of ... by ..." header, review) for each review in a packed_prompt."""
+    return [(int(number), header, review) for number, header, review in PACKED_REVIEW_RE.findall(text)]
+
+
+def pack(
+    items,
+    length,
+    pack_size: int = DEFAULT_PACK_SIZE,
+    max_review_chars: int = DEFAULT_MAX_PACKED_REVIEW_CHARS,
+    max_pack_chars: int = DEFAULT_MAX_PACK_CHARS,
+) -> list[list]:
+    """Groups items in order into packs of short reviews, length(item) being its review's length.
+
+    Reviews longer than max_review_chars get a pack of their own; the rest
+    fill packs of up to pack_size items and max_pack_chars characters.
+    """
+    packs = []
+    current = []
+    current_chars = 0
+    for item in items:
+        chars = length(item)
+        if pack_size <= 1 or chars > max_review_chars:
+            packs.append([item])
+            continue
+        if current and (len(current) >= pack_size or current_chars + chars > max_pack_chars):
+            packs.append(current)
+            current, current_chars = [], 0
+        current.append(item)
+        current_chars += chars
+    if current:
+        packs.append(current)
+    return packs
+
+
+def unpack(extractions, count: int) -> list:
+    """extractions (each with a 1-based review_id) in review order, None where one is missing.
+
+    Only the first extraction for a review counts; ones for reviews that
+    weren't asked about are dropped.
+    """
+    unpacked = [None] * count
+    for extraction in extractions:
+        index = extraction.review_id - 1
+        if 0 <= index < count and unpacked[index] is None:
+            unpacked[index] = extraction
+    return unpacked
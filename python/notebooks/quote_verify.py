@@ -0,0 +1,203 @@
+"""Checks that extracted review quotes are really in the review.
+
+The extraction model returns quotes like 'a giddy, stoned flirtation ...
+hinting at [a] nervous longing', whose " ... " parts, with bracketed
+insertions removed, must each appear in the review. The old checker ran a
+chain of str.replace calls per quote and dash character, re-normalized the
+whole review for every quote, and lowercased the review again for every
+check of every part. Here:
+
+- normalize_text maps every quote and dash variant in one str.translate
+- the normalized and lowercased review is cached per review, so a review
+  quoted by several models or columns is normalized once
+- each quote's candidate parts (as written, without a leading article) are
+  collected and checked against the cached lowercased review together,
+  each distinct candidate once
+
+    verification = verify_quote(extracted_quote, review)
+
+verify_quote returns the same dict as the old notebook version.
+"""
+
+import functools
+import re
+
+QUOTE_CHARS = "’’’‘''ʼʻˈ`ʹʽʾʿ′"
+DOUBLE_QUOTE_CHARS = '""”“„‟«»❝❞〝〞＂""'
+DASH_CHARS = "—–−‐‑‒"
+
+NORMALIZE_TABLE = str.maketrans(
+    {
+        "…": "...",
+        **{c: "'" for c in QUOTE_CHARS},
+        **{c: '"' for c in DOUBLE_QUOTE_CHARS},
+        **{c: "-" for c in DASH_CHARS},
+    }
+)
+
+PART_SEPARATOR = " ... "
+BRACKETED_INSERTION_RE = re.compile(r"\s*\[[^\]]*\]\s*")
+LEADING_ARTICLE_RE = re.compile(r"^(a|an|the)\s+", flags=re.IGNORECASE)
+
+REVIEW_CACHE_SIZE = 8192
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for comparison while preserving accented characters.
+
+    Just quotes, dashes and ellipses, the things that trip us up, and runs
+    of whitespace.
+    """
+    # translate is slow per character, and in ASCII only ` needs mapping
+    if text.isascii():
+        return " ".join(text.replace("`", "'").split())
+    return " ".join(text.translate(NORMALIZE_TABLE).split())
+
+
+@functools.lru_cache(maxsize=REVIEW_CACHE_SIZE)
+def normalized_review(review: str) -> tuple[str, str]:
+    """(normalized review, its lowercase), once per distinct review."""
+    normalized = normalize_text(review)
+    return normalized, normalized.lower()
+
+
+def extract_fixed_end_punctuation(
+    normalized_text: str, normalized_review: str, lowered_review: str | None = None
+):
+    """Returns a fixed quote that is a direct substring of normalized_review or None.
+
+    One of the big failure cases of the LLM quote extraction is that it really wants
+    to fix end punctuation within quotes when it's at the end of the extracted quote.
+
+    For example, for something like
+
+    best song since Radiohead's "Black Star."
+
+    it'll return
+
+    best song since Radiohead's "Black Star"
+
+    This will fish out the real quote so it's an exact substring.
+    lowered_review is normalized_review.lower(), if the caller has it.
+    """
+    if lowered_review is None:
+        lowered_review = normalized_review.lower()
+    if normalized_text.lower() in lowered_review:
+        return normalized_text
+    if not normalized_text.endswith('"') and not normalized_text.endswith("'"):
+        return None
+
+    text = normalized_text[:-1]
+    pos = lowered_review.find(text.lower())
+    if pos < 0:
+        return None
+    quote_start = pos
+    found_quote_end = pos + len(text)
+    real_end = lowered_review.find(normalized_text[-1].lower(), found_quote_end)
+    assert real_end >= 0 and real_end < len(normalized_review)
+    real_quote = normalized_review[quote_start : real_end + 1]
+    assert real_quote.lower() in lowered_review
+    return real_quote
+
+
+def _candidates(part: str) -> tuple[str, str]:
+    """A part normalized with bracketed insertions removed, and without its leading article."""
+    cleaned = normalize_text(BRACKETED_INSERTION_RE.sub(" ", part))
+    return cleaned, LEADING_ARTICLE_RE.sub("", cleaned)
+
+
+def verify_quote(quote: str, review: str) -> dict:
+    """Verify quote parts, allowing minor editorial adjustments."""
+    if not quote:
+        return {
+            "valid": True,
+            "parts": [],
+            "missing": [],
+            "auto_fixed": [],
+            "debug": None,
+        }
+
+    parts = [p.strip() for p in quote.split(PART_SEPARATOR)]
+    review_normalized, review_lowered = normalized_review(review)
+
+    checked = [(p, *_candidates(p)) for p in parts if p]
+    # Every distinct candidate is looked for once
+    found = {
+        candidate
+        for candidate in {c.lower() for _, *candidates in checked for c in candidates}
+        if candidate in review_lowered
+    }
+
+    missing = []
+    auto_fixed = []
+    debug = []
+    final_parts = []
+
+    for p, p_normalized, p_no_article in checked:
+        if p_normalized.lower() in found:
+            # Exact match
+            final_parts.append(p)
+            continue
+
+        if p_no_article.lower() in found:
+            auto_fixed.append(
+                {
+                    "original": p,
+                    "fix": "stripped leading article",
+                    "fixed": {p_no_article},
+                }
+            )
+            final_parts.append(p_no_article)
+            continue
+
+        # Try stripping trailing punctuation (handles "Black Star" vs "Black Star.")
+        p_fixed_end_quote = extract_fixed_end_punctuation(
+            p_normalized, review_normalized, review_lowered
+        )
+        if p_fixed_end_quote is not None:
+            auto_fixed.append(
+                {
+                    "original": p,
+                    "fix": "stripped trailing punctuation",
+                    "fixed": {p_fixed_end_quote},
+                }
+            )
+            final_parts.append(p_fixed_end_quote)
+            continue
+
+        # Try both
+        p_both = extract_fixed_end_punctuation(p_no_article, review_normalized, review_lowered)
+        if p_both is not None:
+            auto_fixed.append(
+                {
+                    "original": p,
+                    "fix": "stripped article + punctuation",
+                    "fixed": {p_both},
+                }
+            )
+            final_parts.append(p_both)
+            continue
+
+        debug.append(
+            {
+                "part_repr": p,
+                "part_normalized": p_normalized,
+            }
+        )
+
+        missing.append(p)
+
+    result = {
+        "valid": len(missing) == 0,
+        "parts": parts,
+        "missing": missing,
+        "auto_fixed": auto_fixed,
+        "debug": debug if debug else None,
+        "review_normalized": review_normalized,
+    }
+
+    # Assemble a final fixed variant if necessary
+    if not missing and auto_fixed:
+        result["fixed"] = PART_SEPARATOR.join(final_parts)
+
+    return result
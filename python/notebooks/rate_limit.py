@@ -0,0 +1,275 @@
+"""Token-bucket rate limiting shared by the API clients.
+
+One TokenBucket can be used from threads (acquire) and from asyncio code
+(acquire_async). A 429 with Retry-After pauses the whole bucket rather than
+just the request that saw it, since every other request in flight would get
+the same answer.
+
+AdaptiveRateLimiter wraps a bucket for APIs with no published limit, slowing
+down on errors and speeding back up while requests succeed.
+AdaptiveConcurrencyLimiter does the same for the number of requests in
+flight, for APIs like Anthropic's whose limits depend on the account and
+model and come back as 429 and overloaded responses.
+"""
+
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None, clock=time.monotonic):
+        assert rate > 0
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # _updated is in the future while paused
+        elapsed = max(0.0, now - self._updated)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = max(self._updated, now)
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Takes tokens if available and returns 0, otherwise the seconds to wait."""
+        with self._lock:
+            now = self.clock()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1.0):
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Blocks every acquisition for seconds, e.g. after a 429 Retry-After."""
+        with self._lock:
+            now = self.clock()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = max(self._updated, self._paused_until)
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill(self.clock())
+            self.rate = float(rate)
+
+
+def parse_retry_after(value, default: float = 1.0) -> float:
+    """Seconds to wait from a Retry-After header value."""
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return default
+
+
+class AdaptiveRateLimiter:
+    """A TokenBucket whose rate follows the errors it sees.
+
+    The rate creeps up by increase_step after every increase_after successes
+    in a row, and is multiplied by decrease_factor on each error, staying
+    between min_rate and max_rate. Useful for APIs like YouTube Music that
+    publish no limit and just start failing when called too fast.
+    """
+
+    def __init__(
+        self,
+        initial_rate: float,
+        min_rate: float,
+        max_rate: float,
+        increase_step: float = 0.25,
+        increase_after: int = 10,
+        decrease_factor: float = 0.5,
+        error_pause_seconds: float = 1.0,
+        clock=time.monotonic,
+    ):
+        assert 0 < min_rate <= initial_rate <= max_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.increase_after = increase_after
+        self.decrease_factor = decrease_factor
+        self.error_pause_seconds = error_pause_seconds
+        self.bucket = TokenBucket(initial_rate, capacity=1, clock=clock)
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def acquire(self):
+        self.bucket.acquire()
+
+    async def acquire_async(self):
+        await self.bucket.acquire_async()
+
+    def on_success(self):
+        with self._lock:
+            self._successes += 1
+            if self._successes >= self.increase_after:
+                self._successes = 0
+                self.bucket.set_rate(min(self.max_rate, self.rate + self.increase_step))
+
+    def on_error(self, retry_after: float | None = None):
+        with self._lock:
+            self._successes = 0
+            self.bucket.set_rate(max(self.min_rate, self.rate * self.decrease_factor))
+        pause = self.error_pause_seconds if retry_after is None else retry_after
+        if pause:
+            self.bucket.pause(pause)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Caps the requests in flight at a limit found by AIMD, for asyncio code.
+
+    After limit healthy responses in a row (no error, and latency within
+    latency_tolerance times the fastest seen) the limit grows by
+    increase_step. An overload multiplies it by decrease_factor and pauses
+    new requests for retry_after seconds. Overloads of requests started
+    before the last decrease were sent at the old limit, so they pause but
+    don't decrease again.
+
+    acquire_async returns the start time to pass back to exactly one of
+    on_success, on_overload or on_error. The current limit, requests in
+    flight and queue depth are kept in stats.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        increase_step: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 3.0,
+        overload_pause_seconds: float = 1.0,
+        stats: Counter | None = None,
+        clock=time.monotonic,
+    ):
+        assert 1 <= min_limit <= initial_limit <= max_limit
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.overload_pause_seconds = overload_pause_seconds
+        self.stats = stats if stats is not None else Counter()
+        self.clock = clock
+        self.in_flight = 0
+        self.queue_depth = 0
+        self._waiters = deque()
+        self._successes = 0
+        self._fastest = None
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._record()
+
+    def _record(self):
+        self.stats["concurrency_limit"] = int(self.limit)
+        self.stats["in_flight"] = self.in_flight
+        self.stats["queue_depth"] = self.queue_depth
+        self.stats["peak_concurrency_limit"] = max(self.stats["peak_concurrency_limit"], int(self.limit))
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+        self.stats["peak_queue_depth"] = max(self.stats["peak_queue_depth"], self.queue_depth)
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def acquire_async(self) -> float:
+        self.queue_depth += 1
+        self._record()
+        try:
+            while True:
+                pause = self._paused_until - self.clock()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                if self.in_flight < int(self.limit):
+                    break
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                try:
+                    await waiter
+                except asyncio.CancelledError:
+                    # Pass on a wakeup this task can no longer use
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                    self._wake()
+                    raise
+        finally:
+            self.queue_depth -= 1
+        self.in_flight += 1
+        self._record()
+        return self.clock()
+
+    def _release(self, started: float) -> float:
+        self.in_flight -= 1
+        return self.clock() - started
+
+    def on_success(self, started: float):
+        latency = self._release(started)
+        if self._fastest is None or latency < self._fastest:
+            self._fastest = latency
+        if latency > self._fastest * self.latency_tolerance:
+            self._successes = 0
+            self.stats["slow_responses"] += 1
+        else:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self._successes = 0
+                self.limit = min(float(self.max_limit), self.limit + self.increase_step)
+                self.stats["limit_increases"] += 1
+        self._wake()
+        self._record()
+
+    def on_overload(self, started: float, retry_after: float | None = None):
+        self._release(started)
+        self._successes = 0
+        self.stats["overloads"] += 1
+        now = self.clock()
+        if started > self._last_decrease:
+            self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+            self._last_decrease = now
+            self.stats["limit_decreases"] += 1
+        pause = self.overload_pause_seconds if retry_after is None else retry_after
+        self._paused_until = max(self._paused_until, now + pause)
+        self._wake()
+        self._record()
+
+    def on_error(self, started: float):
+        self._release(started)
+        self._successes = 0
+        self.stats["errors"] += 1
+        self._wake()
+        self._record()
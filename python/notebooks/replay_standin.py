@@ -0,0 +1,393 @@
+"""Record/replay stand-in for every API the enrichment stages call.
+
+Serves Spotify, Apple Music, YouTube Music and Anthropic responses from the
+API cache store, so the whole pipeline can run and be benchmarked offline,
+without secrets and reproducibly. Latency, jitter and random 429/5xx
+responses come from StandInServer.
+
+Responses are answered from, in order:
+
+1. recordings: exact requests captured earlier in record mode
+2. the pipeline's own caches: Spotify searches, tracks and artists, Apple
+   Music songs by ISRC, YouTube Music song and video searches, and quote
+   extractions, including reviews packed several to a request
+3. in record mode, the real API, whose answer is recorded for next time
+
+Anything else gets the API's "nothing found" answer, or a 404 from
+Anthropic. Apple Music text searches can only be replayed from recordings,
+since the cache keys don't keep the search term.
+
+Anthropic Message Batches are always served locally (see
+anthropic_batch_standin): each request is answered like a live message
+from the quote cache, and errored if it isn't cached.
+
+Each service lives under its own path prefix. The pipeline picks these up
+from API_STANDIN_URL:
+
+    python replay_standin.py serve --port 8765 --latency-ms 100 --rate-429 0.05
+    API_STANDIN_URL=http://127.0.0.1:8765/ jupyter nbconvert --execute ...
+
+The stand-in only reads the store it serves, apart from recordings in
+record mode. A pipeline run against it uses pipeline_store(), a fresh copy
+of the real store: its "nothing found" answers for misses are cached in
+the copy, so they never reach the negative caches real runs read.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import closing
+from urllib.parse import urlencode
+
+import requests
+
+import api_cache
+import quote_packing
+from anthropic_batch_standin import BATCHES_PATH, MessageBatches, tool_use_message
+from api_cache import CacheStore
+from spotify_batch import SPOTIFY_MAX_IDS_PER_REQUEST
+from spotify_cache import SpotifyCache
+from standin_server import StandInServer
+
+RECORDINGS_NAMESPACE = "standin_recordings"
+
+# The pipeline's cache store when it runs against the stand-in
+PIPELINE_STORE_FILENAME = "caches/api_cache.standin.sqlite3"
+
+UPSTREAMS = {
+    "spotify": "https://api.spotify.com/",
+    "apple": "https://api.music.apple.com/",
+    "anthropic": "https://api.anthropic.com/",
+}
+
+# Request headers passed through to the real API in record mode
+FORWARDED_HEADERS = ("Authorization", "x-api-key", "anthropic-version", "anthropic-beta", "Content-Type")
+
+# As in make_apple_music_isrc_cache_key in the notebook
+APPLE_MUSIC_ISRC_KEY_PREFIX = "isrc:"
+
+# make_extract_quote_prompt ends with this followed by the review
+QUOTE_PROMPT_REVIEW_MARKER = quote_packing.REVIEW_MARKER
+
+YOUTUBE_NAMESPACES = {
+    "songs": api_cache.YOUTUBE_MUSIC_SEARCH_NAMESPACE,
+    "videos": api_cache.YOUTUBE_VIDEO_SEARCH_NAMESPACE,
+}
+
+
+def service_url(base_url: str, service: str) -> str:
+    """The URL a client should use for service on a stand-in at base_url."""
+    base_url = base_url if base_url.endswith("/") else base_url + "/"
+    return {
+        "spotify": base_url + "spotify/v1/",
+        "apple": base_url + "apple/v1/",
+        "ytmusic": base_url + "ytmusic/",
+        # The Anthropic SDK appends /v1/messages itself
+        "anthropic": base_url + "anthropic",
+    }[service]
+
+
+def pipeline_store(
+    source=api_cache.API_CACHE_FILENAME, filename=PIPELINE_STORE_FILENAME, **kwargs
+) -> CacheStore:
+    """A CacheStore at filename holding a copy of source, replacing any earlier copy."""
+    for path in (filename, filename + "-wal", filename + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    if os.path.exists(source):
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with closing(sqlite3.connect(source)) as source_conn, closing(sqlite3.connect(filename)) as copy:
+            source_conn.backup(copy)
+    return CacheStore(filename, **kwargs)
+
+
+def request_signature(method: str, path: str, params: dict, body: bytes) -> str:
+    """Identifies a request regardless of parameter order or JSON formatting."""
+    query = sorted((k, v) for k, values in params.items() for v in values)
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True).encode("utf-8")
+        except ValueError:
+            pass
+    digest = hashlib.sha256(body).hexdigest()[:16] if body else "-"
+    return f"{method} {path}?{urlencode(query)} {digest}"
+
+
+def prompt_text(message_request: dict) -> str:
+    """Text of the last user message of an Anthropic messages request."""
+    content = message_request["messages"][-1]["content"]
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+class ReplayStandIn(StandInServer):
+    def __init__(self, store: CacheStore, record=False, upstreams=None, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.record = record
+        self.upstreams = dict(UPSTREAMS if upstreams is None else upstreams)
+        self.recordings = store.namespace(RECORDINGS_NAMESPACE)
+        self.spotify = SpotifyCache(store)
+        self.spotify_artists = store.namespace(api_cache.SPOTIFY_ARTIST_NAMESPACE)
+        self.apple_music = store.namespace(api_cache.APPLE_MUSIC_NAMESPACE)
+        self.youtube = {f: store.namespace(ns) for f, ns in YOUTUBE_NAMESPACES.items()}
+        self.quotes = store.namespace(api_cache.ANTHROPIC_EXTRACT_QUOTE_NAMESPACE)
+        self._quotes_by_review = None
+        self._message_ids = itertools.count(1)
+        self.batches = MessageBatches(self._replay_message)
+        self.session = requests.Session()
+
+    def stop(self):
+        super().stop()
+        self.recordings.flush()
+        self.session.close()
+
+    def url(self, service: str) -> str:
+        return service_url(self.base_url, service)
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+
+    def route(self, handler, parts, params):
+        if not parts or parts[0] not in ("spotify", "apple", "ytmusic", "anthropic"):
+            return self.not_found(handler)
+        service, rest = parts[0], parts[1:]
+        if service == "anthropic" and rest[:3] == BATCHES_PATH:
+            return self.batches.route(self, handler, rest, self.url("anthropic"))
+        method = handler.command
+        signature = request_signature(method, "/".join(parts), params, handler.body)
+
+        recorded = self.recordings.get(signature)
+        if recorded is not None:
+            self.count(f"{service}.recorded")
+            return self.send(handler, recorded["status"], recorded["body"])
+
+        replay = getattr(self, f"replay_{service}")
+        body = replay(rest, params, handler.body)
+        if body is not None:
+            self.count(f"{service}.cached")
+            return self.send(handler, 200, body)
+
+        if self.record and service in self.upstreams:
+            return self._proxy(handler, service, rest, params, signature)
+
+        self.count(f"{service}.missing")
+        if service == "anthropic":
+            return self.send(handler, 404, self.error_body(404, "No cached response"))
+        return self.send(handler, 200, self.empty_response(service, rest, params))
+
+    def _proxy(self, handler, service, rest, params, signature):
+        url = self.upstreams[service] + "/".join(rest)
+        headers = {h: handler.headers[h] for h in FORWARDED_HEADERS if h in handler.headers}
+        response = self.session.request(
+            handler.command,
+            url,
+            params=[(k, v) for k, values in params.items() for v in values],
+            data=handler.body or None,
+            headers=headers,
+            timeout=60,
+        )
+        self.count(f"{service}.proxied")
+        body = response.json() if response.content else {}
+        # Errors and rate limits aren't worth replaying
+        if response.status_code == 200:
+            self.recordings[signature] = {"status": 200, "body": body, "recorded_at": time.time()}
+        headers = {"Retry-After": response.headers["Retry-After"]} if "Retry-After" in response.headers else {}
+        return self.send(handler, response.status_code, body, headers)
+
+    def empty_response(self, service, rest, params):
+        if service == "spotify" and rest[-1:] == ["search"]:
+            return {"tracks": {"items": [], "total": 0}}
+        if service == "spotify" and len(rest) == 2:
+            return {rest[1]: [None for _ in params.get("ids", [""])[0].split(",")]}
+        if service == "apple" and rest[-1:] == ["search"]:
+            return {"results": {}}
+        if service == "apple":
+            return {"data": []}
+        return []
+
+    # ------------------------------------------------------------------
+    # Cache-backed responses; None means not cached
+    # ------------------------------------------------------------------
+
+    def replay_spotify(self, rest, params, body):
+        if rest[:1] != ["v1"] or len(rest) < 2:
+            return None
+        resource = rest[1]
+        if resource == "search":
+            query = params.get("q", [""])[0]
+            if query not in self.spotify:
+                return None
+            limit = int(params.get("limit", ["10"])[0])
+            items = self.spotify[query]["tracks"]["items"][:limit]
+            return {"tracks": {"items": items, "total": len(items)}}
+
+        if resource not in ("tracks", "artists"):
+            return None
+        lookup = self.spotify.item if resource == "tracks" else self.spotify_artists.get
+        if len(rest) > 2:
+            return lookup(rest[2])
+        ids = params.get("ids", [""])[0].split(",")
+        if len(ids) > SPOTIFY_MAX_IDS_PER_REQUEST:
+            return None
+        found = [lookup(i) for i in ids]
+        if not any(found):
+            return None
+        return {resource: found}
+
+    def replay_apple(self, rest, params, body):
+        if rest[:2] != ["v1", "catalog"] or rest[-1:] != ["songs"]:
+            return None
+        isrcs = params.get("filter[isrc]", [""])[0].split(",")
+        keys = [APPLE_MUSIC_ISRC_KEY_PREFIX + isrc for isrc in isrcs]
+        found = self.apple_music.get_many(keys)
+        if not found:
+            return None
+        return {"data": [found[k] for k in keys if k in found]}
+
+    def replay_ytmusic(self, rest, params, body):
+        if rest != ["search"]:
+            return None
+        search_filter = params.get("filter", ["songs"])[0]
+        namespace = self.youtube.get(search_filter)
+        if namespace is None:
+            return None
+        return namespace.get(params.get("query", [""])[0])
+
+    def _quote_index(self):
+        if self._quotes_by_review is None:
+            index = defaultdict(list)
+            for value in self.quotes.values():
+                index[value["review"].strip()].append(value)
+            self._quotes_by_review = index
+        return self._quotes_by_review
+
+    def replay_anthropic(self, rest, params, body):
+        if rest != ["v1", "messages"] or not body:
+            return None
+        message_request = json.loads(body)
+        text = prompt_text(message_request)
+        model = message_request.get("model")
+        packed = quote_packing.parse_packed_prompt(text)
+        if packed:
+            # Packed reviews that aren't cached are left out, as if the
+            # model had skipped them
+            extractions = []
+            for number, header, review in packed:
+                cached = self._cached_quote(review, header, model)
+                if cached is not None:
+                    extractions.append({"review_id": number, **quote_tool_input(cached)})
+            if not extractions:
+                return None
+            return self.tool_use_message(message_request, {"extractions": extractions})
+        if QUOTE_PROMPT_REVIEW_MARKER not in text:
+            return None
+        review = text.rsplit(QUOTE_PROMPT_REVIEW_MARKER, 1)[1]
+        cached = self._cached_quote(review, text, model)
+        if cached is None:
+            return None
+        return self.tool_use_message(message_request, quote_tool_input(cached))
+
+    def _cached_quote(self, review: str, song_text: str, model: str | None) -> dict | None:
+        """A cached extraction of review for the song named in song_text."""
+        candidates = [
+            c
+            for c in self._quote_index().get(review.strip(), [])
+            if c["artist"] in song_text and c["name"] in song_text
+        ]
+        if not candidates:
+            return None
+        # Results cached before the model was recorded match any model
+        candidates.sort(key=lambda c: c.get("model") != model)
+        return candidates[0]
+
+    def _replay_message(self, message_request: dict) -> dict | None:
+        return self.replay_anthropic(["v1", "messages"], {}, json.dumps(message_request).encode("utf-8"))
+
+    def tool_use_message(self, message_request: dict, tool_input: dict) -> dict:
+        return tool_use_message(message_request, tool_input, f"msg_replay_{next(self._message_ids):06d}")
+
+
+def quote_tool_input(result: dict) -> dict:
+    """QuoteExtraction fields from a cached quote extraction result."""
+    return {
+        "quote": result["extracted_quote"] or "",
+        "is_usable": result["is_usable"],
+        "issue": result["issue"],
+    }
+
+
+class ReplayYTMusic:
+    """The part of ytmusicapi.YTMusic the pipeline uses, backed by a stand-in.
+
+    ytmusicapi has no way to change its API URL, so searches go to the
+    stand-in's /ytmusic/search endpoint instead.
+    """
+
+    def __init__(self, url: str, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def search(self, query, filter=None, limit=20, **kwargs):
+        params = {"query": query, "limit": limit}
+        if filter:
+            params["filter"] = filter
+        response = self.session.get(self.url + "search", params=params, timeout=self.timeout)
+        # Like ytmusicapi, errors raise so the RequestScheduler retries them
+        response.raise_for_status()
+        return response.json()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay API responses from the cache store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Run the stand-in until interrupted")
+    serve.add_argument(
+        "--db", default=api_cache.API_CACHE_FILENAME, help="Store to serve; only --record writes to it"
+    )
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--latency-ms", type=float, default=0.0)
+    serve.add_argument("--jitter-ms", type=float, default=0.0)
+    serve.add_argument("--rate-429", type=float, default=0.0)
+    serve.add_argument("--rate-5xx", type=float, default=0.0)
+    serve.add_argument("--retry-after", type=float, default=1.0)
+    serve.add_argument("--seed", type=int, default=0)
+    serve.add_argument("--record", action="store_true", help="Fetch and record cache misses")
+    args = parser.parse_args(argv)
+
+    store = CacheStore(args.db)
+    standin = ReplayStandIn(
+        store,
+        record=args.record,
+        latency_seconds=args.latency_ms / 1000.0,
+        jitter_seconds=args.jitter_ms / 1000.0,
+        error_rates={429: args.rate_429, 503: args.rate_5xx},
+        retry_after_seconds=args.retry_after,
+        seed=args.seed,
+    )
+    standin.start(port=args.port)
+    print(f"Serving {args.db} at {standin.base_url}")
+    for service in ("spotify", "apple", "ytmusic", "anthropic"):
+        print(f"  {service:>9}: {standin.url(service)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.stop()
+        print(dict(standin.requests))
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
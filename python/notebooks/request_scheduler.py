@@ -0,0 +1,91 @@
+"""Worker pool for rate-limited API calls with in-flight deduplication.
+
+ytmusicapi has no rate limit handling of its own, so the notebook slept a
+fixed 0.5 s after every search. RequestScheduler runs calls on a small
+thread pool paced by an AdaptiveRateLimiter: errors slow it down and are
+retried with backoff, and a run of successes speeds it back up. Calls
+submitted with the same key while one is still in flight share its result.
+
+    scheduler = RequestScheduler(max_workers=4)
+    future = scheduler.submit(("songs", query), yt.search, query, filter="songs")
+"""
+
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+
+from rate_limit import AdaptiveRateLimiter
+
+DEFAULT_YOUTUBE_MAX_WORKERS = 4
+DEFAULT_YOUTUBE_INITIAL_RATE = 2.0
+DEFAULT_YOUTUBE_MIN_RATE = 0.5
+DEFAULT_YOUTUBE_MAX_RATE = 8.0
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        max_workers=DEFAULT_YOUTUBE_MAX_WORKERS,
+        limiter: AdaptiveRateLimiter | None = None,
+        max_retries=3,
+        retry_backoff_seconds=1.0,
+        metrics=None,
+        stats: Counter | None = None,
+    ):
+        self.limiter = limiter or AdaptiveRateLimiter(
+            DEFAULT_YOUTUBE_INITIAL_RATE, DEFAULT_YOUTUBE_MIN_RATE, DEFAULT_YOUTUBE_MAX_RATE
+        )
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.metrics = metrics
+        self.stats = stats if stats is not None else Counter()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._in_flight: dict = {}
+        self._lock = threading.Lock()
+
+    def _run(self, endpoint, func, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                with self.metrics.api_call(endpoint) if self.metrics else nullcontext():
+                    result = func(*args, **kwargs)
+            except Exception:
+                self.limiter.on_error()
+                with self._lock:
+                    self.stats["request_errors"] += 1
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.retry_backoff_seconds * 2**attempt)
+                continue
+            self.limiter.on_success()
+            return result
+
+    def submit(self, key, func, *args, endpoint=None, **kwargs) -> Future:
+        """Schedules func(*args, **kwargs), sharing a pending call with the same key."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.stats["deduplicated_requests"] += 1
+                return future
+            self.stats["requests"] += 1
+            future = self._executor.submit(
+                self._run, endpoint or getattr(func, "__name__", "request"), func, args, kwargs
+            )
+            self._in_flight[key] = future
+
+        def forget(done, key=key):
+            with self._lock:
+                if self._in_flight.get(key) is done:
+                    del self._in_flight[key]
+
+        future.add_done_callback(forget)
+        return future
+
+    def call(self, key, func, *args, endpoint=None, **kwargs):
+        """submit() and wait for the result."""
+        return self.submit(key, func, *args, endpoint=endpoint, **kwargs).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
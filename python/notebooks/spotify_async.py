@@ -0,0 +1,168 @@
+"""Asyncio Spotify search client.
+
+search_spotify waits out a full round-trip for every listing. This client
+runs many searches at once while staying polite:
+
+- a shared TokenBucket caps the request rate
+- a semaphore bounds the number of requests in flight
+- a 429 pauses the bucket for Retry-After seconds before retrying
+- identical queries (create_clean_spotify_query often produces the same
+  string for the same song from different publications) are fetched once
+
+HTTP goes through a pooled requests.Session on worker threads, so there are
+no new dependencies. Results are returned to the caller, who stores them in
+the existing cache with update_spotify_cache.
+"""
+
+import asyncio
+import random
+from collections import Counter
+from contextlib import nullcontext
+
+import requests
+
+from rate_limit import TokenBucket, parse_retry_after
+
+SPOTIFY_API_PREFIX = "https://api.spotify.com/v1/"
+
+# Spotify doesn't publish its limit; this stays well under what a
+# client-credentials app gets over its rolling 30 second window.
+DEFAULT_SPOTIFY_RATE_PER_SECOND = 8.0
+DEFAULT_SPOTIFY_MAX_IN_FLIGHT = 8
+DEFAULT_MAX_RETRIES = 5
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class SpotifyRequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Spotify returned {status}: {message}")
+        self.status = status
+
+
+class AsyncSpotifySearchClient:
+    """Concurrent, rate-limited Spotify track search.
+
+    token_provider returns a bearer token and is called on a worker thread,
+    e.g. lambda: auth_manager.get_access_token(as_dict=False).
+    """
+
+    def __init__(
+        self,
+        token_provider,
+        prefix=SPOTIFY_API_PREFIX,
+        rate_per_second=DEFAULT_SPOTIFY_RATE_PER_SECOND,
+        max_in_flight=DEFAULT_SPOTIFY_MAX_IN_FLIGHT,
+        max_retries=DEFAULT_MAX_RETRIES,
+        bucket: TokenBucket | None = None,
+        metrics=None,
+        stats: Counter | None = None,
+        timeout=10,
+    ):
+        self.token_provider = token_provider
+        self.prefix = prefix
+        self.bucket = bucket or TokenBucket(rate_per_second)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self.stats = stats if stats is not None else Counter()
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_in_flight
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._loop = None
+        self._semaphore = None
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    def close(self):
+        self.session.close()
+
+    def _get(self, params):
+        headers = {"Authorization": f"Bearer {self.token_provider()}"}
+        return self.session.get(
+            self.prefix + "search", params=params, headers=headers, timeout=self.timeout
+        )
+
+    async def _fetch(self, query, limit, market):
+        params = {"q": query, "type": "track", "market": market, "limit": limit}
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire_async()
+            async with self._semaphore:
+                with self.metrics.api_call("spotify.search") if self.metrics else nullcontext():
+                    response = await asyncio.to_thread(self._get, params)
+
+            if response.status_code == 429:
+                wait = parse_retry_after(response.headers.get("Retry-After"))
+                self.stats["retry_after_waits"] += 1
+                self.bucket.pause(wait)
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                self.stats["server_error_retries"] += 1
+                await asyncio.sleep(min(30.0, 2**attempt + random.random()))
+                continue
+            if response.status_code != 200:
+                raise SpotifyRequestError(response.status_code, response.text[:200])
+
+            results = response.json()
+            if results and results.get("tracks") and results["tracks"]["items"]:
+                return results
+            self.stats["main_api_queries_not_found"] += 1
+            return None
+
+        raise SpotifyRequestError(429, f"still rate limited after {self.max_retries} retries")
+
+    async def search(self, query: str, limit=1, market="US"):
+        """Search results for query, or None if nothing was found."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Semaphores and futures belong to one event loop
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._in_flight = {}
+
+        key = f"{market}|{limit}|{query}"
+        if key in self._in_flight:
+            self.stats["coalesced_queries"] += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        future = loop.create_future()
+        self._in_flight[key] = future
+        self.stats["main_api_queries"] += 1
+        try:
+            results = await self._fetch(query, limit, market)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved, or asyncio warns when no other caller was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(results)
+            return results
+        finally:
+            del self._in_flight[key]
+
+    async def search_many(self, queries, limit=1, market="US", on_result=None) -> dict:
+        """Runs every query concurrently. Returns {query: results or None}.
+
+        on_result(query, results) is called as each query finishes, so results
+        can be cached even if a later query fails.
+        """
+
+        async def one(query):
+            results = await self.search(query, limit=limit, market=market)
+            if on_result is not None:
+                on_result(query, results)
+            return query, results
+
+        pairs = await asyncio.gather(*(one(q) for q in queries))
+        return dict(pairs)
+
+
+def run_search_many(client: AsyncSpotifySearchClient, queries, **kwargs) -> dict:
+    """search_many for code without a running event loop."""
+    return asyncio.run(client.search_many(queries, **kwargs))
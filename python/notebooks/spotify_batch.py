@@ -0,0 +1,94 @@
+"""Batched Spotify track and artist lookups.
+
+The Web API's `tracks` and `artists` endpoints accept up to 50 IDs per
+request, but the notebook fetched one track (sp.track) or one artist
+(sp.artist) per call. These helpers take every ID that missed the cache,
+dedupe them and fetch them in as few requests as possible. The notebook's
+per-song loops then run entirely from cache.
+"""
+
+from collections import Counter
+from contextlib import nullcontext
+
+SPOTIFY_MAX_IDS_PER_REQUEST = 50
+
+
+def chunked(values, size):
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def unique_ids(ids) -> list[str]:
+    """Drops empty and NaN IDs and duplicates, keeping the first-seen order."""
+    seen = set()
+    result = []
+    for spotify_id in ids:
+        # NaN != NaN, so this also skips pandas' missing values
+        if not spotify_id or spotify_id != spotify_id or spotify_id in seen:
+            continue
+        seen.add(spotify_id)
+        result.append(spotify_id)
+    return result
+
+
+def _fetch_batched(request, ids, response_key, endpoint, metrics, stats, batch_size):
+    found = {}
+    for chunk in chunked(unique_ids(ids), batch_size):
+        stats[f"{response_key}_batch_requests"] += 1
+        with metrics.api_call(endpoint) if metrics is not None else nullcontext():
+            response = request(chunk)
+        # The response lists results in request order, with None for unknown IDs
+        for spotify_id, result in zip(chunk, response[response_key]):
+            if result is None or "id" not in result:
+                stats[f"{response_key}_batch_not_found"] += 1
+                continue
+            found[spotify_id] = result
+    return found
+
+
+def fetch_tracks(
+    sp,
+    ids,
+    market="US",
+    metrics=None,
+    stats: Counter | None = None,
+    batch_size=SPOTIFY_MAX_IDS_PER_REQUEST,
+) -> dict:
+    """Returns {requested ID: track item} using sp.tracks in batches.
+
+    The returned item's "id" can differ from the requested ID when Spotify
+    has relinked the track.
+    """
+    return _fetch_batched(
+        lambda chunk: sp.tracks(chunk, market=market),
+        ids,
+        "tracks",
+        "spotify.tracks",
+        metrics,
+        stats if stats is not None else Counter(),
+        batch_size,
+    )
+
+
+def fetch_artists(
+    sp,
+    ids,
+    metrics=None,
+    stats: Counter | None = None,
+    batch_size=SPOTIFY_MAX_IDS_PER_REQUEST,
+) -> dict:
+    """Returns {requested ID: artist} using sp.artists in batches."""
+    return _fetch_batched(
+        sp.artists,
+        ids,
+        "artists",
+        "spotify.artists",
+        metrics,
+        stats if stats is not None else Counter(),
+        batch_size,
+    )
+
+
+def missing_ids(ids, is_cached) -> list[str]:
+    """The unique IDs for which is_cached(id) is False."""
+    return [spotify_id for spotify_id in unique_ids(ids) if not is_cached(spotify_id)]
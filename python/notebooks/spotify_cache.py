@@ -0,0 +1,198 @@
+"""Normalized Spotify search cache.
+
+The old cache mapped every query string to the full search response, so the
+same track item was stored again for its `id:` query, its year-filtered text
+query and its manual-override hydration. This splits it into:
+
+- an item table keyed by Spotify ID (each track stored once)
+- a query -> [Spotify IDs] index
+- secondary indexes by ISRC, by primary (artist0) artist ID, and from
+  Spotify ID back to the queries that returned it
+
+SpotifyCache still behaves like the old dict of query -> search response, so
+search_spotify_with_query and friends don't need to change, but
+debug_spotify_cache style lookups by ID or ISRC no longer scan everything.
+"""
+
+from collections.abc import MutableMapping
+from contextlib import ExitStack, contextmanager
+
+from api_cache import SPOTIFY_NAMESPACE, CacheStore, open_cache
+
+SPOTIFY_ITEMS_NAMESPACE = "spotify_items"
+SPOTIFY_QUERIES_NAMESPACE = "spotify_queries"
+SPOTIFY_ISRC_INDEX_NAMESPACE = "spotify_isrc_index"
+SPOTIFY_ARTIST0_INDEX_NAMESPACE = "spotify_artist0_index"
+SPOTIFY_ID_TO_QUERIES_NAMESPACE = "spotify_id_to_queries"
+
+
+def item_isrc(item: dict) -> str | None:
+    return (item.get("external_ids") or {}).get("isrc")
+
+
+def item_artist0_id(item: dict) -> str | None:
+    artists = item.get("artists") or []
+    return artists[0]["id"] if artists else None
+
+
+def _append_unique(namespace, key, value):
+    values = namespace.get(key, [])
+    if value not in values:
+        namespace[key] = values + [value]
+
+
+class SpotifyCache(MutableMapping):
+    """Query -> search response mapping backed by normalized tables."""
+
+    def __init__(self, store: CacheStore):
+        self.store = store
+        self.items_by_id = store.namespace(SPOTIFY_ITEMS_NAMESPACE)
+        self.query_ids = store.namespace(SPOTIFY_QUERIES_NAMESPACE)
+        self.isrc_ids = store.namespace(SPOTIFY_ISRC_INDEX_NAMESPACE)
+        self.artist0_ids = store.namespace(SPOTIFY_ARTIST0_INDEX_NAMESPACE)
+        self.id_queries = store.namespace(SPOTIFY_ID_TO_QUERIES_NAMESPACE)
+
+    def _namespaces(self):
+        return [
+            self.items_by_id,
+            self.query_ids,
+            self.isrc_ids,
+            self.artist0_ids,
+            self.id_queries,
+        ]
+
+    # ------------------------------------------------------------------
+    # Query -> response interface
+    # ------------------------------------------------------------------
+
+    def __getitem__(self, query):
+        ids = self.query_ids[query]
+        found = self.items_by_id.get_many(ids)
+        return {"tracks": {"items": [found[i] for i in ids if i in found]}}
+
+    def __contains__(self, query):
+        return query in self.query_ids
+
+    def __setitem__(self, query, results):
+        items = results["tracks"]["items"] if results and results.get("tracks") else []
+        with self.batch():
+            old_ids = self.query_ids.get(query, [])
+            for old_id in old_ids:
+                self._unlink_query(old_id, query)
+            ids = []
+            for item in items:
+                self.add_item(item)
+                ids.append(item["id"])
+                _append_unique(self.id_queries, item["id"], query)
+            self.query_ids[query] = ids
+
+    def __delitem__(self, query):
+        with self.batch():
+            for spotify_id in self.query_ids[query]:
+                self._unlink_query(spotify_id, query)
+            del self.query_ids[query]
+
+    def __iter__(self):
+        return iter(self.query_ids)
+
+    def __len__(self):
+        return len(self.query_ids)
+
+    def _unlink_query(self, spotify_id, query):
+        queries = [q for q in self.id_queries.get(spotify_id, []) if q != query]
+        self.id_queries[spotify_id] = queries
+
+    # ------------------------------------------------------------------
+    # Items and secondary indexes
+    # ------------------------------------------------------------------
+
+    def add_item(self, item: dict):
+        """Stores a track item and indexes it, without tying it to a query."""
+        spotify_id = item["id"]
+        with self.batch():
+            self.items_by_id[spotify_id] = item
+            isrc = item_isrc(item)
+            if isrc:
+                _append_unique(self.isrc_ids, isrc, spotify_id)
+            artist0_id = item_artist0_id(item)
+            if artist0_id:
+                _append_unique(self.artist0_ids, artist0_id, spotify_id)
+
+    def item(self, spotify_id: str) -> dict | None:
+        return self.items_by_id.get(spotify_id)
+
+    def ids_for_isrc(self, isrc: str) -> list[str]:
+        return list(self.isrc_ids.get(isrc, []))
+
+    def ids_for_artist0(self, artist0_id: str) -> list[str]:
+        return list(self.artist0_ids.get(artist0_id, []))
+
+    def queries_for_id(self, spotify_id: str) -> list[str]:
+        return list(self.id_queries.get(spotify_id, []))
+
+    def find(self, spotify_id: str | None = None, isrc: str | None = None):
+        """Yields (query, results) whose top item matches spotify_id or isrc."""
+        assert spotify_id is not None or isrc is not None
+        ids = []
+        if spotify_id is not None:
+            ids.append(spotify_id)
+        if isrc is not None:
+            ids.extend(i for i in self.ids_for_isrc(isrc) if i not in ids)
+
+        seen = set()
+        for i in ids:
+            for query in self.queries_for_id(i):
+                if query in seen:
+                    continue
+                seen.add(query)
+                results = self[query]
+                top = results["tracks"]["items"][0] if results["tracks"]["items"] else None
+                if top is None:
+                    continue
+                if (spotify_id is not None and top["id"] == spotify_id) or (
+                    isrc is not None and item_isrc(top) == isrc
+                ):
+                    yield query, results
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def batch(self):
+        with ExitStack() as stack:
+            for namespace in self._namespaces():
+                stack.enter_context(namespace.batch())
+            yield self
+
+    def flush(self):
+        for namespace in self._namespaces():
+            namespace.flush()
+
+    def import_query_cache(self, legacy) -> int:
+        """Copies an old query -> response mapping into the normalized tables."""
+        count = 0
+        with self.batch():
+            for query, results in legacy.items():
+                self[query] = results
+                count += 1
+        return count
+
+
+def open_spotify_cache(store: CacheStore, legacy_json_filename: str | None = None) -> SpotifyCache:
+    """Opens the normalized cache, migrating the old query -> response cache once.
+
+    The old cache is read from the un-normalized store namespace if present,
+    otherwise from the legacy JSON file. The un-normalized namespace is
+    cleared after migrating since every entry in it is now duplicated.
+    """
+    cache = SpotifyCache(store)
+    if len(cache.query_ids) > 0:
+        return cache
+
+    legacy = open_cache(store, SPOTIFY_NAMESPACE, legacy_json_filename)
+    if len(legacy) > 0:
+        count = cache.import_query_cache(legacy)
+        print(f"Normalized {count} Spotify queries into {len(cache.items_by_id)} items")
+        legacy.clear()
+    return cache
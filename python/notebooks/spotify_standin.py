@@ -0,0 +1,178 @@
+"""Local stand-in for the Spotify Web API.
+
+spotipy can be pointed at the stand-in through sp.prefix, so the real
+client code can be benchmarked without credentials or network access and
+without using up the real API's rate limit.
+
+    python spotify_standin.py bench --ids 500 --latency-ms 20
+    python spotify_standin.py bench-search --queries 200 --latency-ms 100
+"""
+
+import argparse
+import time
+
+from spotify_batch import SPOTIFY_MAX_IDS_PER_REQUEST
+from standin_server import StandInServer
+
+
+def make_fake_track(index: int) -> dict:
+    return {
+        "id": f"track{index:06d}",
+        "name": f"Song {index}",
+        "artists": [{"id": f"artist{index % 97:04d}", "name": f"Artist {index % 97}"}],
+        "album": {"name": f"Album {index}", "images": []},
+        "external_ids": {"isrc": f"USXX1{index:07d}"},
+    }
+
+
+def make_fake_artist(artist_id: str) -> dict:
+    return {"id": artist_id, "name": artist_id, "genres": ["pop"]}
+
+
+class SpotifyStandIn(StandInServer):
+    """Serves tracks, artists and search results from in-memory dicts.
+
+    searches maps a query string to the list of track IDs it returns.
+    """
+
+    def __init__(self, tracks=None, artists=None, searches=None, latency_seconds=0.0):
+        super().__init__(latency_seconds)
+        self.tracks = dict(tracks or {})
+        self.artists = dict(artists or {})
+        self.searches = dict(searches or {})
+
+    @property
+    def url(self) -> str:
+        """API prefix to assign to a spotipy client's .prefix."""
+        return self.base_url + "v1/"
+
+    def route(self, handler, parts, params):
+        if len(parts) < 2 or parts[0] != "v1":
+            return self.not_found(handler)
+
+        resource = parts[1]
+        if resource in ("tracks", "artists"):
+            table = self.tracks if resource == "tracks" else self.artists
+            if len(parts) > 2:
+                self.count(resource[:-1])
+                result = table.get(parts[2])
+                if result is None:
+                    return self.not_found(handler)
+                return self.send(handler, 200, result)
+
+            self.count(resource)
+            ids = params.get("ids", [""])[0].split(",")
+            if len(ids) > SPOTIFY_MAX_IDS_PER_REQUEST:
+                return self.send(handler, 400, self.error_body(400, "Too many ids"))
+            return self.send(handler, 200, {resource: [table.get(i) for i in ids]})
+
+        if resource == "search":
+            self.count("search")
+            query = params.get("q", [""])[0]
+            limit = int(params.get("limit", ["10"])[0])
+            ids = self.searches.get(query, [])[:limit]
+            items = [self.tracks[i] for i in ids if i in self.tracks]
+            return self.send(handler, 200, {"tracks": {"items": items, "total": len(items)}})
+
+        return self.not_found(handler)
+
+
+def make_standin_client(standin: SpotifyStandIn):
+    """A spotipy client that talks to the stand-in instead of Spotify."""
+    import spotipy
+
+    sp = spotipy.Spotify(auth="stand-in-token", retries=0, status_retries=0)
+    sp.prefix = standin.url
+    return sp
+
+
+def benchmark(num_ids: int, latency_ms: float):
+    from spotify_batch import fetch_artists, fetch_tracks
+
+    tracks = {t["id"]: t for t in (make_fake_track(i) for i in range(num_ids))}
+    artist_ids = sorted({t["artists"][0]["id"] for t in tracks.values()})
+    artists = {a: make_fake_artist(a) for a in artist_ids}
+
+    with SpotifyStandIn(tracks, artists, latency_seconds=latency_ms / 1000.0) as standin:
+        sp = make_standin_client(standin)
+        rows = []
+
+        start = time.perf_counter()
+        for track_id in tracks:
+            sp.track(track_id, market="US")
+        for artist_id in artist_ids:
+            sp.artist(artist_id)
+        rows.append(("one per call", standin.total_requests(), time.perf_counter() - start))
+
+        standin.requests.clear()
+        start = time.perf_counter()
+        fetch_tracks(sp, list(tracks))
+        fetch_artists(sp, artist_ids)
+        rows.append(("batched", standin.total_requests(), time.perf_counter() - start))
+
+    print(f"{num_ids} tracks, {len(artist_ids)} artists, {latency_ms} ms latency")
+    for name, requests, seconds in rows:
+        print(f"  {name:>12}: {requests:5d} requests, {seconds:7.2f} s")
+    return rows
+
+
+def benchmark_search(num_queries: int, latency_ms: float, rate: float):
+    from spotify_async import AsyncSpotifySearchClient, run_search_many
+
+    tracks = {t["id"]: t for t in (make_fake_track(i) for i in range(num_queries))}
+    searches = {f"query {i}": [track_id] for i, track_id in enumerate(tracks)}
+    # Listings from different publications often produce the same query
+    queries = list(searches) + list(searches)[: num_queries // 4]
+
+    with SpotifyStandIn(tracks, searches=searches, latency_seconds=latency_ms / 1000.0) as standin:
+        sp = make_standin_client(standin)
+        rows = []
+
+        start = time.perf_counter()
+        cache = {}
+        for query in queries:
+            if query not in cache:
+                cache[query] = sp.search(q=query, type="track", market="US", limit=1)
+        rows.append(("sequential", standin.total_requests(), time.perf_counter() - start))
+
+        standin.requests.clear()
+        client = AsyncSpotifySearchClient(
+            lambda: "stand-in-token", prefix=standin.url, rate_per_second=rate
+        )
+        start = time.perf_counter()
+        run_search_many(client, queries)
+        rows.append(("async", standin.total_requests(), time.perf_counter() - start))
+        client.close()
+
+    print(
+        f"{len(queries)} listings, {num_queries} unique queries, "
+        f"{latency_ms} ms latency, async rate {rate}/s"
+    )
+    for name, requests, seconds in rows:
+        print(f"  {name:>12}: {requests:5d} requests, {seconds:7.2f} s")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Spotify Web API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("bench", help="Compare per-ID and batched lookups")
+    bench.add_argument("--ids", type=int, default=500)
+    bench.add_argument("--latency-ms", type=float, default=20.0)
+    bench_search = subparsers.add_parser(
+        "bench-search", help="Compare sequential and async search"
+    )
+    bench_search.add_argument("--queries", type=int, default=200)
+    bench_search.add_argument("--latency-ms", type=float, default=100.0)
+    bench_search.add_argument("--rate", type=float, default=20.0)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        benchmark(args.ids, args.latency_ms)
+    elif args.command == "bench-search":
+        benchmark_search(args.queries, args.latency_ms, args.rate)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
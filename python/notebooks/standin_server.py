@@ -0,0 +1,164 @@
+"""Base class for the local API stand-in servers.
+
+A stand-in serves canned API responses over real HTTP on a background
+thread, so the real client code can be tested and benchmarked without
+credentials or network access. It counts requests per endpoint, tracks the
+peak number of concurrent requests, can add latency (with optional jitter)
+to every request, and can answer the next requests with queued error
+responses (e.g. a 429 with Retry-After) via inject(). error_rates answers a
+random fraction of requests with each status instead, from a seeded random
+generator so runs are reproducible. concurrency_limit answers requests
+beyond that many in flight with overload_status, like a provider enforcing
+a concurrency limit.
+
+Subclasses implement route(handler, parts, params). POST bodies are
+available as handler.body.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StandInServer:
+    def __init__(
+        self,
+        latency_seconds=0.0,
+        jitter_seconds=0.0,
+        error_rates: dict[int, float] | None = None,
+        retry_after_seconds=1.0,
+        seed=0,
+        concurrency_limit: int | None = None,
+        overload_status=429,
+    ):
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        # e.g. {429: 0.05, 503: 0.01}
+        self.error_rates = dict(error_rates or {})
+        assert sum(self.error_rates.values()) <= 1.0
+        self.retry_after_seconds = retry_after_seconds
+        self.concurrency_limit = concurrency_limit
+        self.overload_status = overload_status
+        self._random = random.Random(seed)
+        self.requests = Counter()
+        self.max_concurrent = 0
+        self._concurrent = 0
+        self._injected = deque()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self, port=0):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                standin._handle(self)
+
+            def do_POST(self):
+                standin._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def total_requests(self) -> int:
+        with self._lock:
+            return sum(self.requests.values())
+
+    def inject(self, status: int, headers: dict | None = None, count: int = 1):
+        """Answers the next count requests with status instead of data."""
+        with self._lock:
+            for _ in range(count):
+                self._injected.append((status, headers or {}))
+
+    def count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def _random_fault(self):
+        """A (status, headers) drawn from error_rates, or None. Call with the lock held."""
+        draw = self._random.random()
+        for status, rate in self.error_rates.items():
+            if draw < rate:
+                headers = {"Retry-After": self.retry_after_seconds} if status == 429 else {}
+                return status, headers
+            draw -= rate
+        return None
+
+    def _handle(self, handler):
+        length = int(handler.headers.get("Content-Length") or 0)
+        handler.body = handler.rfile.read(length) if length else b""
+        with self._lock:
+            self._concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self._concurrent)
+            injected = self._injected.popleft() if self._injected else None
+            if injected is None and self.error_rates:
+                injected = self._random_fault()
+            latency = self.latency_seconds
+            if self.jitter_seconds:
+                latency += self._random.uniform(0, self.jitter_seconds)
+            if injected is None and self.concurrency_limit and self._concurrent > self.concurrency_limit:
+                # Turned away before doing any work
+                injected = (self.overload_status, {"Retry-After": self.retry_after_seconds})
+                latency = 0.0
+        try:
+            if latency:
+                time.sleep(latency)
+            if injected is not None:
+                status, headers = injected
+                self.count(f"injected_{status}")
+                return self.send(handler, status, self.error_body(status, "Injected"), headers)
+            url = urlparse(handler.path)
+            parts = [p for p in url.path.split("/") if p]
+            return self.route(handler, parts, parse_qs(url.query))
+        finally:
+            with self._lock:
+                self._concurrent -= 1
+
+    def route(self, handler, parts: list[str], params: dict):
+        raise NotImplementedError
+
+    def error_body(self, status: int, message: str) -> dict:
+        return {"error": {"status": status, "message": message}}
+
+    def send(self, handler, status, body, headers=None):
+        self.send_bytes(handler, status, json.dumps(body).encode("utf-8"), headers)
+
+    def send_bytes(self, handler, status, data: bytes, headers=None, content_type="application/json"):
+        handler.send_response(status)
+        for name, value in (headers or {}).items():
+            handler.send_header(name, str(value))
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def not_found(self, handler):
+        return self.send(handler, 404, self.error_body(404, "Not found"))
@@ -0,0 +1,120 @@
+"""Text normalization shared by the Spotify, Apple Music and YouTube matchers.
+
+The matchers each had their own nested cleaners, which rebuilt their regexes
+on every call and re-tokenized the same canonical artist and title once per
+candidate result. Here the patterns are compiled once at import, and the
+per-string results are memoized, so each distinct string is cleaned once
+per session:
+
+- clean_query_text: the cleaning create_clean_spotify_query applies to an
+  artist or song name before searching Spotify
+- clean_tokens: the casefolded word set, without metadata and credit noise
+  like "official video" or "feat", that the Apple Music and YouTube Music
+  verifiers compare
+- simplify: casefolded letters and digits only, for containment checks like
+  "lily allen" in "LilyAllenVEVO"
+
+The *_column variants take a pandas Series and clean each distinct value
+once.
+"""
+
+import functools
+import re
+
+import pandas
+
+SINGLE_CHAR_ACRONYM_RE = re.compile(r"(?:[a-zA-Z]\.){2,}")
+
+BRACKETS_RE = re.compile(r"[\(\[].*?[\)\]]")
+
+STRIP_FEATURING_RE = re.compile(r"(?i)\b(feat|ft|featuring)\b.*")
+
+# When we use the year filter, the artist and name search becomes
+# more stringent and can't sem to handle stuff like "Pinkpantheress x Bladee"
+STRIP_ARTIST_COMBINERS_RE = re.compile(r"(?i)\s+([x]|[+]|w/)\s+")
+
+# Metadata noise, then feature/credit noise
+TOKEN_NOISE_RE = re.compile(
+    r"\b(official|video|audio|music video|lyric|lyrics|visualizer|mv|hq|4k|hd|topic|vevo"
+    r"|feat|ft|featuring|with|prod|produced|by)\b"
+)
+NON_TOKEN_RE = re.compile(r"[^a-z0-9\s]")
+NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+
+LIVE_CHECK_RE = re.compile(r"\blive\b")
+
+
+def fix_single_character_acronyms(text):
+    """
+    Converts 's.n.c.' or 'R.E.M.' to 'snc' and 'REM'.
+    Pattern: Single letter followed by a dot, repeated 2 or more times.
+    """
+    # We find the match (e.g., "s.n.c.") and replace it with itself minus dots
+    # as Spotify search doesn't like those.
+    return SINGLE_CHAR_ACRONYM_RE.sub(lambda match: match.group(0).replace(".", ""), text)
+
+
+@functools.cache
+def clean_query_text(text: str) -> str:
+    """An artist or song name cleaned for a Spotify search query."""
+    text = text.replace("’", "'")
+    text = text.replace("…", "...")
+
+    # 1. Remove things in brackets/parentheses like (feat. X) or [Remix]
+    text = BRACKETS_RE.sub("", text)
+    # 2. Remove "feat" or "featuring" and everything after it (case insensitive)
+    text = STRIP_FEATURING_RE.sub("", text)
+
+    text = STRIP_ARTIST_COMBINERS_RE.sub(" ", text)
+
+    text = fix_single_character_acronyms(text)
+
+    # 3. Strip whitespace
+    text = text.strip()
+
+    # Seems like 'and' may act as an operator, not sure about 'or'
+    text = text.casefold().replace(" and ", " & ")
+
+    return text.replace("f*ck", "fuck").replace("p*ssy", "pussy").replace("sh*t", "shit")
+
+
+@functools.cache
+def clean_tokens(text: str | None) -> frozenset[str]:
+    """Casefolded words of text, without metadata and credit noise."""
+    if not text:
+        return frozenset()
+    text = TOKEN_NOISE_RE.sub("", text.casefold())
+    return frozenset(NON_TOKEN_RE.sub(" ", text).split())
+
+
+@functools.cache
+def simplify(text: str) -> str:
+    """Casefolded letters and digits of text, nothing else."""
+    return NON_ALNUM_RE.sub("", text.casefold())
+
+
+def _map_distinct(values: pandas.Series, func) -> pandas.Series:
+    distinct = values.drop_duplicates()
+    return values.map(dict(zip(distinct, map(func, distinct))))
+
+
+def clean_query_column(values: pandas.Series) -> pandas.Series:
+    return _map_distinct(values, clean_query_text)
+
+
+def clean_tokens_column(values: pandas.Series) -> pandas.Series:
+    return _map_distinct(values, clean_tokens)
+
+
+def simplify_column(values: pandas.Series) -> pandas.Series:
+    return values.str.casefold().str.replace(NON_ALNUM_RE, "", regex=True)
+
+
+def cache_stats() -> dict:
+    """Hits and misses of the memoized cleaners, for the metrics report."""
+    stats = {}
+    for func in (clean_query_text, clean_tokens, simplify):
+        info = func.cache_info()
+        stats[f"{func.__name__}.hits"] = info.hits
+        stats[f"{func.__name__}.misses"] = info.misses
+    return stats
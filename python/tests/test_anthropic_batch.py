@@ -0,0 +1,144 @@
+"""
+Unit tests for anthropic_batch.py.
+
+Runs MessageBatchRunner through the real anthropic SDK against the local
+Message Batches stand-in: polling until a batch ends, splitting requests
+across batches, errored results, resuming submitted batches, and that
+requests and parsed results match what instructor would send and return.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+anthropic = pytest.importorskip("anthropic")
+from pydantic import BaseModel
+
+from anthropic_batch import (
+    BatchTimeout,
+    MessageBatchRunner,
+    custom_id,
+    message_params,
+    parse_result,
+    tool_definition,
+)
+from anthropic_batch_standin import MessageBatchStandIn
+from api_cache import CacheStore
+
+
+class Extraction(BaseModel):
+    quote: str
+    is_usable: bool
+
+
+def respond(params):
+    """Quotes the prompt back, erroring prompts that mention "fail"."""
+    prompt = params["messages"][0]["content"]
+    if "fail" in prompt:
+        return None
+    return {"quote": prompt.upper(), "is_usable": True}
+
+
+def make_requests(prompts):
+    return {custom_id(p): message_params("claude-x", 64, p, Extraction) for p in prompts}
+
+
+@pytest.fixture
+def standin():
+    with MessageBatchStandIn(respond, polls_to_end=3) as standin:
+        yield standin
+
+
+def make_runner(standin, **kwargs):
+    client = anthropic.AsyncAnthropic(api_key="key", base_url=standin.url, max_retries=0)
+    kwargs.setdefault("poll_seconds", 0.01)
+    return MessageBatchRunner(client, **kwargs)
+
+
+# =============================================================================
+# Requests and results
+# =============================================================================
+
+
+class TestRequests:
+    """Tests for building requests and parsing their results."""
+
+    def test_tool_matches_instructor(self):
+        """The tool definition is the one instructor sends for the response model."""
+        instructor = pytest.importorskip("instructor")
+        assert tool_definition(Extraction) == instructor.openai_schema(Extraction).anthropic_schema
+
+    def test_custom_id_is_valid(self):
+        """custom_ids are stable and within the API's 64 character limit."""
+        request_id = custom_id("artist", "name", "a" * 1000)
+        assert request_id == custom_id("artist", "name", "a" * 1000)
+        assert len(request_id) <= 64 and request_id.replace("_", "").isalnum()
+
+    def test_parse_errors(self):
+        """Errored results and messages without the tool call raise ValueError."""
+        with pytest.raises(ValueError, match="errored"):
+            parse_result({"type": "errored", "error": {}}, Extraction)
+        message = {"content": [{"type": "text", "text": "no"}]}
+        with pytest.raises(ValueError, match="No tool call"):
+            parse_result({"type": "succeeded", "message": message}, Extraction)
+
+
+# =============================================================================
+# Running batches
+# =============================================================================
+
+
+class TestRunner:
+    """Tests for submitting, polling and reading batches."""
+
+    def test_polls_until_ended(self, standin):
+        """Results are read once the batch has ended, parsed into the response model."""
+        runner = make_runner(standin)
+        requests = make_requests(["one", "two"])
+        results = asyncio.run(runner.run(requests))
+        assert parse_result(results[custom_id("two")], Extraction) == Extraction(quote="TWO", is_usable=True)
+        assert runner.stats["batch_polls"] == 2
+        assert standin.requests["batches.create"] == 1 and standin.requests["batches.results"] == 1
+
+    def test_splits_into_batches(self, standin):
+        """More requests than batch_size go out as several batches, all submitted first."""
+        runner = make_runner(standin, batch_size=4)
+        prompts = [f"prompt {i}" for i in range(10)]
+        results = asyncio.run(runner.run(make_requests(prompts)))
+        assert len(results) == 10 and runner.stats["batches_submitted"] == 3
+        assert runner.stats["batch_results_succeeded"] == 10
+
+    def test_errored_requests(self, standin):
+        """An errored request comes back as its error result, without failing the rest."""
+        runner = make_runner(standin)
+        results = asyncio.run(runner.run(make_requests(["ok", "fail"])))
+        assert results[custom_id("fail")]["type"] == "errored"
+        assert results[custom_id("ok")]["type"] == "succeeded"
+        with pytest.raises(ValueError):
+            parse_result(results[custom_id("fail")], Extraction)
+
+    def test_timeout(self, standin):
+        """A batch that doesn't end within max_wait_seconds raises BatchTimeout."""
+        runner = make_runner(standin, max_wait_seconds=0)
+        with pytest.raises(BatchTimeout):
+            asyncio.run(runner.run(make_requests(["slow"])))
+
+    def test_resumes_submitted_batches(self, standin, tmp_path):
+        """A run interrupted while waiting picks up its batch instead of resubmitting."""
+        store = CacheStore(str(tmp_path / "api_cache.sqlite3"))
+        submitted = store.namespace("anthropic_submitted_batches")
+        requests = make_requests(["one", "two"])
+        with pytest.raises(BatchTimeout):
+            asyncio.run(make_runner(standin, max_wait_seconds=0, submitted=submitted).run(requests))
+        store.close()
+
+        reopened = CacheStore(str(tmp_path / "api_cache.sqlite3"))
+        submitted = reopened.namespace("anthropic_submitted_batches")
+        runner = make_runner(standin, submitted=submitted)
+        results = asyncio.run(runner.run(requests))
+        assert len(results) == 2
+        assert runner.stats["batches_resumed"] == 1 and standin.requests["batches.create"] == 1
+        assert dict(submitted.items()) == {}
+        reopened.close()
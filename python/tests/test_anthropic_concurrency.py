@@ -0,0 +1,256 @@
+"""
+Unit tests for anthropic_concurrency.py and rate_limit.AdaptiveConcurrencyLimiter.
+
+Tests that the limit grows with healthy responses and halves on overloads,
+that queued requests wait for a free slot, that API errors wrapped by
+instructor are classified by their cause, and that quote extraction
+through the real SDK settles near a stand-in's concurrency limit.
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+anthropic = pytest.importorskip("anthropic")
+from pydantic import BaseModel
+
+from anthropic_batch_standin import tool_use_message
+from anthropic_concurrency import AnthropicConcurrency, classify
+from rate_limit import AdaptiveConcurrencyLimiter
+from standin_server import StandInServer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_limiter(initial_limit=4, **kwargs):
+    kwargs.setdefault("overload_pause_seconds", 0)
+    return AdaptiveConcurrencyLimiter(initial_limit, **kwargs)
+
+
+class Extraction(BaseModel):
+    quote: str
+
+
+class ExtractionStandIn(StandInServer):
+    """Answers every Messages API call with an Extraction tool call."""
+
+    def route(self, handler, parts, params):
+        self.count("messages")
+        body = json.loads(handler.body)
+        return self.send(handler, 200, tool_use_message(body, {"quote": "ok"}, "msg_standin"))
+
+
+@pytest.fixture(scope="module")
+def status_error():
+    """Returns the error the SDK raises for a status, from a stand-in answering with it."""
+    with ExtractionStandIn() as standin:
+        client = anthropic.Anthropic(api_key="key", base_url=standin.base_url.rstrip("/"), max_retries=0)
+
+        def make(status, headers=None):
+            standin.inject(status, headers)
+            try:
+                client.messages.create(model="claude-x", max_tokens=8, messages=[{"role": "user", "content": "x"}])
+            except anthropic.APIError as e:
+                return e
+            raise AssertionError(f"{status} didn't raise")
+
+        yield make
+
+
+# =============================================================================
+# AIMD limiter
+# =============================================================================
+
+
+class TestAdaptiveConcurrencyLimiter:
+    """Tests for adjusting and enforcing the limit."""
+
+    def test_increases_after_a_window_of_successes(self):
+        """limit healthy responses in a row raise the limit by one."""
+        clock = FakeClock()
+        limiter = make_limiter(4, clock=clock)
+
+        async def run():
+            for _ in range(4):
+                limiter.on_success(await limiter.acquire_async())
+
+        asyncio.run(run())
+        assert limiter.limit == 5 and limiter.stats["limit_increases"] == 1
+
+    def test_slow_responses_dont_increase(self):
+        """Responses far slower than the fastest seen reset the window."""
+        clock = FakeClock()
+        limiter = make_limiter(2, clock=clock, latency_tolerance=2.0)
+
+        async def run():
+            limiter.on_success(await limiter.acquire_async())
+            for _ in range(4):
+                started = await limiter.acquire_async()
+                clock.now += 1.0
+                limiter.on_success(started)
+                started = await limiter.acquire_async()
+                limiter.on_success(started)
+
+        clock.now = 0.0
+        asyncio.run(run())
+        assert limiter.limit == 2 and limiter.stats["slow_responses"] == 4
+
+    def test_overload_halves_once_per_window(self):
+        """Overloads from requests sent at the old limit don't decrease it again."""
+        clock = FakeClock()
+        limiter = make_limiter(8, clock=clock)
+
+        async def run():
+            started = [await limiter.acquire_async() for _ in range(8)]
+            clock.now += 1.0
+            for s in started:
+                limiter.on_overload(s)
+            clock.now += 1.0
+            limiter.on_overload(await limiter.acquire_async())
+
+        asyncio.run(run())
+        assert limiter.limit == 2 and limiter.stats["limit_decreases"] == 2
+        assert limiter.stats["overloads"] == 9 and limiter.in_flight == 0
+
+    def test_limit_bounds(self):
+        """The limit stays between min_limit and max_limit."""
+        limiter = make_limiter(2, min_limit=2, max_limit=3)
+
+        async def run():
+            for _ in range(20):
+                limiter.on_success(await limiter.acquire_async())
+            limiter.on_overload(await limiter.acquire_async())
+
+        asyncio.run(run())
+        assert limiter.limit == 2 and limiter.stats["peak_concurrency_limit"] == 3
+
+    def test_waits_for_a_free_slot(self):
+        """No more than limit requests run at once; the rest queue."""
+        limiter = make_limiter(3, max_limit=3)
+        running = []
+
+        async def work():
+            started = await limiter.acquire_async()
+            running.append(limiter.in_flight)
+            await asyncio.sleep(0.01)
+            limiter.on_success(started)
+
+        async def run():
+            await asyncio.gather(*[work() for _ in range(12)])
+
+        asyncio.run(run())
+        assert max(running) == 3
+        assert limiter.stats["peak_queue_depth"] >= 9 and limiter.stats["queue_depth"] == 0
+
+    def test_overload_pauses_new_requests(self):
+        """Retry-After holds back every request, not just the one that saw it."""
+        limiter = make_limiter(4)
+
+        async def run():
+            limiter.on_overload(await limiter.acquire_async(), retry_after=0.2)
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            limiter.on_success(await limiter.acquire_async())
+            return loop.time() - start
+
+        assert asyncio.run(run()) >= 0.15
+
+
+# =============================================================================
+# Anthropic controller
+# =============================================================================
+
+
+class TestAnthropicConcurrency:
+    """Tests for classifying errors and retrying through the limiter."""
+
+    def test_classify(self, status_error):
+        """Overloads, transient and other errors are told apart, also when wrapped."""
+        assert classify(status_error(429, {"retry-after": "7"})) == ("overload", 7.0)
+        assert classify(status_error(529)) == ("overload", None)
+        assert classify(status_error(500)) == ("transient", None)
+        assert classify(status_error(400)) == ("error", None)
+        assert classify(ValueError("no")) == ("error", None)
+        try:
+            try:
+                raise status_error(429)
+            except anthropic.APIError as e:
+                raise RuntimeError("wrapped") from e
+        except RuntimeError as e:
+            assert classify(e)[0] == "overload"
+
+    def test_retries_overloads(self, status_error):
+        """An overloaded call is retried and its result returned."""
+        concurrency = AnthropicConcurrency(overload_pause_seconds=0)
+        responses = [status_error(429, {"retry-after": "0"}), status_error(529), "done"]
+
+        async def call():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        assert asyncio.run(concurrency.call("model", call)) == "done"
+        stats = concurrency.limiter("model").stats
+        assert stats["overload_retries"] == 2 and stats["in_flight"] == 0
+
+    def test_other_errors_raise(self, status_error):
+        """Errors that retrying won't fix are raised at once."""
+        concurrency = AnthropicConcurrency()
+        calls = []
+
+        async def call():
+            calls.append(1)
+            raise status_error(400)
+
+        with pytest.raises(anthropic.BadRequestError):
+            asyncio.run(concurrency.call("model", call))
+        assert len(calls) == 1
+
+    def test_limits_per_model(self):
+        """Each model learns its own limit, with stats under its own counter."""
+        from pipeline_metrics import MetricsRegistry
+
+        metrics = MetricsRegistry(trace_memory=False)
+        concurrency = AnthropicConcurrency(metrics=metrics, overload_pause_seconds=0)
+        assert concurrency.limiter("haiku") is not concurrency.limiter("sonnet")
+        assert metrics.counter("anthropic_concurrency.haiku")["concurrency_limit"] == 3
+
+    def test_settles_near_provider_limit(self):
+        """Extraction through instructor ramps up to the stand-in's limit and stays near it."""
+        instructor = pytest.importorskip("instructor")
+        with ExtractionStandIn(latency_seconds=0.02, concurrency_limit=8, retry_after_seconds=0.05) as standin:
+            client = instructor.from_anthropic(
+                anthropic.AsyncAnthropic(api_key="key", base_url=standin.base_url.rstrip("/"), max_retries=0)
+            )
+            concurrency = AnthropicConcurrency(initial_limit=2)
+
+            async def extract():
+                return await concurrency.call(
+                    "claude-x",
+                    client.messages.create,
+                    model="claude-x",
+                    max_tokens=64,
+                    response_model=Extraction,
+                    messages=[{"role": "user", "content": "Review"}],
+                )
+
+            async def run():
+                return await asyncio.gather(*[extract() for _ in range(400)])
+
+            results = asyncio.run(run())
+
+        stats = concurrency.limiter("claude-x").stats
+        assert all(r.quote == "ok" for r in results)
+        assert standin.requests["messages"] == 400
+        assert stats["peak_concurrency_limit"] > 8 and stats["overloads"] > 0
+        assert 4 <= stats["concurrency_limit"] <= 16
@@ -0,0 +1,271 @@
+"""
+Unit tests for api_cache.py.
+
+Tests the dict-compatible namespace interface, batched transactional writes,
+lazy reads, negative caching, and importing the legacy JSON caches.
+"""
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from api_cache import (
+    ANTHROPIC_EXTRACT_QUOTE_NAMESPACE,
+    FORCE_REFRESH_ENV,
+    CacheStore,
+    export_json_cache,
+    main,
+    open_cache,
+)
+
+NOTEBOOKS_DIR = os.path.join(os.path.dirname(__file__), "../notebooks")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "caches" / "api_cache.sqlite3")
+
+
+@pytest.fixture
+def store(db_path):
+    store = CacheStore(db_path)
+    yield store
+    store.close()
+
+
+def count_on_disk(db_path, namespace):
+    """Counts committed rows through a separate connection."""
+    reader = CacheStore(db_path)
+    try:
+        return reader.namespaces().get(namespace, 0)
+    finally:
+        reader.close()
+
+
+# =============================================================================
+# Dict interface
+# =============================================================================
+
+
+class TestDictInterface:
+    """A namespace should be a drop-in replacement for the old dict caches."""
+
+    def test_get_set_contains(self, store):
+        """Basic mapping operations."""
+        cache = store.namespace("spotify")
+        assert cache.get("q") is None
+        assert "q" not in cache
+        cache["q"] = {"tracks": {"items": [{"id": "abc"}]}}
+        assert "q" in cache
+        assert cache["q"]["tracks"]["items"][0]["id"] == "abc"
+        assert cache.get("missing", "default") == "default"
+        with pytest.raises(KeyError):
+            cache["missing"]
+
+    def test_len_iter_items(self, store):
+        """Iteration covers committed and pending entries."""
+        cache = store.namespace("spotify")
+        cache["a"] = 1
+        cache.flush()
+        cache["b"] = 2
+        assert len(cache) == 2
+        assert sorted(cache) == ["a", "b"]
+        assert dict(cache.items()) == {"a": 1, "b": 2}
+
+    def test_delete(self, store):
+        """Deletes hide the key before and after flushing."""
+        cache = store.namespace("spotify")
+        cache["a"] = 1
+        cache.flush()
+        del cache["a"]
+        assert "a" not in cache
+        assert len(cache) == 0
+        cache.flush()
+        assert "a" not in cache
+        with pytest.raises(KeyError):
+            del cache["a"]
+
+    def test_namespaces_are_isolated(self, store):
+        """The same key in two namespaces holds two values."""
+        store.namespace("spotify")["k"] = 1
+        store.namespace("apple_music")["k"] = 2
+        assert store.namespace("spotify")["k"] == 1
+        assert store.namespace("apple_music")["k"] == 2
+
+    def test_get_many(self, store):
+        """Bulk lookups skip missing keys."""
+        cache = store.namespace("spotify")
+        cache.update_many((f"k{i}", i) for i in range(1200))
+        cache["pending"] = "p"
+        found = cache.get_many(["k0", "k1199", "pending", "nope"])
+        assert found == {"k0": 0, "k1199": 1199, "pending": "p"}
+
+
+# =============================================================================
+# Durability
+# =============================================================================
+
+
+class TestDurability:
+    """Tests for batched, transactional writes."""
+
+    def test_autoflush(self, db_path):
+        """Writes are committed every autoflush_every entries."""
+        store = CacheStore(db_path, autoflush_every=3)
+        cache = store.namespace("spotify")
+        cache["a"] = 1
+        cache["b"] = 2
+        assert count_on_disk(db_path, "spotify") == 0
+        cache["c"] = 3
+        assert count_on_disk(db_path, "spotify") == 3
+        store.close()
+
+    def test_batch_commits_once(self, db_path):
+        """Writes in a batch are committed together on exit."""
+        store = CacheStore(db_path, autoflush_every=2)
+        cache = store.namespace("spotify")
+        with cache.batch():
+            for i in range(10):
+                cache[str(i)] = i
+            assert count_on_disk(db_path, "spotify") == 0
+        assert count_on_disk(db_path, "spotify") == 10
+        store.close()
+
+    def test_reopen_sees_committed_values(self, db_path):
+        """Closing flushes pending writes."""
+        store = CacheStore(db_path)
+        store.namespace("spotify")["q"] = {"x": 1}
+        store.close()
+
+        reopened = CacheStore(db_path)
+        assert reopened.namespace("spotify")["q"] == {"x": 1}
+        reopened.close()
+
+    def test_concurrent_writers(self, store):
+        """Threads can share a namespace."""
+        cache = store.namespace("youtube_music_search")
+
+        def writer(offset):
+            for i in range(100):
+                cache[f"{offset}-{i}"] = i
+
+        threads = [threading.Thread(target=writer, args=(t,)) for t in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(cache) == 400
+
+
+# =============================================================================
+# Negative caching
+# =============================================================================
+
+
+class TestNegativeCache:
+    """Tests for remembering lookups that found nothing."""
+
+    def test_add_and_expire(self, db_path):
+        """Entries count until the TTL runs out."""
+        store = CacheStore(db_path, negative_ttl_seconds=60)
+        negative = store.negative("spotify")
+        now = [1000.0]
+        negative.clock = lambda: now[0]
+        negative.add("year:2025 unknown song")
+        assert "year:2025 unknown song" in negative
+        now[0] += 61
+        assert "year:2025 unknown song" not in negative
+        assert negative.purge_expired() == 1
+        assert len(negative) == 0
+        store.close()
+
+    def test_separate_from_positive_entries(self, store):
+        """Negative entries don't show up in the namespace itself."""
+        store.negative("apple_music").add("isrc:X")
+        assert "isrc:X" not in store.namespace("apple_music")
+        assert store.namespaces() == {"apple_music:not_found": 1}
+
+    def test_discard(self, store):
+        """A later positive result can drop the negative entry."""
+        negative = store.negative("youtube_music_search")
+        negative.add("q")
+        negative.discard("q")
+        negative.discard("never added")
+        assert "q" not in negative
+
+    def test_force_refresh(self, db_path, monkeypatch):
+        """force_refresh ignores every negative entry without deleting it."""
+        store = CacheStore(db_path)
+        store.negative("spotify").add("q")
+        store.close()
+
+        monkeypatch.setenv(FORCE_REFRESH_ENV, "1")
+        refreshing = CacheStore(db_path)
+        assert refreshing.force_refresh
+        assert "q" not in refreshing.negative("spotify")
+        assert len(refreshing.negative("spotify")) == 1
+        refreshing.close()
+
+    def test_cli_purge_all(self, db_path, capsys):
+        """The CLI can drop every negative entry for a namespace."""
+        store = CacheStore(db_path)
+        store.negative("spotify").add("a")
+        store.negative("spotify").add("b")
+        store.close()
+        main(["--db", db_path, "purge-negative", "spotify", "--all"])
+        assert "Removed 2 negative entries" in capsys.readouterr().out
+
+
+# =============================================================================
+# Legacy JSON caches
+# =============================================================================
+
+
+class TestLegacyJson:
+    """Tests for importing and exporting the old JSON cache files."""
+
+    def test_open_cache_imports_once(self, store, tmp_path):
+        """The JSON file seeds an empty namespace, and only once."""
+        legacy = tmp_path / "spotify_cache.json"
+        legacy.write_text(json.dumps({"q": {"tracks": {"items": []}}}), encoding="utf-8")
+
+        cache = open_cache(store, "spotify", str(legacy))
+        assert cache["q"] == {"tracks": {"items": []}}
+
+        cache["new"] = 1
+        legacy.write_text(json.dumps({"other": 2}), encoding="utf-8")
+        cache = open_cache(store, "spotify", str(legacy))
+        assert "other" not in cache
+        assert cache["new"] == 1
+
+    def test_missing_legacy_file(self, store, tmp_path):
+        """A missing JSON file just means an empty namespace."""
+        cache = open_cache(store, "spotify", str(tmp_path / "nope.json"))
+        assert len(cache) == 0
+
+    def test_anthropic_cache_round_trip(self, store, tmp_path):
+        """The checked-in quote cache imports and exports losslessly."""
+        legacy = os.path.join(NOTEBOOKS_DIR, "caches/anthropic_extract_quote_cache.json")
+        with open(legacy, "r", encoding="utf-8") as f:
+            expected = json.load(f)
+
+        cache = open_cache(store, ANTHROPIC_EXTRACT_QUOTE_NAMESPACE, legacy)
+        assert len(cache) == len(expected)
+        key = next(iter(expected))
+        assert cache[key] == expected[key]
+
+        exported = tmp_path / "exported.json"
+        export_json_cache(cache, str(exported))
+        with open(exported, "r", encoding="utf-8") as f:
+            assert json.load(f) == expected
+
+    def test_cli_import_and_stats(self, db_path, tmp_path, capsys):
+        """The CLI imports a JSON file and reports namespace sizes."""
+        legacy = tmp_path / "apple.json"
+        legacy.write_text(json.dumps({"isrc:A": 1, "isrc:B": 2}), encoding="utf-8")
+        main(["--db", db_path, "import", "apple_music", str(legacy)])
+        main(["--db", db_path, "stats"])
+        assert "apple_music: 2" in capsys.readouterr().out
@@ -0,0 +1,207 @@
+"""
+Unit tests for apple_music_client.py.
+
+Tests developer token reuse, and runs the client against the local Apple
+Music stand-in for batching, concurrency and retries, and the notebook's
+ISRC lookup for what it records as not found.
+"""
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+NOTEBOOKS_DIR = os.path.join(os.path.dirname(__file__), "../notebooks")
+sys.path.insert(0, NOTEBOOKS_DIR)
+import api_cache
+import apple_music_client
+import cache_keys
+import replay_standin
+from api_cache import CacheStore
+from apple_music_client import AppleMusicClient, DeveloperTokenProvider
+from apple_music_standin import AppleMusicStandIn, make_fake_song
+from pipeline_metrics import MetricsRegistry
+
+NOTEBOOK_FILENAME = os.path.join(NOTEBOOKS_DIR, "best_songs_merge.ipynb")
+
+
+@pytest.fixture(scope="module")
+def auth_key():
+    key = ec.generate_private_key(ec.SECP256R1())
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    return pem, key.public_key()
+
+
+@pytest.fixture
+def standin():
+    songs = [make_fake_song(i) for i in range(100)]
+    searches = {"Artist 1 Song 1": [songs[1]["id"], songs[2]["id"]]}
+    with AppleMusicStandIn(songs, searches, latency_seconds=0.05) as standin:
+        yield standin
+
+
+def make_client(standin, **kwargs):
+    kwargs.setdefault("rate_per_second", 1000)
+    return AppleMusicClient(lambda: "token", base_url=standin.url, **kwargs)
+
+
+# =============================================================================
+# Developer tokens
+# =============================================================================
+
+
+class TestDeveloperTokenProvider:
+    """Tests for signing and reusing developer tokens."""
+
+    def test_reuses_token_until_near_expiry(self, auth_key):
+        """A token is only re-signed inside the refresh margin."""
+        pem, public_key = auth_key
+        now = [1_000_000]
+        provider = DeveloperTokenProvider(
+            "KEY", "TEAM", pem, lifetime_seconds=3600, refresh_margin_seconds=300,
+            clock=lambda: now[0],
+        )
+        token = provider()
+        now[0] += 3000
+        assert provider() == token
+        now[0] += 400
+        assert provider() != token
+        assert provider.tokens_signed == 2
+
+    def test_token_claims(self, auth_key):
+        """The token is an ES256 JWT with the team as issuer."""
+        pem, public_key = auth_key
+        token = DeveloperTokenProvider("KEY", "TEAM", pem)()
+        assert jwt.get_unverified_header(token)["kid"] == "KEY"
+        claims = jwt.decode(token, public_key, algorithms=["ES256"])
+        assert claims["iss"] == "TEAM"
+        assert claims["exp"] > time.time()
+
+
+# =============================================================================
+# Client
+# =============================================================================
+
+
+class TestAppleMusicClient:
+    """Tests for AppleMusicClient against the stand-in."""
+
+    def test_songs_by_isrc_batches_concurrently(self, standin):
+        """100 ISRCs take four concurrent requests."""
+        client = make_client(standin, max_workers=4)
+        isrcs = [f"USXX1{i:07d}" for i in range(100)] + ["UNKNOWN"]
+        batches = []
+        start = time.perf_counter()
+        found = client.songs_by_isrc(isrcs, on_batch=lambda batch, ok: batches.append(batch))
+        elapsed = time.perf_counter() - start
+        assert len(found) == 100
+        assert found["USXX10000007"]["attributes"]["name"] == "Song 7"
+        assert standin.requests["songs"] == 5
+        assert len(batches) == 5
+        assert standin.max_concurrent > 1
+        assert elapsed < 5 * 0.05
+
+    def test_search_songs(self, standin):
+        """Search returns responses keyed by term, duplicates sent once."""
+        client = make_client(standin)
+        results = client.search_songs(["Artist 1 Song 1", "nothing", "Artist 1 Song 1"])
+        assert standin.requests["search"] == 2
+        assert len(results["Artist 1 Song 1"]["results"]["songs"]["data"]) == 2
+        assert results["nothing"] == {"results": {}}
+
+    def test_retry_after(self, standin):
+        """A 429 pauses for Retry-After before retrying."""
+        stats = Counter()
+        client = make_client(standin, stats=stats)
+        standin.inject(429, {"Retry-After": "0.5"})
+        start = time.perf_counter()
+        result = client.fetch(client.catalog_url("songs"), {"filter[isrc]": "USXX10000001"})
+        assert time.perf_counter() - start >= 0.5
+        assert result["data"][0]["attributes"]["isrc"] == "USXX10000001"
+        assert stats["rate_limited"] == 1
+
+    def test_permanent_error(self, standin):
+        """A 4xx other than 429 is not retried."""
+        client = make_client(standin)
+        standin.inject(403)
+        assert client.fetch(client.catalog_url("songs"), {"filter[isrc]": "x"}) is None
+        assert standin.total_requests() == 1
+
+    def test_failed_batch(self, standin):
+        """A batch whose request fails is reported as not ok."""
+        client = make_client(standin, max_workers=1)
+        standin.inject(403)
+        batches = []
+        found = client.songs_by_isrc(
+            [f"USXX1{i:07d}" for i in range(50)], on_batch=lambda batch, ok: batches.append((batch[0], ok))
+        )
+        assert batches == [("USXX10000000", False), ("USXX10000025", True)]
+        assert len(found) == 25 and client.stats["failed_isrc_batches"] == 1
+
+    def test_reuses_connections(self, standin):
+        """Sequential requests share one pooled connection."""
+        client = make_client(standin, max_workers=1)
+        client.songs_by_isrc([f"USXX1{i:07d}" for i in range(100)])
+        pool = client.session.get_adapter(standin.url).poolmanager
+        connection_pool = next(iter(pool.pools._container.values()))
+        assert connection_pool.num_connections == 1
+        assert connection_pool.num_requests == 4
+
+
+# =============================================================================
+# Notebook
+# =============================================================================
+
+
+def notebook_namespace(store, client):
+    """The notebook's Apple Music cell, run against store and client."""
+    with open(NOTEBOOK_FILENAME, encoding="utf-8") as f:
+        cells = ["".join(c["source"]) for c in json.load(f)["cells"] if c["cell_type"] == "code"]
+    namespace = {
+        "API_STANDIN_URL": "http://localhost/",
+        "Counter": Counter,
+        "api_cache": api_cache,
+        "api_cache_store": store,
+        "apple_music_client": apple_music_client,
+        "cache_keys": cache_keys,
+        "metrics": MetricsRegistry(trace_memory=False),
+        "replay_standin": replay_standin,
+    }
+    exec(next(c for c in cells if "def fetch_apple_music_song_results_for_isrcs(" in c), namespace)
+    namespace["apple_music"] = client
+    return namespace
+
+
+class TestNotebookIsrcLookup:
+    """Tests for the notebook's negative cache of ISRCs."""
+
+    def test_failed_batch_is_not_negative_cached(self, standin, tmp_path):
+        """Only ISRCs missing from a successful response are recorded as not found."""
+        pytest.importorskip("ipywidgets")
+        store = CacheStore(str(tmp_path / "api_cache.sqlite3"))
+        notebook = notebook_namespace(store, make_client(standin, max_workers=1, max_retries=1))
+        cache = notebook["load_apple_music_cache"](str(tmp_path / "apple_music_cache.json"))
+        isrcs = [f"USXX1{i:07d}" for i in range(20)] + ["UNKNOWN"]
+        fetch = notebook["fetch_apple_music_song_results_for_isrcs"]
+
+        def not_found():
+            keys = notebook["apple_music_not_found"]
+            return [i for i in isrcs if notebook["make_apple_music_isrc_cache_key"](i) in keys]
+
+        stats = Counter()
+        standin.inject(500)
+        assert fetch(isrcs, cache, stats, max_retries=1) == {}
+        assert stats["isrc_batch_errors"] == 1 and not_found() == []
+
+        assert len(fetch(isrcs, cache, stats, max_retries=1)) == 20
+        assert not_found() == ["UNKNOWN"]
+        store.close()
@@ -0,0 +1,139 @@
+"""
+Unit tests for cache_keys.py.
+
+Tests the versioned key format, legacy key migration, and invalidation of
+stale entries through the CLI.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+import cache_keys
+from api_cache import CacheStore
+from cache_keys import KeyBuilder
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CacheStore(str(tmp_path / "cache.sqlite3"))
+    yield store
+    store.close()
+
+
+def quote_builder(prompt="Extract a quote from {review}"):
+    return KeyBuilder("quote", version=2, fingerprint=cache_keys.fingerprint(prompt))
+
+
+# =============================================================================
+# Keys
+# =============================================================================
+
+
+class TestKeyBuilder:
+    """Tests for the key format."""
+
+    def test_key_format(self):
+        """Keys carry the builder name, version and fingerprint."""
+        builder = KeyBuilder("search", version=3, fingerprint="abc")
+        key = builder.key("artist", "song")
+        assert key.startswith("search@v3:abc:")
+        assert builder.owns(key) and builder.is_current(key)
+
+    def test_inputs_are_normalized(self):
+        """Unicode normalization form and surrounding whitespace don't change the key."""
+        builder = KeyBuilder("search", version=1)
+        assert builder.key("Beyoncé ") == builder.key("Beyoncé")
+        assert builder.key("a", "b") != builder.key("b", "a")
+        assert builder.key("a b") != builder.key("a", "b")
+
+    def test_fingerprint_change_changes_keys(self):
+        """Editing the prompt gives new keys for the same inputs."""
+        old, new = quote_builder("v1 {review}"), quote_builder("v2 {review}")
+        assert old.key("x") != new.key("x")
+        assert old.owns(new.key("x")) and not old.is_current(new.key("x"))
+
+    def test_names_cannot_contain_separators(self):
+        """A builder name with ':' or '@' would make keys ambiguous."""
+        with pytest.raises(AssertionError):
+            KeyBuilder("a:b", version=1)
+
+
+# =============================================================================
+# Migration and invalidation
+# =============================================================================
+
+
+class TestMigration:
+    """Tests for rewriting pre-builder keys."""
+
+    def test_migrates_legacy_keys(self, store):
+        """Legacy keys are rekeyed in place and unrelated keys left alone."""
+        ns = store.namespace("apple_music")
+        ns["search_v3:artist:song"] = {"results": {}}
+        ns["isrc:US123"] = {"data": []}
+        ns.flush()
+        builder = KeyBuilder("apple_music_search", version=3)
+
+        def legacy_inputs(key, value):
+            return (key.removeprefix("search_v3:"),) if key.startswith("search_v3:") else None
+
+        assert cache_keys.migrate_legacy_keys(ns, builder, legacy_inputs) == 1
+        assert ns[builder.key("artist:song")] == {"results": {}}
+        assert "search_v3:artist:song" not in ns
+        assert "isrc:US123" in ns
+        # Running again finds nothing to do
+        assert cache_keys.migrate_legacy_keys(ns, builder, legacy_inputs) == 0
+
+
+class TestInvalidation:
+    """Tests for finding and deleting stale entries."""
+
+    def fill(self, store):
+        ns = store.namespace("quotes")
+        old, new = quote_builder("v1"), quote_builder("v2")
+        ns[old.key("a")] = "old a"
+        ns[old.key("b")] = "old b"
+        ns[new.key("a")] = "new a"
+        ns["other"] = "kept"
+        ns.flush()
+        cache_keys.register_builder(store, "quotes", new)
+        return ns, old, new
+
+    def test_stale_keys(self, store):
+        """Only entries from other fingerprints of the same builder are stale."""
+        ns, old, new = self.fill(store)
+        assert sorted(cache_keys.stale_keys(ns, new)) == sorted([old.key("a"), old.key("b")])
+
+    def test_cli_invalidates_stale(self, store, capsys):
+        """The CLI deletes stale entries using the registered fingerprint."""
+        ns, old, new = self.fill(store)
+        db = store.filename
+        assert cache_keys.main(["--db", db, "invalidate", "quotes", "quote", "--stale", "--dry-run"]) == 0
+        assert "Would remove 2" in capsys.readouterr().out
+
+        assert cache_keys.main(["--db", db, "invalidate", "quotes", "quote", "--stale"]) == 0
+        reopened = CacheStore(db)
+        assert sorted(reopened.namespace("quotes").keys_on_disk()) == sorted([new.key("a"), "other"])
+        reopened.close()
+
+    def test_cli_invalidates_one_input(self, store):
+        """--input deletes just the entry for those inputs."""
+        ns, old, new = self.fill(store)
+        assert cache_keys.main(["--db", store.filename, "invalidate", "quotes", "quote", "--input", "a"]) == 0
+        reopened = CacheStore(store.filename)
+        assert new.key("a") not in reopened.namespace("quotes")
+        assert old.key("a") in reopened.namespace("quotes")
+        reopened.close()
+
+    def test_cli_list(self, store, capsys):
+        """list shows current and stale counts per builder."""
+        self.fill(store)
+        cache_keys.main(["--db", store.filename, "list"])
+        assert "quotes/quote v2" in capsys.readouterr().out
+
+    def test_cli_unknown_builder(self, store):
+        """Invalidating an unregistered builder fails."""
+        self.fill(store)
+        assert cache_keys.main(["--db", store.filename, "invalidate", "quotes", "nope", "--all"]) == 1
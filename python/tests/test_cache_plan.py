@@ -0,0 +1,141 @@
+"""
+Unit tests for cache_plan.py.
+
+Tests deduplication of planned lookups, request and wall time estimates,
+LLM cost estimates, and the dry-run and max-misses guards.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+import cache_plan
+from cache_plan import CachePlanner, DryRunStop, PlannedMissesExceeded, ServiceLimits
+from pipeline_metrics import MetricsRegistry
+
+
+def make_planner(**kwargs):
+    kwargs.setdefault("dry_run", False)
+    return CachePlanner(**kwargs)
+
+
+# =============================================================================
+# Planning
+# =============================================================================
+
+
+class TestPlan:
+    """Tests for counting hits and misses."""
+
+    def test_deduplicates_listings(self):
+        """A song cited by many listings is one lookup."""
+        planner = make_planner()
+        keys = ["a"] * 16 + ["b", "c", "d"]
+        plan = planner.plan("spotify.search", keys, lambda k: k == "b", is_negative=lambda k: k == "c")
+        assert (plan.listings, plan.unique) == (19, 4)
+        assert (plan.hits, plan.negative_hits) == (1, 1)
+        assert plan.misses == ["a", "d"]
+
+    def test_batched_requests(self):
+        """Misses are grouped into batch_size requests."""
+        limits = ServiceLimits(rate_per_second=10, max_in_flight=1, latency_seconds=0.1, batch_size=50)
+        plan = make_planner().plan("spotify.tracks", range(120), lambda k: False, limits=limits)
+        assert plan.requests == 3
+
+    def test_records_metrics(self):
+        """Planned misses are recorded in the cache_plan counter."""
+        metrics = MetricsRegistry()
+        make_planner(metrics=metrics).plan("youtube", ["q1", "q2"], lambda k: k == "q1")
+        assert metrics.counter("cache_plan")["youtube.planned_misses"] == 1
+
+    def test_llm_cost(self):
+        """Token estimates are priced by model prefix."""
+        plan = make_planner().plan(
+            "anthropic",
+            ["k1", "k2"],
+            lambda k: False,
+            limits=cache_plan.ANTHROPIC_LIMITS,
+            tokens=lambda k: (1000, 100),
+            model="claude-haiku-4-5-20251001",
+        )
+        assert (plan.input_tokens, plan.output_tokens) == (2000, 200)
+        assert plan.cost_usd == pytest.approx((2000 * 1.0 + 200 * 5.0) / 1_000_000)
+
+    def test_batch_price_factor(self):
+        """Batched requests are priced at a fraction of live ones."""
+        plan = make_planner().plan(
+            "anthropic",
+            ["k1", "k2"],
+            lambda k: False,
+            limits=cache_plan.ANTHROPIC_BATCH_LIMITS,
+            tokens=lambda k: (1000, 100),
+            model="claude-haiku-4-5-20251001",
+            price_factor=cache_plan.ANTHROPIC_BATCH_PRICE_FACTOR,
+        )
+        assert plan.cost_usd == pytest.approx((2000 * 1.0 + 200 * 5.0) / 2 / 1_000_000)
+        assert plan.requests == 1
+
+    def test_unknown_model_has_no_cost(self):
+        """Models without a price still get token estimates."""
+        plan = make_planner().plan(
+            "anthropic", ["k"], lambda k: False, tokens=lambda k: (10, 1), model="other"
+        )
+        assert plan.cost_usd is None and plan.input_tokens == 10
+
+
+class TestEstimates:
+    """Tests for wall time and token estimates."""
+
+    def test_rate_bound(self):
+        """With plenty of concurrency the rate limit decides."""
+        limits = ServiceLimits(rate_per_second=2, max_in_flight=100, latency_seconds=0.1)
+        assert cache_plan.estimate_wall_seconds(10, limits) == 5.0
+
+    def test_latency_bound(self):
+        """With little concurrency latency decides."""
+        limits = ServiceLimits(rate_per_second=100, max_in_flight=2, latency_seconds=1.0)
+        assert cache_plan.estimate_wall_seconds(10, limits) == 5.0
+        assert cache_plan.estimate_wall_seconds(0, limits) == 0.0
+
+    def test_estimate_tokens(self):
+        """About four characters per token."""
+        assert cache_plan.estimate_tokens("x" * 401) == 101
+
+
+# =============================================================================
+# Guards
+# =============================================================================
+
+
+class TestCheck:
+    """Tests for stopping before network traffic."""
+
+    def test_dry_run_stops_on_misses(self):
+        """A dry run stops at the first phase with misses only."""
+        planner = make_planner(dry_run=True)
+        planner.check(planner.plan("cached", ["a"], lambda k: True))
+        with pytest.raises(DryRunStop):
+            planner.check(planner.plan("uncached", ["a"], lambda k: False))
+
+    def test_max_misses(self):
+        """Too many misses, e.g. after a key change, stops the run."""
+        planner = make_planner(max_misses=2)
+        planner.check(planner.plan("ok", ["a", "b"], lambda k: False))
+        with pytest.raises(PlannedMissesExceeded):
+            planner.check(planner.plan("too_many", ["a", "b", "c"], lambda k: False))
+
+    def test_environment(self, monkeypatch):
+        """The guards default to the environment variables."""
+        monkeypatch.setenv(cache_plan.DRY_RUN_ENV, "1")
+        monkeypatch.setenv(cache_plan.MAX_PLANNED_MISSES_ENV, "5")
+        planner = CachePlanner()
+        assert planner.dry_run and planner.max_misses == 5
+
+    def test_report(self, capsys):
+        """The report lists every plan and the totals."""
+        planner = make_planner()
+        planner.plan("spotify.search", ["a"], lambda k: False)
+        planner.report()
+        assert "spotify.search" in capsys.readouterr().out
+        assert list(planner.to_frame()["misses"]) == [1]
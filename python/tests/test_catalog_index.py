@@ -0,0 +1,159 @@
+"""
+Unit tests for catalog_index.py.
+
+Tests that cached Spotify, Apple Music and YouTube Music records are found
+locally by remembered listing, by cleaned artist and title, and by fuzzy
+title, and that different songs, other releases years and ambiguous
+matches are left for the API.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from api_cache import CacheStore
+from catalog_index import EXACT_MATCH, FUZZY_MATCH, LISTING_MATCH, CatalogIndex, listing_key
+from spotify_cache import SpotifyCache
+
+
+def make_item(spotify_id, artist, name, isrc, release_date="2025-03-07", popularity=50):
+    return {
+        "id": spotify_id,
+        "name": name,
+        "artists": [{"id": f"{artist}-id", "name": a} for a in artist.split(" & ")],
+        "external_ids": {"isrc": isrc},
+        "album": {"release_date": release_date},
+        "popularity": popularity,
+    }
+
+
+def make_apple_song(apple_id, artist, name, isrc, release_date="2025-03-07"):
+    return {
+        "id": apple_id,
+        "attributes": {"artistName": artist, "name": name, "isrc": isrc, "releaseDate": release_date},
+    }
+
+
+@pytest.fixture
+def spotify_cache(tmp_path):
+    store = CacheStore(str(tmp_path / "api_cache.sqlite3"))
+    cache = SpotifyCache(store)
+    for item in [
+        make_item("sp1", "Lady Gaga", "Abracadabra", "ISRC1"),
+        make_item("sp2", "Sabrina Carpenter", "Manchild", "ISRC2"),
+        make_item("sp3", "Sabrina Carpenter", "Manchild - Remix", "ISRC3"),
+        make_item("sp4", "Old Band", "Old Song", "ISRC4", release_date="2019-01-01"),
+        make_item("sp5", "Clairo", "Juna", "ISRC5", popularity=40),
+        make_item("sp6", "Clairo", "Juna", "ISRC5", popularity=70),
+        make_item("sp7", "Doechii & Kendrick Lamar", "Anxiety", "ISRC7"),
+    ]:
+        cache.add_item(item)
+    yield cache
+    store.close()
+
+
+# =============================================================================
+# Building
+# =============================================================================
+
+
+class TestBuild:
+    """The catalog holds each cached record once, from every source."""
+
+    def test_records_from_all_caches(self, spotify_cache):
+        """Spotify items, Apple Music songs and searches, and YouTube results are indexed."""
+        song = make_apple_song("am1", "Lorde", "What Was That", "ISRC8")
+        apple = {
+            "isrc:ISRC8": song,
+            "search:lorde:what was that": {"results": {"songs": {"data": [song]}}},
+        }
+        youtube = {"lorde what was that": [{"videoId": "yt1", "title": "What Was That", "artists": [{"name": "Lorde"}]}]}
+        catalog = CatalogIndex.from_caches(spotify_cache, apple, youtube)
+        assert len(catalog) == 9
+        frame = catalog.to_frame()
+        assert frame["source"].value_counts().to_dict() == {"spotify": 7, "apple_music": 1, "youtube_music": 1}
+        assert frame.loc[frame["source"] == "youtube_music", "youtube_id"].tolist() == ["yt1"]
+
+
+# =============================================================================
+# Lookups
+# =============================================================================
+
+
+class TestLookup:
+    """Searches are answered locally only when the answer is clear."""
+
+    def test_exact_cleaned_match(self, spotify_cache):
+        """Spelling that cleans to the same query text finds the cached track."""
+        catalog = CatalogIndex.from_caches(spotify_cache)
+        assert catalog.lookup_spotify_id("LADY GAGA", "Abracadabra (feat. Nobody)") == "sp1"
+        assert catalog.stats["exact_hits"] == 1
+
+    def test_fuzzy_match(self, spotify_cache):
+        """A featured artist credit and stray punctuation still match."""
+        catalog = CatalogIndex.from_caches(spotify_cache)
+        assert catalog.lookup_spotify_id("Doechii", "Anxiety!") == "sp7"
+        assert catalog.stats["fuzzy_hits"] == 1
+
+    def test_danger_words_keep_versions_apart(self, spotify_cache):
+        """A remix doesn't answer for the original, nor the original for a remix."""
+        catalog = CatalogIndex.from_caches(spotify_cache)
+        assert catalog.lookup_spotify_id("Sabrina Carpenter", "Manchild") == "sp2"
+        assert catalog.lookup_spotify_id("Sabrina Carpenter", "Manchild (Remix)") == "sp3"
+        assert catalog.lookup_spotify_id("Sabrina Carpentr", "Manchild Remix") == "sp3"
+
+    def test_unknown_song_misses(self, spotify_cache):
+        """Songs not in any cache, or by another artist, go to the API."""
+        catalog = CatalogIndex.from_caches(spotify_cache)
+        assert catalog.lookup_spotify_id("Lady Gaga", "Disease") is None
+        assert catalog.lookup_spotify_id("Somebody Else", "Abracadabra") is None
+        assert catalog.stats["misses"] == 2
+
+    def test_year_filter(self, spotify_cache):
+        """Older releases only match searches without the year filter."""
+        catalog = CatalogIndex.from_caches(spotify_cache)
+        assert catalog.lookup_spotify_id("Old Band", "Old Song") is None
+        assert catalog.lookup_spotify_id("Old Band", "Old Song", include_year_filter=False) == "sp4"
+
+    def test_same_isrc_prefers_popular_release(self, spotify_cache):
+        """Two releases of one recording pick the more popular one."""
+        catalog = CatalogIndex.from_caches(spotify_cache)
+        assert catalog.lookup_spotify_id("Clairo", "Juna") == "sp6"
+
+    def test_different_songs_tied_are_ambiguous(self, spotify_cache):
+        """Two different recordings with the same artist and title aren't guessed."""
+        spotify_cache.add_item(make_item("sp9", "Lady Gaga", "Abracadabra", "ISRC9"))
+        catalog = CatalogIndex.from_caches(spotify_cache)
+        assert catalog.lookup_spotify_id("Lady Gaga", "Abracadabra") is None
+        assert catalog.stats["ambiguous"] == 1
+
+    def test_apple_music_record_reaches_spotify_by_isrc(self, spotify_cache):
+        """An Apple Music spelling of a song finds the Spotify track with its ISRC."""
+        apple = {"isrc:ISRC7": make_apple_song("am7", "Doechii", "Anxiety (Radio Edit)", "ISRC7")}
+        catalog = CatalogIndex.from_caches(spotify_cache, apple)
+        assert catalog.lookup_spotify_id("Doechii", "Anxiety [Radio Edit]") == "sp7"
+
+    def test_remembered_listing(self, spotify_cache):
+        """A listing resolved before is found whatever its spelling cleans to."""
+        listing_ids = {}
+        catalog = CatalogIndex.from_caches(spotify_cache, listing_ids=listing_ids)
+        catalog.remember("The Sabrina Show", "MANCHILD!!", "sp2")
+        assert listing_ids == {listing_key("the sabrina show", "manchild!!"): "sp2"}
+        assert catalog.lookup_spotify_id(" The Sabrina Show", "Manchild!! ") == "sp2"
+        assert catalog.lookup_spotify_id("The Sabrina Show", "MANCHILD!!", include_year_filter=False) is None
+        assert catalog.stats["listing_hits"] == 1
+
+    def test_match_says_how(self, spotify_cache):
+        """match tells a remembered listing and an exact match from a fuzzy guess."""
+        catalog = CatalogIndex.from_caches(spotify_cache)
+        catalog.remember("The Sabrina Show", "MANCHILD!!", "sp2")
+
+        def how(artist, name):
+            record, match = catalog.match(artist, name)
+            return record and record.spotify_id, match
+
+        assert how("The Sabrina Show", "MANCHILD!!") == ("sp2", LISTING_MATCH)
+        assert how("LADY GAGA", "Abracadabra") == ("sp1", EXACT_MATCH)
+        assert how("Doechii", "Anxiety!") == ("sp7", FUZZY_MATCH)
+        assert how("Lady Gaga", "Disease") == (None, None)
@@ -0,0 +1,161 @@
+"""
+Unit tests for entity_resolver.py.
+
+Checks IDs against the per-song select_id fallbacks they replaced, merging
+through shared identifiers, conflict reports and incremental updates.
+"""
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from entity_resolver import EntityResolver, UnionFind, identifier, song_identifiers
+
+
+@dataclass
+class Song:
+    isrc: str | None = None
+    spotify_id: str | None = None
+    youtube_id: str | None = None
+    other_url: str | None = None
+    canonical_artist: str | None = None
+    canonical_name: str | None = None
+
+
+def select_id_reference(song):
+    """select_id from the notebook, before the resolver."""
+    if song.isrc:
+        return song.isrc
+    if song.spotify_id:
+        return f"SPOTIFY:{song.spotify_id}"
+    if song.youtube_id:
+        return f"YT:{song.youtube_id}"
+    if song.other_url:
+        return f"OTHER:{song.other_url}"
+    if song.canonical_artist and song.canonical_name:
+        return f"NAME:{song.canonical_artist} -- {song.canonical_name}"
+    return None
+
+
+def resolve(songs):
+    resolver = EntityResolver()
+    listings = [resolver.add(song_identifiers(song)) for song in songs]
+    return resolver, [resolver.entity_id(listing) for listing in listings]
+
+
+def consistent_songs(n, seed=0):
+    """Listings of n distinct songs, each always cited with the same identifiers."""
+    rng = random.Random(seed)
+    songs = []
+    for i in range(n):
+        kind = rng.choice(["isrc", "spotify", "youtube", "other", "name"])
+        song = Song(canonical_artist=f"Artist {i}", canonical_name=f"Song {i}")
+        if kind == "isrc":
+            song.isrc, song.spotify_id = f"ISRC{i}", f"sp{i}"
+        elif kind == "spotify":
+            song.spotify_id = f"sp{i}"
+        elif kind == "youtube":
+            song.youtube_id = f"yt{i}"
+        elif kind == "other":
+            song.other_url = f"https://example.com/{i}"
+        songs.extend([song] * rng.randint(1, 4))
+    rng.shuffle(songs)
+    return songs
+
+
+# =============================================================================
+# Resolution
+# =============================================================================
+
+
+class TestResolve:
+    """Tests for entity IDs."""
+
+    def test_matches_select_id(self):
+        """Without cross-links, every listing gets select_id's ID."""
+        songs = consistent_songs(500)
+        resolver, ids = resolve(songs)
+        assert ids == [select_id_reference(song) for song in songs]
+        assert resolver.entity_count() == 500
+        assert resolver.conflicts() == []
+
+    def test_merges_through_shared_identifiers(self):
+        """A listing with only a name joins the ISRC song with that name."""
+        songs = [
+            Song(isrc="I1", spotify_id="s1", canonical_artist="Lorde", canonical_name="Hammer"),
+            Song(youtube_id="y1", canonical_artist="lorde ", canonical_name="HAMMER"),
+            Song(youtube_id="y1", other_url="https://lorde.bandcamp.com/hammer"),
+        ]
+        resolver, ids = resolve(songs)
+        assert ids == ["I1", "I1", "I1"]
+        assert resolver.entity_count() == 1
+
+    def test_conflicts(self):
+        """Two ISRCs linked through a shared video are reported."""
+        songs = [
+            Song(isrc="I1", youtube_id="y1", canonical_artist="A", canonical_name="One"),
+            Song(isrc="I2", youtube_id="y1", canonical_artist="A", canonical_name="Two"),
+            Song(isrc="I3", canonical_artist="B", canonical_name="Three"),
+        ]
+        resolver, _ = resolve(songs)
+        [conflict] = resolver.conflicts()
+        assert conflict["isrc"] == ["I1", "I2"]
+        assert conflict["name"] == ["NAME:A -- One", "NAME:A -- Two"]
+        assert conflict["listings"] == 2
+
+    def test_no_identifiers(self):
+        """A listing without identifiers has no ID."""
+        resolver, ids = resolve([Song()])
+        assert ids == [None]
+
+
+class TestIncremental:
+    """Tests for adding listings and identifiers later."""
+
+    def test_link_override(self):
+        """Linking an override's ISRC re-keys every listing of that song."""
+        resolver = EntityResolver()
+        a = resolver.add(song_identifiers(Song(youtube_id="y1", canonical_artist="A", canonical_name="S")))
+        b = resolver.add(song_identifiers(Song(canonical_artist="A", canonical_name="S")))
+        assert resolver.entity_id(b) == "YT:y1"
+        resolver.link(a, identifier("isrc", "I9"))
+        assert resolver.entity_id(a) == resolver.entity_id(b) == "I9"
+        assert resolver.same_entity(a, b)
+
+    def test_groups_grow_as_identifiers_are_linked(self):
+        """Listings added by ISRC alone group by ISRC; linking more identifiers merges groups."""
+        resolver = EntityResolver()
+        songs = [
+            Song(isrc="I1", youtube_id="y1"),
+            Song(isrc="I1"),
+            Song(youtube_id="y1", canonical_artist="A", canonical_name="S"),
+            Song(),
+        ]
+        listings = [resolver.add([identifier("isrc", s.isrc)] if s.isrc else []) for s in songs]
+        assert resolver.groups() == {"I1": [0, 1]}
+        for song, listing in zip(songs, listings):
+            for ident in song_identifiers(song):
+                resolver.link(listing, ident)
+        assert resolver.groups() == {"I1": [0, 1, 2]}
+        assert resolver.entity_count() == 2
+
+    def test_union_find(self):
+        """Unions keep the bigger set's root."""
+        sets = UnionFind()
+        for node in "abcd":
+            sets.add(node)
+        sets.union("a", "b")
+        sets.union("a", "c")
+        root, absorbed = sets.union("d", "a")
+        assert root == sets.find("a") == sets.find("d") and absorbed == "d"
+        assert sets.union("b", "c") == (root, None)
+
+    def test_fast_at_scale(self):
+        """About 150k listings resolve in seconds."""
+        songs = consistent_songs(60_000, seed=1)
+        start = time.perf_counter()
+        resolver, _ = resolve(songs)
+        assert time.perf_counter() - start < 10
+        assert resolver.entity_count() == 60_000
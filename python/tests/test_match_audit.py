@@ -0,0 +1,334 @@
+"""
+Unit tests for match_audit.py.
+
+Checks the batched audits against the per-row implementations they
+replaced, on hand-written edge cases and random data.
+"""
+import itertools
+import os
+import random
+import sys
+import time
+
+import pandas
+from rapidfuzz import fuzz, utils as fuzz_utils
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+import match_audit
+
+
+def audit_match_quality_reference(row):
+    """The per-row audit from the notebook, before batching."""
+    if pandas.isna(row["id"]):
+        return f"No match for {row['original_artist']} - {row['original_name']}"
+    id = row["id"]
+    if pandas.isna(row["original_featuring"]):
+        src_full = f"{row['original_artist']} {row['original_name']}"
+    else:
+        src_full = f"{row['original_artist']}, {row['original_featuring']} {row['original_name']}"
+    sp_full = f"{row['canonical_artist']} {row['canonical_name']}"
+    warnings = []
+    src_title_lower = row["original_name"].casefold()
+    sp_title_lower = row["canonical_name"].casefold()
+    for word in match_audit.MATCH_AUDIT_DANGER_WORDS:
+        if (word in src_title_lower) != (word in sp_title_lower):
+            warnings.append(
+                f"Mismatch on descriptor '{word}' for {id}: {row['original_artist']} - {row['original_name']}"
+            )
+    score = fuzz.token_set_ratio(src_full, sp_full, processor=fuzz_utils.default_process)
+    if score < 90:
+        warnings.append(f"Low Token Match ({score}): {id} Source '{src_full}' vs Spotify '{sp_full}'")
+    completeness_score = fuzz.token_sort_ratio(src_full, sp_full, processor=fuzz_utils.default_process)
+    if completeness_score < 60:
+        warnings.append(
+            f"Potential Missing Info (Score {completeness_score}): {id} Source '{src_full}' vs Spotify '{sp_full}'"
+        )
+    return "; ".join(warnings) if warnings else "OK"
+
+
+WORDS = ["Love", "Song", "Remix", "Live", "alive", "Tiny", "Desk", "Beyoncé", "Part", "Edit", "the", "Ñ"]
+
+
+def random_listings(n, seed=0):
+    rng = random.Random(seed)
+
+    def text(k):
+        return " ".join(rng.choices(WORDS, k=rng.randint(1, k)))
+
+    rows = []
+    for i in range(n):
+        name = text(4)
+        rows.append(
+            {
+                "id": None if rng.random() < 0.05 else f"id{rng.randint(0, n // 3)}",
+                "original_artist": text(2),
+                "original_name": name,
+                "original_featuring": text(2) if rng.random() < 0.2 else None,
+                "canonical_artist": text(2),
+                "canonical_name": name if rng.random() < 0.6 else text(4),
+            }
+        )
+    return pandas.DataFrame(rows)
+
+
+# =============================================================================
+# Match quality
+# =============================================================================
+
+
+class TestAuditMatchQuality:
+    """Tests for audit_match_quality_batch."""
+
+    def test_matches_reference_on_edge_cases(self):
+        """Featuring, missing IDs, danger words and low scores all match."""
+        df = pandas.DataFrame(
+            [
+                {"id": "a", "original_artist": "Lorde", "original_name": "What Was That",
+                 "original_featuring": None, "canonical_artist": "Lorde", "canonical_name": "What Was That"},
+                {"id": "b", "original_artist": "Lorde", "original_name": "Man Of The Year (Live)",
+                 "original_featuring": None, "canonical_artist": "Lorde", "canonical_name": "Man Of The Year"},
+                {"id": None, "original_artist": "X", "original_name": "Y",
+                 "original_featuring": None, "canonical_artist": None, "canonical_name": None},
+                {"id": "c", "original_artist": "A", "original_name": "Song",
+                 "original_featuring": "B, C", "canonical_artist": "Totally Different", "canonical_name": "Thing"},
+            ],
+            index=[10, 11, 12, 13],
+        )
+        expected = df.apply(audit_match_quality_reference, axis=1)
+        result = match_audit.audit_match_quality_batch(df)
+        assert result.index.equals(df.index)
+        assert result.tolist() == expected.tolist()
+        assert expected[10] == "OK" and "'live'" in expected[11]
+
+    def test_matches_reference_on_random_data(self):
+        """Identical output on random listings."""
+        df = random_listings(3000)
+        expected = df.apply(audit_match_quality_reference, axis=1)
+        assert match_audit.audit_match_quality_batch(df).tolist() == expected.tolist()
+
+    def test_empty(self):
+        """An empty frame gives an empty column."""
+        df = random_listings(1).iloc[:0]
+        assert len(match_audit.audit_match_quality_batch(df)) == 0
+
+    def test_fast_at_scale(self):
+        """100k listings audit in seconds."""
+        df = random_listings(100_000, seed=1)
+        start = time.perf_counter()
+        match_audit.audit_match_quality_batch(df)
+        assert time.perf_counter() - start < 10
+
+
+# =============================================================================
+# Over-merges
+# =============================================================================
+
+
+def check_group_risk_reference(group):
+    """The per-pair over-merge check from the notebook, before vectorizing."""
+    unique_titles = group["original_name"].unique()
+    unique_artists = group["original_artist"].unique()
+    if len(unique_titles) < 2 and len(unique_artists) < 2:
+        return None
+    risk_score = 0
+    reasons = []
+    for t1, t2 in itertools.combinations(unique_titles, 2):
+        similarity = fuzz.ratio(t1.lower(), t2.lower())
+        if similarity < match_audit.SONG_NAME_SIMILARITY_THRESHOLD:
+            risk_score += 50
+            reasons.append(f"Low similarity ({similarity}%) between '{t1}' and '{t2}'")
+        t1_lower, t2_lower = t1.lower(), t2.lower()
+        for word in match_audit.OVERMERGE_DANGER_WORDS:
+            if (word in t1_lower) != (word in t2_lower):
+                risk_score += 20
+                reasons.append(f"Mismatch on descriptor '{word}'")
+    for a1, a2 in itertools.combinations(unique_artists, 2):
+        similarity = fuzz.ratio(a1.lower(), a2.lower())
+        if similarity < match_audit.ARTIST_NAME_SIMILARITY_THRESHOLD:
+            risk_score += 10
+            reasons.append(f"Artist mismatch: '{a1}' vs '{a2}'")
+    if risk_score > 0:
+        return {
+            "id": group["id"].iloc[0],
+            "risk_score": risk_score,
+            "issue_count": len(group),
+            "original_title_variants": " | ".join(unique_titles),
+            "original_artist_variants": " | ".join(unique_artists),
+            "reasons": set(reasons),
+        }
+    return None
+
+
+class TestAuditOvermerges:
+    """Tests for audit_overmerges."""
+
+    def test_matches_reference(self):
+        """Same risky IDs, scores and reasons as the pairwise check."""
+        df = random_listings(3000, seed=2)
+        expected = []
+        for _, group in df[df["id"].notna()].groupby("id"):
+            result = check_group_risk_reference(group)
+            if result:
+                expected.append(result)
+
+        result = match_audit.audit_overmerges(df)
+        assert len(result) == len(expected) > 0
+        for row, ref in zip(result.to_dict("records"), expected):
+            assert row["id"] == ref["id"]
+            assert row["risk_score"] == ref["risk_score"]
+            assert row["issue_count"] == ref["issue_count"]
+            assert row["original_title_variants"] == ref["original_title_variants"]
+            assert row["original_artist_variants"] == ref["original_artist_variants"]
+            assert set(row["reasons"].split("; ")) == ref["reasons"]
+
+    def test_descriptor_risk(self):
+        """A remix merged with the original is flagged for the descriptor."""
+        df = pandas.DataFrame(
+            {
+                "id": ["x", "x", "x", "y"],
+                "original_artist": ["Lorde"] * 4,
+                "original_name": ["Hammer", "Hammer (Remix)", "Hammer", "Other"],
+                "canonical_artist": ["Lorde"] * 4,
+                "canonical_name": ["Hammer", "Hammer", "Hammer", "Other"],
+            }
+        )
+        result = match_audit.audit_overmerges(df)
+        assert list(result["id"]) == ["x"]
+        # 50 for the low similarity, 20 for the descriptor
+        assert result["risk_score"].iloc[0] == 70
+        assert "Mismatch on descriptor 'remix'" in result["reasons"].iloc[0]
+
+    def test_large_groups(self):
+        """A group with hundreds of variants is scored quickly."""
+        titles = [f"Song number {i}" + (" (Live)" if i % 2 else "") for i in range(400)]
+        df = pandas.DataFrame(
+            {
+                "id": ["x"] * 400,
+                "original_artist": ["Artist"] * 400,
+                "original_name": titles,
+                "canonical_artist": ["Artist"] * 400,
+                "canonical_name": ["Song"] * 400,
+            }
+        )
+        start = time.perf_counter()
+        result = match_audit.audit_overmerges(df)
+        assert time.perf_counter() - start < 2
+        # 200 titles with "live" and 200 without
+        assert result["risk_score"].iloc[0] >= 200 * 200 * 20
+
+
+# =============================================================================
+# Split entities
+# =============================================================================
+
+
+def audit_split_entities_reference(df):
+    """The all-pairs loop from the notebook, before blocking."""
+    problems = []
+    records = df.to_dict("records")
+    for i in range(len(records)):
+        for j in range(i + 1, len(records)):
+            a, b = records[i], records[j]
+            if fuzz.token_sort_ratio(a["canonical_artist"], b["canonical_artist"]) > 90:
+                song_score = fuzz.token_set_ratio(a["canonical_name"], b["canonical_name"])
+                if song_score > 85:
+                    problems.append(
+                        {
+                            "artist_a": a["canonical_artist"],
+                            "song_a": a["canonical_name"],
+                            "id_a": a["id"],
+                            "artist_b": b["canonical_artist"],
+                            "song_b": b["canonical_name"],
+                            "id_b": b["id"],
+                            "score": song_score,
+                        }
+                    )
+    return problems
+
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "to", "ne", "su", "vi", "da", "ch", "ell", "orn"]
+TITLE_WORDS = [
+    "love", "night", "heart", "fire", "dream", "summer", "gold", "river", "ghost",
+    "light", "dance", "blue", "city", "rain", "wild", "home", "stars", "run",
+]
+
+
+def random_songs(n, seed=0):
+    rng = random.Random(seed)
+
+    def word(k):
+        return "".join(rng.choices(SYLLABLES, k=k)).title()
+
+    artists = [
+        ((word(2) + " " if rng.random() < 0.5 else "") + word(4) + (" Band" if rng.random() < 0.1 else ""), f"art{a}")
+        for a in range(max(1, n // 4))
+    ]
+    rows = []
+    for i in range(n):
+        artist, artist_id = rng.choice(artists)
+        title = " ".join(rng.choices(TITLE_WORDS, k=rng.randint(1, 3))).title() + " " + word(2)
+        rows.append(
+            {"id": f"id{i}", "canonical_artist": artist, "canonical_name": title, "spotify_artist0_id": artist_id}
+        )
+        if rng.random() < 0.03:
+            # The same song again under another ID, sometimes respelled
+            variant = title + (" (Remix)" if rng.random() < 0.5 else "")
+            rows.append(
+                {"id": f"dup{i}", "canonical_artist": artist + ("!" if rng.random() < 0.3 else ""),
+                 "canonical_name": variant,
+                 "spotify_artist0_id": artist_id}
+            )
+    return pandas.DataFrame(rows)
+
+
+class TestAuditSplitEntities:
+    """Tests for the blocked split-entity audit."""
+
+    def test_matches_reference(self):
+        """Finds the same problems, in the same order, as the all-pairs loop."""
+        df = random_songs(800, seed=3)
+        expected = audit_split_entities_reference(df)
+        assert len(expected) > 0
+        assert match_audit.audit_split_entities(df) == expected
+        assert match_audit.audit_split_entities_exhaustive(df) == expected
+
+    def test_recall_report(self):
+        """The recall report compares far fewer pairs than all of them."""
+        df = random_songs(800, seed=4)
+        report = match_audit.split_entity_recall(df)
+        assert report["recall"] == 1.0 and report["missed"] == []
+        assert report["blocked_problems"] == report["exhaustive_problems"] > 0
+        assert report["candidate_pairs"] < report["all_pairs"] / 10
+
+    def test_artist_id_block(self):
+        """Artists with no token in common still meet on their artist ID."""
+        df = pandas.DataFrame(
+            {
+                "id": ["a", "b"],
+                "canonical_artist": ["Beyonce", "Beyoncee"],
+                "canonical_name": ["Halo", "Halo"],
+                "spotify_artist0_id": ["x", "x"],
+            }
+        )
+        assert len(match_audit.audit_split_entities(df)) == 1
+        no_ids = df.drop(columns="spotify_artist0_id")
+        assert match_audit.audit_split_entities(no_ids) == []
+        assert len(match_audit.split_entity_recall(no_ids)["missed"]) == 1
+
+    def test_missing_values(self):
+        """Rows without a canonical artist or name are never problems."""
+        df = pandas.DataFrame(
+            {"id": ["a", "b", "c"], "canonical_artist": ["A", None, "A"], "canonical_name": [None, "S", None]}
+        )
+        assert match_audit.audit_split_entities(df) == audit_split_entities_reference(df) == []
+
+    def test_near_linear_at_scale(self):
+        """50k songs compare a near-linear number of pairs, in seconds."""
+        small_pairs, _ = match_audit.split_entity_candidate_pairs(random_songs(5_000, seed=5))
+        df = random_songs(50_000, seed=5)
+        start = time.perf_counter()
+        pairs, _ = match_audit.split_entity_candidate_pairs(df)
+        match_audit.score_split_entity_pairs(df, pairs)
+        assert time.perf_counter() - start < 30
+        # Ten times the songs, well under a hundred times the pairs
+        assert len(pairs) < 20 * len(small_pairs)
@@ -0,0 +1,143 @@
+"""
+Unit tests for override_index.py.
+
+Checks exact lookups and near-miss detection against the listing-by-override
+loops they replaced, and that both overrides tables in the repo load.
+"""
+import os
+import random
+import sys
+import time
+
+import pandas
+import pytest
+from rapidfuzz import fuzz
+
+NOTEBOOKS_DIR = os.path.join(os.path.dirname(__file__), "../notebooks")
+sys.path.insert(0, NOTEBOOKS_DIR)
+from override_index import OverrideIndex, normalize_override_key
+
+
+def audit_missed_overrides_reference(keys, overrides_df):
+    """The nested loop from the notebook, before indexing."""
+    warnings = []
+    for raw_src_artist, raw_src_song in keys:
+        raw_src_artist, raw_src_song = str(raw_src_artist), str(raw_src_song)
+        src_artist = raw_src_artist.casefold().strip()
+        src_song = raw_src_song.casefold().strip()
+        for _, row in overrides_df.iterrows():
+            ov_artist = row["original_artist"].casefold().strip()
+            ov_song = row["original_name"].casefold().strip()
+            if fuzz.ratio(src_artist, ov_artist) > 90 and fuzz.ratio(src_song, ov_song) > 90:
+                if (src_artist, src_song) != (ov_artist, ov_song):
+                    warnings.append(
+                        f"Possible Missed Override: Source '{raw_src_artist} - {raw_src_song}' "
+                        f"is very close to Override Key '{row['original_artist']} - {row['original_name']}'"
+                    )
+    return warnings
+
+
+def make_overrides(rows):
+    return pandas.DataFrame(rows, columns=["original_artist", "original_name", "spotify_id"])
+
+
+# =============================================================================
+# Exact lookups
+# =============================================================================
+
+
+class TestExactLookup:
+    """Tests for get()."""
+
+    def test_normalized_lookup(self):
+        """Case and surrounding whitespace don't matter."""
+        index = OverrideIndex.from_frame(
+            make_overrides([("Hotline TNT", "Candle", "x")]), "original_artist", "original_name"
+        )
+        assert index.get(" hotline tnt", "CANDLE ")["spotify_id"] == "x"
+        assert index.get("Hotline TNT", "Candles") is None
+        assert index.get("Hotline TNT", "Candles", {}) == {}
+
+    def test_duplicate_keys(self):
+        """Two different overrides for one normalized key are an error."""
+        df = make_overrides([("A", "Song", "x"), ("a", "song ", "y")])
+        with pytest.raises(ValueError, match="Multiple overrides"):
+            OverrideIndex.from_frame(df, "original_artist", "original_name")
+
+    def test_repeated_override(self):
+        """Spellings that repeat the same override are allowed."""
+        df = make_overrides([("james K", "Play", None), ("JAMES K", "Play", None)])
+        index = OverrideIndex.from_frame(df, "original_artist", "original_name")
+        assert index.get("James K", "play")["original_artist"] == "james K"
+
+    def test_normalize_non_strings(self):
+        """Missing values normalize like the notebook's str() did."""
+        assert normalize_override_key(float("nan"), " X ") == ("nan", "x")
+
+    def test_repo_tables_load(self):
+        """Both overrides tables in the repo index without collisions."""
+        manual = pandas.read_csv(os.path.join(NOTEBOOKS_DIR, "manual_overrides.csv"), encoding="utf-8")
+        index = OverrideIndex.from_frame(manual, "original_artist", "original_name")
+        assert len(index) == len(manual)
+        ytm = pandas.read_csv(os.path.join(NOTEBOOKS_DIR, "ytm_manual_overrides.csv"), encoding="utf-8")
+        assert len(OverrideIndex.from_frame(ytm, "artist", "name")) == len(ytm)
+
+
+# =============================================================================
+# Near misses
+# =============================================================================
+
+
+ARTISTS = ["James K", "Lorde", "Blood Orange", "Hotline TNT", "FKA twigs", "The Beths", "Ninajirachi"]
+SONGS = ["Candle", "Man Of The Year", "Mind Loaded", "Eusexua", "Metal Heart", "Iced Out", "Tears"]
+
+
+def mutate(rng, text):
+    """text with a small typo, sometimes."""
+    roll = rng.random()
+    if roll < 0.3:
+        return text + "."
+    if roll < 0.5:
+        return text.upper()
+    if roll < 0.6 and len(text) > 3:
+        i = rng.randrange(len(text))
+        return text[:i] + text[i + 1 :]
+    return text
+
+
+class TestNearMisses:
+    """Tests for near_misses() and audit_missed()."""
+
+    def test_typo(self):
+        """A trailing period is a near miss, an exact key is not."""
+        df = make_overrides([("James K", "Candle", "x"), ("Lorde", "Tears", "y")])
+        index = OverrideIndex.from_frame(df, "original_artist", "original_name")
+        assert [o["spotify_id"] for o in index.near_misses("James K.", "Candle")] == ["x"]
+        assert index.near_misses("james k", "candle") == []
+        assert index.near_misses("Someone", "Candle") == []
+
+    def test_matches_reference(self):
+        """Same warnings, in the same order, as comparing every pair."""
+        rng = random.Random(0)
+        df = make_overrides(
+            [(artist, song, f"id{i}") for i, (artist, song) in enumerate(
+                (a, s) for a in ARTISTS for s in SONGS if rng.random() < 0.5
+            )]
+        )
+        keys = [(mutate(rng, rng.choice(ARTISTS)), mutate(rng, rng.choice(SONGS))) for _ in range(500)]
+        expected = audit_missed_overrides_reference(keys, df)
+        index = OverrideIndex.from_frame(df, "original_artist", "original_name")
+        assert len(expected) > 0
+        assert index.audit_missed(keys) == expected
+
+    def test_scales_with_overrides(self):
+        """50k listings against 5k overrides are audited in seconds."""
+        rng = random.Random(1)
+        df = make_overrides(
+            [(f"Artist {i}", f"Song {rng.randint(0, 10**6)}", f"id{i}") for i in range(5000)]
+        )
+        index = OverrideIndex.from_frame(df, "original_artist", "original_name")
+        keys = [(f"Artist {rng.randint(0, 20000)}", f"Song {rng.randint(0, 10**6)}") for _ in range(50_000)]
+        start = time.perf_counter()
+        index.audit_missed(keys)
+        assert time.perf_counter() - start < 20
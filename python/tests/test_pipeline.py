@@ -0,0 +1,266 @@
+"""
+Unit tests for pipeline.py.
+
+Tests dependency derivation, incremental re-execution based on content
+hashes, and concurrent execution of independent stages.
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from pipeline import Pipeline, hash_path, main
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write("overrides.csv", "a\n")
+    write("raw.txt", "raw\n")
+    return tmp_path
+
+
+SPEC = [
+    {"name": "merge", "inputs": ["raw.txt"], "outputs": ["merged.txt"]},
+    {"name": "apple_music", "inputs": ["merged.txt"], "outputs": ["apple_music.txt"]},
+    {"name": "youtube_music", "inputs": ["merged.txt", "overrides.csv"], "outputs": ["youtube_music.txt"]},
+    {"name": "export", "inputs": ["apple_music.txt", "youtube_music.txt"], "outputs": ["data.json"]},
+]
+
+
+def build_pipeline(calls):
+    """parse -> canonicalize -> (left, right) -> export."""
+    pipeline = Pipeline(state_filename="state.json")
+
+    @pipeline.stage("parse", inputs=["raw.txt"], outputs=["parsed.txt"])
+    def parse(ctx):
+        calls.append("parse")
+        write("parsed.txt", read("raw.txt").upper())
+
+    @pipeline.stage(
+        "canonicalize", inputs=["parsed.txt", "overrides.csv"], outputs=["canon.txt"]
+    )
+    def canonicalize(ctx):
+        calls.append("canonicalize")
+        write("canon.txt", read("parsed.txt") + read("overrides.csv"))
+
+    @pipeline.stage("left", inputs=["canon.txt"], outputs=["left.txt"])
+    def left(ctx):
+        calls.append("left")
+        write("left.txt", "L" + read("canon.txt"))
+
+    @pipeline.stage("right", inputs=["canon.txt"], outputs=["right.txt"])
+    def right(ctx):
+        calls.append("right")
+        write("right.txt", "R" + read("canon.txt"))
+
+    @pipeline.stage("export", inputs=["left.txt", "right.txt"], outputs=["data.json"])
+    def export(ctx):
+        calls.append("export")
+        write("data.json", read("left.txt") + read("right.txt"))
+
+    return pipeline
+
+
+# =============================================================================
+# Graph
+# =============================================================================
+
+
+class TestGraph:
+    """Tests for dependency derivation and ordering."""
+
+    def test_dependencies_derived_from_inputs(self, workdir):
+        """A stage depends on the producers of its inputs."""
+        pipeline = build_pipeline([])
+        assert pipeline.dependencies("export") == {"left", "right"}
+        assert pipeline.dependencies("parse") == set()
+
+    def test_topological_order_with_target(self, workdir):
+        """Targeting a stage limits the run to its ancestors."""
+        pipeline = build_pipeline([])
+        assert pipeline.topological_order(["left"]) == ["parse", "canonicalize", "left"]
+
+    def test_duplicate_output_rejected(self, workdir):
+        """Two stages cannot write the same output."""
+        pipeline = build_pipeline([])
+        with pytest.raises(ValueError):
+            pipeline.add_stage("other", lambda ctx: None, outputs=["left.txt"])
+
+    def test_cycle_detected(self, workdir):
+        """Cyclic inputs are rejected."""
+        pipeline = Pipeline(state_filename="state.json")
+        pipeline.add_stage("a", lambda ctx: None, inputs=["b.txt"], outputs=["a.txt"])
+        pipeline.add_stage("b", lambda ctx: None, inputs=["a.txt"], outputs=["b.txt"])
+        with pytest.raises(ValueError):
+            pipeline.topological_order()
+
+    def test_from_spec(self):
+        """A declared graph gets its dependencies from the declared paths."""
+        implementations = {s["name"]: (lambda ctx: None) for s in SPEC}
+        pipeline = Pipeline.from_spec(SPEC, implementations)
+        assert pipeline.topological_order() == ["merge", "apple_music", "youtube_music", "export"]
+        for name in ("apple_music", "youtube_music"):
+            assert pipeline.dependencies(name) == {"merge"}
+
+    def test_from_spec_requires_all_implementations(self):
+        """Every declared stage needs a function."""
+        with pytest.raises(ValueError):
+            Pipeline.from_spec(SPEC, {})
+
+
+# =============================================================================
+# Incremental execution
+# =============================================================================
+
+
+class TestIncremental:
+    """Tests for hash-based skipping of fresh stages."""
+
+    def test_second_run_skips_everything(self, workdir):
+        """Nothing reruns when no inputs changed."""
+        calls = []
+        pipeline = build_pipeline(calls)
+        pipeline.run()
+        assert sorted(calls) == sorted(["parse", "canonicalize", "left", "right", "export"])
+
+        calls.clear()
+        status = pipeline.run()
+        assert calls == []
+        assert set(status.values()) == {"skipped"}
+
+    def test_override_change_skips_upstream(self, workdir):
+        """Changing an override only reruns the stages that read it."""
+        calls = []
+        pipeline = build_pipeline(calls)
+        pipeline.run()
+        calls.clear()
+
+        write("overrides.csv", "b\n")
+        assert pipeline.plan() == ["canonicalize", "left", "right", "export"]
+        pipeline.run()
+        assert "parse" not in calls
+        assert sorted(calls) == sorted(["canonicalize", "left", "right", "export"])
+
+    def test_unchanged_upstream_output_cuts_off_downstream(self, workdir):
+        """Byte-identical upstream outputs do not cascade."""
+        calls = []
+        pipeline = build_pipeline(calls)
+        pipeline.run()
+        calls.clear()
+
+        # Same content after uppercasing, so parsed.txt is byte-identical
+        write("raw.txt", "RAW\n")
+        pipeline.run()
+        assert calls == ["parse"]
+
+    def test_deleted_output_reruns_stage(self, workdir):
+        """A stage whose output disappeared reruns."""
+        calls = []
+        pipeline = build_pipeline(calls)
+        pipeline.run()
+        calls.clear()
+
+        os.remove("right.txt")
+        pipeline.run()
+        assert calls == ["right"]
+
+    def test_force(self, workdir):
+        """Forcing a stage reruns it even when fresh."""
+        calls = []
+        pipeline = build_pipeline(calls)
+        pipeline.run()
+        calls.clear()
+
+        pipeline.run(force=["left"])
+        assert calls == ["left"]
+
+    def test_missing_output_raises(self, workdir):
+        """A stage must write every declared output."""
+        pipeline = Pipeline(state_filename="state.json")
+        pipeline.add_stage("lazy", lambda ctx: None, inputs=["raw.txt"], outputs=["x.txt"])
+        with pytest.raises(FileNotFoundError):
+            pipeline.run()
+
+
+# =============================================================================
+# Concurrency
+# =============================================================================
+
+
+class TestConcurrency:
+    """Tests for concurrent stage execution."""
+
+    def test_independent_stages_overlap(self, workdir):
+        """Stages with no dependency between them run concurrently."""
+        barrier = threading.Barrier(2, timeout=5)
+        pipeline = Pipeline(state_filename="state.json")
+
+        def make(output):
+            def func(ctx):
+                # Deadlocks (and times out) unless both stages run at once
+                barrier.wait()
+                write(output, output)
+
+            return func
+
+        pipeline.add_stage("a", make("a.txt"), inputs=["raw.txt"], outputs=["a.txt"])
+        pipeline.add_stage("b", make("b.txt"), inputs=["raw.txt"], outputs=["b.txt"])
+        assert pipeline.run(max_workers=2) == {"a": "ran", "b": "ran"}
+
+
+# =============================================================================
+# Hashing and CLI
+# =============================================================================
+
+
+class TestHashPath:
+    """Tests for content hashing."""
+
+    def test_directory_hash_changes_with_content(self, workdir):
+        """Adding a file to a directory changes its hash."""
+        write("dir/one.txt", "1")
+        before = hash_path("dir")
+        write("dir/two.txt", "2")
+        assert hash_path("dir") != before
+
+    def test_missing(self, workdir):
+        """Missing paths hash to None."""
+        assert hash_path("nope.txt") is None
+
+
+def test_cli_plan_and_run(workdir, capsys, monkeypatch):
+
+    """The CLI plans, runs and reports status."""
+    calls = []
+    module = type(sys)("cli_stages")
+    module.build_pipeline = lambda: build_pipeline(calls)
+    monkeypatch.setitem(sys.modules, "cli_stages", module)
+
+    main(["--definition", "cli_stages:build_pipeline", "plan"])
+    assert capsys.readouterr().out.split() == [
+        "parse",
+        "canonicalize",
+        "left",
+        "right",
+        "export",
+    ]
+
+    main(["--definition", "cli_stages:build_pipeline", "run", "--jobs", "2"])
+    assert os.path.exists("data.json")
+
+    main(["--definition", "cli_stages:build_pipeline", "status"])
+    assert "export: fresh" in capsys.readouterr().out
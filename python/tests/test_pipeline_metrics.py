@@ -0,0 +1,204 @@
+"""
+Unit tests for pipeline_metrics.py.
+
+Tests stage timing, cache hit ratio inference from the notebook's stats
+Counters, API latency histograms, and the JSON/Markdown reports.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from pipeline_metrics import (
+    LatencyHistogram,
+    MetricsRegistry,
+    cache_ratios_from_counter,
+)
+
+
+# =============================================================================
+# Cache ratio inference
+# =============================================================================
+
+
+class TestCacheRatios:
+    """Tests for inferring hit ratios from existing stats keys."""
+
+    def test_generic_hits_and_misses(self):
+        """<prefix>cache_hits pairs with <prefix>cache_misses."""
+        stats = Counter({"extract_cache_hits": 9, "extract_cache_misses": 1})
+        assert cache_ratios_from_counter(stats) == {"extract": (9, 1)}
+
+    def test_singular_keys(self):
+        """The Apple Music isrc_cache_hit / isrc_cache_miss keys are recognized."""
+        stats = Counter({"isrc_cache_hit": 3, "isrc_cache_miss": 2, "cache_hit": 1, "cache_miss": 4})
+        assert cache_ratios_from_counter(stats) == {"isrc": (3, 2), "cache": (1, 4)}
+
+    def test_spotify_keys(self):
+        """Spotify counts misses as api queries."""
+        stats = Counter(
+            {"main_cache_hits": 10, "main_api_queries": 2, "id_cache_hits": 4, "id_api_queries": 0}
+        )
+        assert cache_ratios_from_counter(stats) == {"main": (10, 2), "id": (4, 0)}
+
+    def test_youtube_keys(self):
+        """YouTube Music and video stats have their own names for misses."""
+        ytm = Counter({"main_cache_hits": 5, "search_api_calls": 5})
+        ytv = Counter({"ytv_cache_hits": 1, "ytv_api_calls": 3})
+        assert cache_ratios_from_counter(ytm) == {"youtube_music_search": (5, 5)}
+        assert cache_ratios_from_counter(ytv) == {"ytv": (1, 3)}
+
+
+# =============================================================================
+# Registry
+# =============================================================================
+
+
+class TestMetricsRegistry:
+    """Tests for recording metrics."""
+
+    def test_counter_is_shared(self):
+        """The same stage name returns the same Counter."""
+        metrics = MetricsRegistry()
+        metrics.counter("spotify")["main_cache_hits"] += 1
+        metrics.counter("spotify")["main_cache_hits"] += 1
+        assert metrics.counter("spotify")["main_cache_hits"] == 2
+
+    def test_stage_records_time_and_memory(self):
+        """Stages record wall time, RSS and tracemalloc numbers."""
+        metrics = MetricsRegistry()
+        with metrics.stage("rank") as stats:
+            stats["rows"] += 1
+            data = [0] * 100_000
+            time.sleep(0.01)
+        del data
+
+        record = metrics.report()["stages"]["rank"]
+        assert record["wall_seconds"] >= 0.01
+        assert record["peak_rss_bytes"] > 0
+        assert record["tracemalloc_peak_bytes"] >= 100_000 * 8
+        assert record["error"] is None
+        assert metrics.report()["counters"]["rank"] == {"rows": 1}
+
+    def test_overlapping_stages_keep_tracing(self):
+        """The stage that started tracing ending first doesn't stop it for the others."""
+        metrics = MetricsRegistry()
+        first_started = threading.Event()
+        second_started = threading.Event()
+
+        def first():
+            with metrics.stage("first"):
+                first_started.set()
+                second_started.wait()
+
+        thread = threading.Thread(target=first)
+        thread.start()
+        first_started.wait()
+        with metrics.stage("second"):
+            second_started.set()
+            thread.join()
+            assert tracemalloc.is_tracing()
+            data = [0] * 100_000
+
+        record = metrics.report()["stages"]["second"]
+        assert record["tracemalloc_delta_bytes"] >= 100_000 * 8
+        assert not tracemalloc.is_tracing()
+        del data
+
+    def test_stage_records_error(self):
+        """A failing stage is still recorded, with its error."""
+        metrics = MetricsRegistry(trace_memory=False)
+        with pytest.raises(RuntimeError):
+            with metrics.stage("boom"):
+                raise RuntimeError("nope")
+        assert "nope" in metrics.report()["stages"]["boom"]["error"]
+
+    def test_api_calls(self):
+        """API calls are counted per endpoint with errors."""
+        metrics = MetricsRegistry()
+        for _ in range(3):
+            with metrics.api_call("spotify.search"):
+                pass
+        with pytest.raises(ValueError):
+            with metrics.api_call("spotify.search"):
+                raise ValueError()
+
+        search = metrics.report()["api"]["spotify.search"]
+        assert search["calls"] == 4
+        assert search["errors"] == 1
+        assert sum(search["buckets"].values()) == 4
+
+    def test_timed_wrapper(self):
+        """timed() wraps a client method."""
+        metrics = MetricsRegistry()
+        track = metrics.timed("spotify.track", lambda track_id: {"id": track_id})
+        assert track("abc") == {"id": "abc"}
+        assert metrics.report()["api"]["spotify.track"]["calls"] == 1
+
+    def test_report_cache_ratios(self):
+        """Cache ratios come from Counters and explicit records."""
+        metrics = MetricsRegistry()
+        metrics.counter("youtube_video").update({"ytv_cache_hits": 3, "ytv_api_calls": 1})
+        metrics.record_cache("apple_music", "isrc", 1, 1)
+        caches = metrics.report()["caches"]
+        assert caches["youtube_video.ytv"]["hit_ratio"] == 0.75
+        assert caches["apple_music.isrc"]["hit_ratio"] == 0.5
+
+
+class TestLatencyHistogram:
+    """Tests for the latency histogram."""
+
+    def test_buckets_and_percentiles(self):
+        """Samples land in the right buckets."""
+        histogram = LatencyHistogram(buckets_ms=[10, 100])
+        for seconds in (0.001, 0.005, 0.05, 0.5):
+            histogram.observe(seconds)
+        data = histogram.to_dict()
+        assert data["buckets"] == {"<=10ms": 2, "<=100ms": 1, ">100ms": 1}
+        assert data["p50_ms"] == pytest.approx(50.0)
+        assert data["max_ms"] == pytest.approx(500.0)
+
+
+# =============================================================================
+# Reports
+# =============================================================================
+
+
+class TestWriteReport:
+    """Tests for the JSON and Markdown report files."""
+
+    def test_writes_json_and_markdown(self, tmp_path):
+        """Both files are written and the JSON round-trips."""
+        metrics = MetricsRegistry(run_id="run1", trace_memory=False)
+        with metrics.stage("spotify_canonicalize") as stats:
+            stats.update({"main_cache_hits": 9, "main_api_queries": 1})
+        with metrics.api_call("spotify.search"):
+            pass
+
+        json_path, md_path = metrics.write_report(str(tmp_path))
+        with open(json_path, "r", encoding="utf-8") as f:
+            assert json.load(f)["caches"]["spotify_canonicalize.main"]["hits"] == 9
+        with open(md_path, "r", encoding="utf-8") as f:
+            markdown = f.read()
+        assert "| spotify_canonicalize |" in markdown
+        assert "| spotify.search | 1 | 0 |" in markdown
+
+    def test_markdown_compares_with_previous_run(self, tmp_path):
+        """A falling hit ratio shows up as a negative change."""
+        first = MetricsRegistry(run_id="run1", trace_memory=False)
+        first.record_cache("quotes", "extract", 9, 1)
+        first.write_report(str(tmp_path))
+
+        second = MetricsRegistry(run_id="run2", trace_memory=False)
+        second.record_cache("quotes", "extract", 5, 5)
+        _, md_path = second.write_report(str(tmp_path))
+        with open(md_path, "r", encoding="utf-8") as f:
+            markdown = f.read()
+        assert "Compared with run run1." in markdown
+        assert "| quotes.extract | 5 | 5 | 50.0% | -40.0% |" in markdown
@@ -0,0 +1,170 @@
+"""
+Tests for the notebook's quote extraction (process_all).
+
+Runs the notebook's extraction cells through instructor and the real
+anthropic SDK against a local stand-in: that an API error on one review,
+or overloads that outlast the retries, give that review an api_error row
+instead of aborting the run, and that packed reviews come back in order.
+"""
+import asyncio
+import json
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+NOTEBOOKS_DIR = os.path.join(os.path.dirname(__file__), "../notebooks")
+sys.path.insert(0, NOTEBOOKS_DIR)
+anthropic = pytest.importorskip("anthropic")
+instructor = pytest.importorskip("instructor")
+pytest.importorskip("tqdm")
+
+import anthropic_batch
+import anthropic_concurrency
+import api_cache
+import cache_keys
+import quote_packing
+from anthropic_batch_standin import tool_use_message
+from api_cache import CacheStore
+from pipeline_metrics import MetricsRegistry
+from standin_server import StandInServer
+
+NOTEBOOK_FILENAME = os.path.join(NOTEBOOKS_DIR, "best_songs_merge.ipynb")
+MODEL = "claude-x"
+
+
+def notebook_namespace(store):
+    """The notebook's quote extraction cells, run against store."""
+    with open(NOTEBOOK_FILENAME, encoding="utf-8") as f:
+        cells = ["".join(c["source"]) for c in json.load(f)["cells"] if c["cell_type"] == "code"]
+    namespace = {
+        "api_cache": api_cache,
+        "api_cache_store": store,
+        "cache_keys": cache_keys,
+        "anthropic_batch": anthropic_batch,
+        "anthropic_concurrency": anthropic_concurrency,
+        "metrics": MetricsRegistry(trace_memory=False),
+        "quote_packing": quote_packing,
+    }
+    for marker in ("class QuoteExtraction(", "async def process_all("):
+        exec(next(c for c in cells if marker in c), namespace)
+    return namespace
+
+
+def quote(review):
+    return review.split(".")[0]
+
+
+class QuoteStandIn(StandInServer):
+    """Quotes each review's first sentence back, for single and packed prompts."""
+
+    def route(self, handler, parts, params):
+        self.count("messages")
+        body = json.loads(handler.body)
+        prompt = body["messages"][0]["content"]
+        packed = quote_packing.parse_packed_prompt(prompt)
+        extraction = {"is_usable": True, "issue": "none"}
+        if packed:
+            answer = {"extractions": [{**extraction, "review_id": n, "quote": quote(r)} for n, _, r in packed]}
+        else:
+            answer = {**extraction, "quote": quote(prompt.split(quote_packing.REVIEW_MARKER, 1)[1])}
+        return self.send(handler, 200, tool_use_message(body, answer, "msg_standin"))
+
+
+@pytest.fixture
+def notebook(tmp_path):
+    store = CacheStore(str(tmp_path / "api_cache.sqlite3"))
+    yield notebook_namespace(store)
+    store.close()
+
+
+def make_songs(count):
+    return [
+        {"artist": f"Artist {i}", "name": f"Song {i}", "review": f"Review {i} soars. More.", "review_col": "review"}
+        for i in range(count)
+    ]
+
+
+def run(notebook, standin, songs, concurrency, pack_size=1):
+    client = instructor.from_anthropic(
+        anthropic.AsyncAnthropic(api_key="key", base_url=standin.base_url.rstrip("/"), max_retries=0)
+    )
+    cache = {}
+    stats = Counter()
+    results = asyncio.run(notebook["process_all"](client, songs, cache, MODEL, stats, concurrency, pack_size))
+    return results, cache, stats
+
+
+# =============================================================================
+# Errors
+# =============================================================================
+
+
+class TestErrors:
+    """Tests that one failed request doesn't abort the others."""
+
+    def test_bad_request(self, notebook):
+        """An injected 400 gives one review an api_error row; the rest are extracted and cached."""
+        with QuoteStandIn() as standin:
+            standin.inject(400)
+            results, cache, stats = run(notebook, standin, make_songs(5), anthropic_concurrency.AnthropicConcurrency())
+
+        assert [r["issue"] for r in results].count("api_error") == 1
+        assert sum(r["is_usable"] for r in results) == 4 and len(cache) == 4
+        assert stats["extract_api_other_errors"] == 1
+
+    def test_overloads_outlast_retries(self, notebook):
+        """A review still overloaded after max_retries gets an api_error row."""
+        concurrency = anthropic_concurrency.AnthropicConcurrency(
+            initial_limit=1, max_retries=1, overload_pause_seconds=0
+        )
+        with QuoteStandIn() as standin:
+            standin.inject(529, count=2)
+            results, cache, stats = run(notebook, standin, make_songs(1), concurrency)
+
+        assert results[0]["issue"] == "api_error" and cache == {}
+        assert standin.requests["injected_529"] == 2
+
+    def test_failed_pack(self, notebook):
+        """A pack that fails is retried review by review."""
+        with QuoteStandIn() as standin:
+            standin.inject(400)
+            results, cache, stats = run(
+                notebook, standin, make_songs(3), anthropic_concurrency.AnthropicConcurrency(), pack_size=8
+            )
+
+        assert stats["extract_pack_errors"] == 1 and stats["extract_pack_retries"] == 3
+        assert [r["extracted_quote"] for r in results] == [f"Review {i} soars" for i in range(3)]
+
+
+# =============================================================================
+# Packing
+# =============================================================================
+
+
+class TestPacking:
+    """Tests for extracting several reviews per request."""
+
+    def test_packed_results_in_order(self, notebook):
+        """Packed extractions go back to their own songs, in fewer requests."""
+        with QuoteStandIn() as standin:
+            results, cache, stats = run(
+                notebook, standin, make_songs(10), anthropic_concurrency.AnthropicConcurrency(), pack_size=4
+            )
+
+        assert [r["extracted_quote"] for r in results] == [f"Review {i} soars" for i in range(10)]
+        assert standin.requests["messages"] == 3 and len(cache) == 10
+
+    def test_packs_have_their_own_limiter(self, notebook):
+        """Packs don't count as slow responses against the model's single-review limit."""
+        concurrency = anthropic_concurrency.AnthropicConcurrency()
+        songs = make_songs(9)
+        songs[4]["review"] = "Long. " + "x" * quote_packing.DEFAULT_MAX_PACKED_REVIEW_CHARS
+        with QuoteStandIn() as standin:
+            run(notebook, standin, songs, concurrency, pack_size=4)
+
+        assert sorted(concurrency.limiters) == [MODEL, f"{MODEL}:packed"]
+        assert concurrency.limiter(MODEL).stats["peak_in_flight"] == 1
+        assert concurrency.limiter(f"{MODEL}:packed").stats["peak_in_flight"] == 2
+        assert standin.requests["messages"] == 3
@@ -0,0 +1,236 @@
+"""
+Unit tests for quote_jobs.py.
+
+Tests that jobs move through the primary -> fallback states, that retry
+selection matches the old column-comparison filter, that results come out
+in the old order, and that a stored table resumes each job where it
+stopped unless its review or models changed, and that failed API calls
+are sent again on the next run.
+"""
+import os
+import sys
+import time
+
+import pandas
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from api_cache import CacheStore
+from quote_jobs import (
+    FALLBACK_FAILED,
+    FALLBACK_OK,
+    PENDING,
+    PRIMARY_FAILED,
+    PRIMARY_OK,
+    QuoteJobTable,
+    review_source,
+)
+
+
+def make_songs(count, sources=("pitchfork", "rolling_stone")):
+    return [
+        {
+            "artist": f"Artist {i}",
+            "name": f"Song {i}",
+            "review": f"Review {i} of {source}",
+            "review_col": f"description_{source}",
+        }
+        for i in range(count)
+        for source in sources
+    ]
+
+
+def verify(songs, model, fails, issue="none"):
+    """Rows like build_verified_quote_result_dict_df, failing songs where fails(song)."""
+    return pandas.DataFrame.from_records(
+        [
+            {
+                "artist": song["artist"],
+                "name": song["name"],
+                "source": review_source(song["review_col"]),
+                "quote": None if fails(song) else f"quote of {song['review']}",
+                "quote_error": f"Not usable: {issue}" if fails(song) else None,
+                "quote_model": model,
+            }
+            for song in songs
+        ]
+    ).to_dict(orient="records")
+
+
+def primary_fails(song):
+    return int(song["artist"].split()[-1]) % 3 == 0
+
+
+def fallback_fails(song):
+    return int(song["artist"].split()[-1]) % 2 == 0
+
+
+def run(jobs, stop_after_chunks=None, chunk_size=4):
+    """Runs the cascade like add_quotes_with_verification_and_fallback, optionally stopping early."""
+    done = 0
+    for state, model, fails in [(PENDING, "small", primary_fails), (PRIMARY_FAILED, "large", fallback_fails)]:
+        for chunk in jobs.chunks(state, chunk_size):
+            if done == stop_after_chunks:
+                return
+            jobs.record(verify(chunk, model, fails), fallback=state == PRIMARY_FAILED)
+            done += 1
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CacheStore(str(tmp_path / "api_cache.sqlite3"))
+    yield store
+    store.close()
+
+
+# =============================================================================
+# Cascade
+# =============================================================================
+
+
+class TestCascade:
+    """Jobs go to the fallback model only when the primary fails."""
+
+    def test_states(self):
+        """Each job ends in the state its two results lead to."""
+        jobs = QuoteJobTable(make_songs(6), "small", "large")
+        assert jobs.state_counts() == {PENDING: 12}
+        run(jobs)
+        assert jobs.state("Artist 1", "Song 1", "pitchfork") == PRIMARY_OK
+        assert jobs.state("Artist 3", "Song 3", "pitchfork") == FALLBACK_OK
+        assert jobs.state("Artist 0", "Song 0", "rolling_stone") == FALLBACK_FAILED
+        assert jobs.state_counts() == {PRIMARY_OK: 8, FALLBACK_OK: 2, FALLBACK_FAILED: 2}
+
+    def test_retry_selection_matches_column_filter(self):
+        """The fallback gets exactly the songs the old DataFrame filter picked, in order."""
+        songs = make_songs(10)
+        jobs = QuoteJobTable(songs, "small", "large")
+        rows = verify(songs, "small", primary_fails)
+        jobs.record(rows, fallback=False)
+
+        missing_df = pandas.DataFrame.from_records(rows)
+        missing_df = missing_df[missing_df["quote_error"].notna()]
+        expected = [
+            song
+            for song in songs
+            if (
+                (missing_df["artist"] == song["artist"])
+                & (missing_df["name"] == song["name"])
+                & (missing_df["source"] == review_source(song["review_col"]))
+            ).any()
+        ]
+        assert jobs.songs_in(PRIMARY_FAILED) == expected
+
+    def test_results_in_old_order(self):
+        """Primary successes come first, then every fallback result, each in input order."""
+        songs = make_songs(7)
+        jobs = QuoteJobTable(songs, "small", "large")
+        run(jobs)
+
+        results1 = pandas.DataFrame.from_records(verify(songs, "small", primary_fails))
+        retry = [s for s in songs if primary_fails(s)]
+        results2 = pandas.DataFrame.from_records(verify(retry, "large", lambda s: primary_fails(s) and fallback_fails(s)))
+        expected = pandas.concat([results1[results1["quote_error"].isna()], results2], ignore_index=True)
+        pandas.testing.assert_frame_equal(jobs.results_df(), expected)
+
+    def test_duplicate_reviews_rejected(self):
+        """Two reviews from one source for one song can't share a job."""
+        with pytest.raises(ValueError, match="Multiple reviews"):
+            QuoteJobTable(make_songs(2) + make_songs(1), "small", "large")
+
+    def test_recording_twice_fails(self):
+        """A job only moves forward from the state the step expects."""
+        songs = make_songs(1)
+        jobs = QuoteJobTable(songs, "small", "large")
+        jobs.record(verify(songs, "small", lambda s: False), fallback=False)
+        with pytest.raises(AssertionError):
+            jobs.record(verify(songs, "small", lambda s: False), fallback=False)
+
+    def test_scales(self):
+        """Tens of thousands of reviews go through the cascade bookkeeping quickly."""
+        songs = make_songs(15000)
+        start = time.perf_counter()
+        jobs = QuoteJobTable(songs, "small", "large")
+        run(jobs, chunk_size=500)
+        assert len(jobs.results_df()) == 30000
+        assert time.perf_counter() - start < 10
+
+
+# =============================================================================
+# Resuming
+# =============================================================================
+
+
+class TestResume:
+    """A stored table picks up where an interrupted run stopped."""
+
+    def test_resume_after_interruption(self, store, tmp_path):
+        """Recorded chunks aren't asked again after a restart; the rest are."""
+        songs = make_songs(6)
+        stored = store.namespace("quote_jobs")
+        run(QuoteJobTable(songs, "small", "large", stored=stored), stop_after_chunks=2)
+        stored.flush()
+
+        reopened = CacheStore(str(tmp_path / "api_cache.sqlite3"))
+        resumed = QuoteJobTable(songs, "small", "large", stored=reopened.namespace("quote_jobs"))
+        assert len(resumed.songs_in(PENDING)) == 4
+        assert resumed.stats["resumed_primary-ok"] + resumed.stats["resumed_primary-failed"] == 8
+        run(resumed)
+
+        uninterrupted = QuoteJobTable(songs, "small", "large")
+        run(uninterrupted)
+        pandas.testing.assert_frame_equal(resumed.results_df(), uninterrupted.results_df())
+        reopened.close()
+
+    def test_fallback_step_resumes_without_primary(self, store):
+        """Jobs that failed on the primary model go straight to the fallback."""
+        songs = make_songs(3)
+        stored = store.namespace("quote_jobs")
+        jobs = QuoteJobTable(songs, "small", "large", stored=stored)
+        jobs.record(verify(songs, "small", primary_fails), fallback=False)
+
+        resumed = QuoteJobTable(songs, "small", "large", stored=stored)
+        assert resumed.songs_in(PENDING) == []
+        assert resumed.songs_in(PRIMARY_FAILED) == [s for s in songs if primary_fails(s)]
+
+    def test_changed_review_or_model_restarts(self, store):
+        """A new review text or model makes the job pending again."""
+        songs = make_songs(2)
+        stored = store.namespace("quote_jobs")
+        run(QuoteJobTable(songs, "small", "large", stored=stored))
+
+        songs[0] = {**songs[0], "review": "A rewritten review"}
+        resumed = QuoteJobTable(songs, "small", "large", stored=stored)
+        assert resumed.songs_in(PENDING) == [songs[0]]
+        assert resumed.stats["restarted"] == 1
+        assert len(QuoteJobTable(songs, "small", "larger", stored=stored).songs_in(PENDING)) == 4
+        assert FALLBACK_OK not in QuoteJobTable(songs, "small", "larger").state_counts()
+
+    def test_api_errors_are_sent_again(self, store):
+        """Jobs whose request failed go on to the fallback, but a resumed table retries them."""
+        songs = make_songs(3)
+        stored = store.namespace("quote_jobs")
+        jobs = QuoteJobTable(songs, "small", "large", stored=stored)
+        jobs.record(verify(songs, "small", primary_fails, issue="api_error"), fallback=False)
+        failed = [s for s in songs if primary_fails(s)]
+        assert jobs.songs_in(PRIMARY_FAILED) == failed
+        jobs.record(verify(failed, "large", lambda s: True, issue="api_error"), fallback=True)
+        assert jobs.songs_in(FALLBACK_FAILED) == failed and jobs.stats["transient_failures"] == 4
+        assert len(jobs.results_df()) == len(songs)
+
+        resumed = QuoteJobTable(songs, "small", "large", stored=stored)
+        assert resumed.songs_in(PENDING) == failed
+        run(resumed)
+        assert resumed.state_counts() == {PRIMARY_OK: 4, FALLBACK_FAILED: 2}
+
+    def test_fallback_api_errors_are_sent_again(self, store):
+        """A fallback request that failed leaves the job primary-failed for the next run."""
+        songs = make_songs(3)
+        stored = store.namespace("quote_jobs")
+        jobs = QuoteJobTable(songs, "small", "large", stored=stored)
+        jobs.record(verify(songs, "small", primary_fails), fallback=False)
+        failed = jobs.songs_in(PRIMARY_FAILED)
+        jobs.record(verify(failed, "large", lambda s: True, issue="api_error"), fallback=True)
+
+        resumed = QuoteJobTable(songs, "small", "large", stored=stored)
+        assert resumed.songs_in(PRIMARY_FAILED) == failed
@@ -0,0 +1,137 @@
+"""
+Unit tests for quote_packing.py.
+
+Tests grouping short reviews into packs, that packed prompts can be read
+back review by review, matching numbered extractions to their reviews, and
+that packing the cached reviews cuts requests and input tokens several-fold.
+"""
+import json
+import math
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from quote_packing import (
+    DEFAULT_MAX_PACKED_REVIEW_CHARS,
+    cached_system,
+    pack,
+    packed_prompt,
+    parse_packed_prompt,
+    review_prompt,
+    unpack,
+)
+
+QUOTE_CACHE_FILENAME = os.path.join(
+    os.path.dirname(__file__), "../notebooks/caches/anthropic_extract_quote_cache.json"
+)
+
+# About the length of EXTRACT_QUOTE_INSTRUCTIONS in the notebook
+INSTRUCTION_CHARS = 3850
+
+
+def make_song(i, review=None):
+    return {"artist": f"Artist {i}", "name": f"Song {i}", "review": review or f"Review {i} is great."}
+
+
+def tokens(text_chars):
+    return math.ceil(text_chars / 4)
+
+
+# =============================================================================
+# Packing
+# =============================================================================
+
+
+class TestPack:
+    """Tests for grouping reviews into requests."""
+
+    def test_packs_in_order(self):
+        """Items fill packs of pack_size in input order."""
+        assert pack(list(range(10)), lambda i: 10, pack_size=4) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+    def test_long_reviews_alone(self):
+        """A review over max_review_chars gets its own pack without breaking the current one."""
+        lengths = {"a": 10, "b": 5000, "c": 10}
+        assert pack("abc", lengths.get, pack_size=4) == [["b"], ["a", "c"]]
+
+    def test_pack_chars(self):
+        """A pack stops growing before max_pack_chars."""
+        packs = pack(list(range(6)), lambda i: 1000, pack_size=8, max_pack_chars=2500)
+        assert packs == [[0, 1], [2, 3], [4, 5]]
+
+    def test_pack_size_one(self):
+        """pack_size 1 sends every review on its own."""
+        assert pack("abc", lambda i: 1, pack_size=1) == [["a"], ["b"], ["c"]]
+
+
+# =============================================================================
+# Prompts
+# =============================================================================
+
+
+class TestPrompts:
+    """Tests for the request layout."""
+
+    def test_system_prompt_is_cached(self):
+        """The instructions are one system block marked for prompt caching."""
+        assert cached_system("Do this.") == [
+            {"type": "text", "text": "Do this.", "cache_control": {"type": "ephemeral"}}
+        ]
+
+    def test_review_prompt_has_no_instructions(self):
+        """The user message is just the song and its review."""
+        prompt = review_prompt("Artist", "Song", "A review.")
+        assert prompt.endswith("Review text:\nA review.") and '"Song" by Artist' in prompt
+
+    def test_packed_prompt_round_trip(self):
+        """Each review can be read back from a packed prompt with its number and song."""
+        songs = [
+            make_song(1, "First line.\n\nSecond paragraph: with a colon."),
+            {"artist": "Tyler, the Creator", "name": 'Say "Hi": Remix', "review": "Short."},
+        ]
+        parsed = parse_packed_prompt(packed_prompt(songs))
+        assert [(n, r) for n, _, r in parsed] == [(1, songs[0]["review"]), (2, "Short.")]
+        assert 'Say "Hi": Remix' in parsed[1][1] and "Tyler, the Creator" in parsed[1][1]
+
+    def test_single_prompt_is_not_packed(self):
+        """A one-review prompt isn't mistaken for a packed one."""
+        assert parse_packed_prompt(review_prompt("Artist", "Song", "Review 2 of x:\nno")) == []
+
+    def test_unpack(self):
+        """Extractions go back to their reviews; skipped ones are None, extras are dropped."""
+        extractions = [SimpleNamespace(review_id=n, quote=q) for n, q in [(3, "c"), (1, "a"), (1, "x"), (9, "z")]]
+        unpacked = unpack(extractions, 3)
+        assert [e and e.quote for e in unpacked] == ["a", None, "c"]
+
+
+# =============================================================================
+# Savings
+# =============================================================================
+
+
+class TestSavings:
+    """Packing the cached reviews against sending each with the full prompt."""
+
+    def test_full_refresh_savings(self):
+        """Requests and input tokens for every cached review drop several-fold."""
+        if not os.path.exists(QUOTE_CACHE_FILENAME):
+            pytest.skip("No quote cache")
+        with open(QUOTE_CACHE_FILENAME, encoding="utf-8") as f:
+            songs = list(json.load(f).values())
+        assert len(songs) > 1000
+
+        def prompt(songs):
+            if len(songs) > 1:
+                return packed_prompt(songs)
+            return review_prompt(songs[0]["artist"], songs[0]["name"], songs[0]["review"])
+
+        packs = pack(songs, lambda s: len(s["review"]))
+        unpacked_tokens = sum(tokens(INSTRUCTION_CHARS + len(prompt([s]))) for s in songs)
+        packed_tokens = sum(tokens(INSTRUCTION_CHARS + len(prompt(p))) for p in packs)
+        assert len(songs) / len(packs) > 5
+        assert unpacked_tokens / packed_tokens > 3
+        assert sum(len(p) for p in packs) == len(songs)
+        assert all(len(p) == 1 for p in packs if len(p[0]["review"]) > DEFAULT_MAX_PACKED_REVIEW_CHARS)
@@ -0,0 +1,183 @@
+"""
+Unit tests for quote_verify.py.
+
+Tests that the translate-table normalization and the cached, batched part
+checks give exactly the results of the old notebook normalize_text and
+verify_quote, on hand-written cases and on every quote in the extraction
+cache, and that verifying tens of thousands of quotes stays fast.
+"""
+import json
+import os
+import re
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from quote_verify import normalize_text, normalized_review, verify_quote
+
+QUOTE_CACHE_FILENAME = os.path.join(
+    os.path.dirname(__file__), "../notebooks/caches/anthropic_extract_quote_cache.json"
+)
+
+
+# =============================================================================
+# Reference implementation (the old notebook version)
+# =============================================================================
+
+
+def reference_normalize_text(text):
+    text = text.strip()
+    text = text.replace("…", "...")
+    for c in "’’’‘''ʼʻˈ`ʹʽʾʿ′":
+        text = text.replace(c, "'")
+    for c in '""”“„‟«»❝❞〝〞＂""':
+        text = text.replace(c, '"')
+    for c in "—–−‐‑‒":
+        text = text.replace(c, "-")
+    return " ".join(text.split())
+
+
+def reference_extract_fixed_end_punctuation(normalized_text, normalized_review):
+    if normalized_text.lower() in normalized_review.lower():
+        return normalized_text
+    if not normalized_text.endswith('"') and not normalized_text.endswith("'"):
+        return None
+    text = normalized_text[:-1]
+    pos = normalized_review.lower().find(text.lower())
+    if pos < 0:
+        return None
+    real_end = normalized_review.lower().find(normalized_text[-1].lower(), pos + len(text))
+    return normalized_review[pos : real_end + 1]
+
+
+def reference_verify_quote(quote, review):
+    if not quote:
+        return {"valid": True, "parts": [], "missing": [], "auto_fixed": [], "debug": None}
+    parts = [p.strip() for p in quote.split(" ... ")]
+    review_normalized = reference_normalize_text(review)
+    missing, auto_fixed, debug, final_parts = [], [], [], []
+    for p in parts:
+        if not p:
+            continue
+        p_clean = re.sub(r"\s*\[[^\]]*\]\s*", " ", p)
+        p_clean = " ".join(p_clean.split())
+        p_normalized = reference_normalize_text(p_clean)
+        if p_normalized.lower() in review_normalized.lower():
+            final_parts.append(p)
+            continue
+        p_no_article = re.sub(r"^(a|an|the)\s+", "", p_normalized, flags=re.IGNORECASE)
+        if p_no_article.lower() in review_normalized.lower():
+            auto_fixed.append({"original": p, "fix": "stripped leading article", "fixed": {p_no_article}})
+            final_parts.append(p_no_article)
+            continue
+        fixed = reference_extract_fixed_end_punctuation(p_normalized, review_normalized)
+        if fixed is not None:
+            auto_fixed.append({"original": p, "fix": "stripped trailing punctuation", "fixed": {fixed}})
+            final_parts.append(fixed)
+            continue
+        both = reference_extract_fixed_end_punctuation(p_no_article, review_normalized)
+        if both is not None:
+            auto_fixed.append({"original": p, "fix": "stripped article + punctuation", "fixed": {both}})
+            final_parts.append(both)
+            continue
+        debug.append({"part_repr": p, "part_normalized": p_normalized})
+        missing.append(p)
+    result = {
+        "valid": len(missing) == 0,
+        "parts": parts,
+        "missing": missing,
+        "auto_fixed": auto_fixed,
+        "debug": debug if debug else None,
+        "review_normalized": review_normalized,
+    }
+    if not missing and auto_fixed:
+        result["fixed"] = " ... ".join(final_parts)
+    return result
+
+
+REVIEW = (
+    "It’s the best song since Radiohead’s “Black Star.” A giddy, stoned flirtation — "
+    "hinting at a nervous longing…   just beneath the surface."
+)
+
+
+@pytest.fixture(scope="module")
+def cached_quotes():
+    with open(QUOTE_CACHE_FILENAME, encoding="utf-8") as f:
+        return [
+            (result["extracted_quote"], result["review"])
+            for result in json.load(f).values()
+            if result.get("extracted_quote") and result.get("review")
+        ]
+
+
+# =============================================================================
+# Normalization
+# =============================================================================
+
+
+class TestNormalizeText:
+    """One translate table should do what the chained replaces did."""
+
+    def test_matches_reference(self):
+        """Every quote, double quote and dash variant maps the same way."""
+        text = "  ‘a’ ʼbʻ “c” „d‟ «e» 〝f〞 ＂g＂ h—i–j−k‐l‑m‒n… \t o  "
+        assert normalize_text(text) == reference_normalize_text(text)
+        assert normalize_text(REVIEW) == reference_normalize_text(REVIEW)
+
+    def test_review_is_cached(self):
+        """A review is normalized and lowercased once however often it is quoted."""
+        normalized_review.cache_clear()
+        verify_quote("the best song", REVIEW)
+        verify_quote("giddy, stoned flirtation", REVIEW)
+        info = normalized_review.cache_info()
+        assert (info.misses, info.hits) == (1, 1)
+        assert normalized_review(REVIEW)[1] == reference_normalize_text(REVIEW).lower()
+
+
+# =============================================================================
+# Verification
+# =============================================================================
+
+
+class TestVerifyQuote:
+    """verify_quote should return exactly what the old version did."""
+
+    @pytest.mark.parametrize(
+        "quote",
+        [
+            "",
+            "the best song since Radiohead's \"Black Star\"",
+            "A giddy, stoned flirtation ... hinting at [a] nervous longing",
+            "The giddy, stoned flirtation",
+            "[It's] the best song ... just beneath the surface",
+            "the best song ... not in the review",
+            "An entirely made up quote",
+            "The best song since Radiohead's \"Black Star\"",
+        ],
+    )
+    def test_matches_reference(self, quote):
+        """Exact, article-stripped, punctuation-fixed and missing parts agree."""
+        assert verify_quote(quote, REVIEW) == reference_verify_quote(quote, REVIEW)
+
+    def test_fixes_end_punctuation(self):
+        """A quote that moved a period out of quotation marks is fixed up."""
+        result = verify_quote("best song since Radiohead's \"Black Star\"", REVIEW)
+        assert result["valid"]
+        assert result["fixed"] == "best song since Radiohead's \"Black Star.\""
+
+    def test_matches_reference_on_cached_quotes(self, cached_quotes):
+        """Every quote in the extraction cache verifies as it did before."""
+        assert cached_quotes
+        for quote, review in cached_quotes:
+            assert verify_quote(quote, review) == reference_verify_quote(quote, review), quote
+
+    def test_many_quotes_are_fast(self, cached_quotes):
+        """Tens of thousands of verifications take well under a few seconds."""
+        batch = cached_quotes * (20000 // len(cached_quotes) + 1)
+        start = time.perf_counter()
+        for quote, review in batch:
+            verify_quote(quote, review)
+        assert time.perf_counter() - start < 2.0
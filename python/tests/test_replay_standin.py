@@ -0,0 +1,267 @@
+"""
+Unit tests for replay_standin.py and the fault injection in standin_server.py.
+
+Points the pipeline's real clients (spotipy, the async Spotify search
+client, AppleMusicClient, the Anthropic SDK through instructor) at a replay
+stand-in filled from a temporary cache store.
+"""
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+import api_cache
+from api_cache import CacheStore
+from apple_music_client import AppleMusicClient
+from apple_music_standin import AppleMusicStandIn, make_fake_song
+from replay_standin import RECORDINGS_NAMESPACE, ReplayStandIn, ReplayYTMusic, pipeline_store
+from spotify_async import AsyncSpotifySearchClient, run_search_many
+from spotify_cache import SpotifyCache
+from spotify_standin import make_fake_artist, make_fake_track
+
+REVIEW = "A giddy, stoned flirtation rendered in dance-pop form."
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CacheStore(str(tmp_path / "cache.sqlite3"))
+    spotify = SpotifyCache(store)
+    spotify["artist 1 song 1"] = {"tracks": {"items": [make_fake_track(1), make_fake_track(2)]}}
+    spotify.add_item(make_fake_track(3))
+    store.namespace(api_cache.SPOTIFY_ARTIST_NAMESPACE)["artist0001"] = make_fake_artist("artist0001")
+    song = make_fake_song(1)
+    store.namespace(api_cache.APPLE_MUSIC_NAMESPACE)["isrc:USXX10000001"] = song
+    store.namespace(api_cache.YOUTUBE_MUSIC_SEARCH_NAMESPACE)["Artist Song"] = [{"videoId": "abc"}]
+    store.namespace(api_cache.ANTHROPIC_EXTRACT_QUOTE_NAMESPACE)["k"] = {
+        "artist": "Artist",
+        "name": "Song",
+        "review_col": "review_1",
+        "extracted_quote": "a giddy, stoned flirtation",
+        "is_usable": True,
+        "issue": "none",
+        "review": REVIEW,
+    }
+    store.flush()
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def standin(store):
+    with ReplayStandIn(store) as standin:
+        yield standin
+
+
+# =============================================================================
+# Replay from caches
+# =============================================================================
+
+
+class TestReplayFromCaches:
+    """Tests for answering each service from the pipeline's caches."""
+
+    def test_spotify(self, standin):
+        """spotipy gets cached searches, tracks and artists."""
+        import spotipy
+
+        sp = spotipy.Spotify(auth="token", retries=0, status_retries=0)
+        sp.prefix = standin.url("spotify")
+        results = sp.search(q="artist 1 song 1", type="track", limit=1)
+        assert [t["id"] for t in results["tracks"]["items"]] == ["track000001"]
+        assert sp.search(q="unknown", type="track")["tracks"]["items"] == []
+        tracks = sp.tracks(["track000003", "track999999"])["tracks"]
+        assert tracks[0]["name"] == "Song 3" and tracks[1] is None
+        assert sp.artist("artist0001")["genres"] == ["pop"]
+
+    def test_spotify_async(self, standin):
+        """The async search client works against the stand-in."""
+        client = AsyncSpotifySearchClient(lambda: "token", prefix=standin.url("spotify"))
+        results = run_search_many(client, ["artist 1 song 1", "unknown"])
+        client.close()
+        assert results["artist 1 song 1"]["tracks"]["items"][0]["id"] == "track000001"
+        assert results["unknown"] is None
+
+    def test_apple_music(self, standin):
+        """ISRC lookups come from the isrc: cache entries."""
+        client = AppleMusicClient(lambda: "token", base_url=standin.url("apple"), rate_per_second=1000)
+        found = client.songs_by_isrc(["USXX10000001", "USXX10000002"])
+        client.close()
+        assert list(found) == ["USXX10000001"]
+
+    def test_youtube_music(self, standin):
+        """ReplayYTMusic searches the cached results by filter."""
+        yt = ReplayYTMusic(standin.url("ytmusic"))
+        assert yt.search("Artist Song", filter="songs", limit=1) == [{"videoId": "abc"}]
+        assert yt.search("Artist Song", filter="videos", limit=5) == []
+
+    def test_anthropic(self, standin):
+        """A quote extraction through instructor is answered from the quote cache."""
+        anthropic = pytest.importorskip("anthropic")
+        instructor = pytest.importorskip("instructor")
+        from pydantic import BaseModel
+
+        class QuoteExtraction(BaseModel):
+            quote: str
+            is_usable: bool
+            issue: str
+
+        client = instructor.from_anthropic(
+            anthropic.Anthropic(api_key="key", base_url=standin.url("anthropic"), max_retries=0)
+        )
+        prompt = f'Extract a quote from this review of "Song" by Artist.\n\nReview text:\n{REVIEW}'
+        result = client.messages.create(
+            model="claude-x",
+            max_tokens=512,
+            response_model=QuoteExtraction,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        assert result.quote == "a giddy, stoned flirtation"
+        assert result.is_usable
+
+        with pytest.raises(Exception):
+            client.messages.create(
+                model="claude-x",
+                max_tokens=512,
+                response_model=QuoteExtraction,
+                messages=[{"role": "user", "content": "Review text:\nsomething else"}],
+                max_retries=0,
+            )
+
+    def test_anthropic_packed(self, standin):
+        """Packed reviews are answered one extraction each, leaving out uncached ones."""
+        anthropic = pytest.importorskip("anthropic")
+        instructor = pytest.importorskip("instructor")
+        from pydantic import BaseModel
+        from quote_packing import packed_prompt
+
+        class NumberedQuoteExtraction(BaseModel):
+            review_id: int
+            quote: str
+            is_usable: bool
+            issue: str
+
+        class QuoteExtractions(BaseModel):
+            extractions: list[NumberedQuoteExtraction]
+
+        client = instructor.from_anthropic(
+            anthropic.Anthropic(api_key="key", base_url=standin.url("anthropic"), max_retries=0)
+        )
+        songs = [
+            {"artist": "Other", "name": "Uncached", "review": "Not in the cache."},
+            {"artist": "Artist", "name": "Song", "review": REVIEW},
+        ]
+        result = client.messages.create(
+            model="claude-x",
+            max_tokens=1024,
+            response_model=QuoteExtractions,
+            messages=[{"role": "user", "content": packed_prompt(songs)}],
+        )
+        assert [(e.review_id, e.quote) for e in result.extractions] == [(2, "a giddy, stoned flirtation")]
+
+    def test_anthropic_batches(self, standin):
+        """A Message Batch of quote extractions is answered from the quote cache."""
+        anthropic = pytest.importorskip("anthropic")
+        import asyncio
+
+        from anthropic_batch import MessageBatchRunner, message_params
+        from pydantic import BaseModel
+
+        class QuoteExtraction(BaseModel):
+            quote: str
+            is_usable: bool
+            issue: str
+
+        prompt = f'Extract a quote from this review of "Song" by Artist.\n\nReview text:\n{REVIEW}'
+        requests = {
+            "req_cached": message_params("claude-x", 512, prompt, QuoteExtraction),
+            "req_missing": message_params("claude-x", 512, "Review text:\nsomething else", QuoteExtraction),
+        }
+        client = anthropic.AsyncAnthropic(api_key="key", base_url=standin.url("anthropic"), max_retries=0)
+        results = asyncio.run(MessageBatchRunner(client, poll_seconds=0.01).run(requests))
+        assert results["req_cached"]["message"]["content"][0]["input"]["quote"] == "a giddy, stoned flirtation"
+        assert results["req_missing"]["type"] == "errored"
+
+
+# =============================================================================
+# Recording and faults
+# =============================================================================
+
+
+class TestRecordAndFaults:
+    """Tests for record mode and injected latency and errors."""
+
+    def test_records_misses_and_replays_them(self, store):
+        """In record mode a miss goes upstream once, then replays offline."""
+        songs = [make_fake_song(i) for i in range(3)]
+        with AppleMusicStandIn(songs, {"Artist 2 Song 2": [songs[2]["id"]]}) as upstream:
+            upstreams = {"apple": upstream.base_url}
+            with ReplayStandIn(store, record=True, upstreams=upstreams) as standin:
+                client = AppleMusicClient(lambda: "token", base_url=standin.url("apple"))
+                first = client.search_songs(["Artist 2 Song 2"])
+                assert upstream.requests["search"] == 1
+            assert len(store.namespace(RECORDINGS_NAMESPACE)) == 1
+
+        with ReplayStandIn(store) as standin:
+            client = AppleMusicClient(lambda: "token", base_url=standin.url("apple"))
+            assert client.search_songs(["Artist 2 Song 2"]) == first
+            assert standin.requests["apple.recorded"] == 1
+
+    def test_random_faults_are_retried(self, store):
+        """Seeded 429s are retried after Retry-After by the client."""
+        stats = Counter()
+        with ReplayStandIn(store, error_rates={429: 0.4}, retry_after_seconds=0, seed=1) as standin:
+            client = AppleMusicClient(
+                lambda: "token", base_url=standin.url("apple"), rate_per_second=1000,
+                max_retries=20, stats=stats,
+            )
+            for _ in range(10):
+                assert client.fetch(client.catalog_url("songs"), {"filter[isrc]": "USXX10000001"})
+        assert standin.requests["injected_429"] == stats["rate_limited"] > 0
+        assert standin.requests["apple.cached"] == 10
+
+    def test_faults_are_reproducible(self, store):
+        """The same seed injects the same faults."""
+        counts = []
+        for _ in range(2):
+            with ReplayStandIn(store, error_rates={503: 0.5}, seed=7) as standin:
+                yt = ReplayYTMusic(standin.url("ytmusic"))
+                outcomes = []
+                for _ in range(20):
+                    try:
+                        yt.search("Artist Song", filter="songs")
+                        outcomes.append(True)
+                    except Exception:
+                        outcomes.append(False)
+                counts.append(outcomes)
+        assert counts[0] == counts[1]
+        assert not all(counts[0])
+
+
+# =============================================================================
+# Pipeline store
+# =============================================================================
+
+
+class TestPipelineStore:
+    """The pipeline's own store in stand-in runs."""
+
+    def test_copy_keeps_misses_out_of_the_real_store(self, store, tmp_path):
+        """The copy starts with the real caches; "nothing found" entries stay in the copy."""
+        copy_filename = str(tmp_path / "standin.sqlite3")
+        copy = pipeline_store(store.filename, copy_filename)
+        assert copy.namespaces() == store.namespaces()
+        copy.negative(api_cache.SPOTIFY_NAMESPACE).add("artist 9 song 9")
+        copy.close()
+
+        assert "artist 9 song 9" not in store.negative(api_cache.SPOTIFY_NAMESPACE)
+        fresh = pipeline_store(store.filename, copy_filename)
+        assert "artist 9 song 9" not in fresh.negative(api_cache.SPOTIFY_NAMESPACE)
+        fresh.close()
+
+    def test_missing_source(self, tmp_path):
+        """Without a real store the copy starts empty, and none is created."""
+        copy = pipeline_store(str(tmp_path / "missing.sqlite3"), str(tmp_path / "standin.sqlite3"))
+        assert copy.namespaces() == {} and not os.path.exists(tmp_path / "missing.sqlite3")
+        copy.close()
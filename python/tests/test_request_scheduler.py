@@ -0,0 +1,152 @@
+"""
+Unit tests for request_scheduler.py and rate_limit.AdaptiveRateLimiter.
+
+Tests rate adaptation, retries, in-flight deduplication and concurrency of
+the worker pool used for YouTube Music searches.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from rate_limit import AdaptiveRateLimiter
+from request_scheduler import RequestScheduler
+
+
+def make_scheduler(max_workers=4, **limiter_kwargs):
+    limiter_kwargs.setdefault("initial_rate", 1000)
+    limiter_kwargs.setdefault("min_rate", 1)
+    limiter_kwargs.setdefault("max_rate", 1000)
+    limiter_kwargs.setdefault("error_pause_seconds", 0)
+    return RequestScheduler(
+        max_workers=max_workers,
+        limiter=AdaptiveRateLimiter(**limiter_kwargs),
+        retry_backoff_seconds=0,
+    )
+
+
+# =============================================================================
+# Adaptive rate
+# =============================================================================
+
+
+class TestAdaptiveRateLimiter:
+    """Tests for additive increase and multiplicative decrease of the rate."""
+
+    def test_increases_after_successes(self):
+        """The rate rises by increase_step after increase_after successes."""
+        limiter = AdaptiveRateLimiter(2, 1, 3, increase_step=0.5, increase_after=2)
+        for _ in range(4):
+            limiter.on_success()
+        assert limiter.rate == 3.0
+        for _ in range(4):
+            limiter.on_success()
+        assert limiter.rate == 3.0
+
+    def test_decreases_on_error(self):
+        """Errors halve the rate down to min_rate."""
+        limiter = AdaptiveRateLimiter(4, 1, 8, error_pause_seconds=0)
+        limiter.on_error()
+        assert limiter.rate == 2.0
+        limiter.on_error()
+        limiter.on_error()
+        assert limiter.rate == 1.0
+
+    def test_error_resets_success_streak(self):
+        """Successes before an error don't count toward the next increase."""
+        limiter = AdaptiveRateLimiter(2, 1, 8, increase_after=3, error_pause_seconds=0)
+        limiter.on_success()
+        limiter.on_success()
+        limiter.on_error()
+        limiter.on_success()
+        assert limiter.rate == 1.0
+
+
+# =============================================================================
+# Scheduler
+# =============================================================================
+
+
+class TestRequestScheduler:
+    """Tests for the worker pool."""
+
+    def test_runs_concurrently(self):
+        """Calls overlap up to max_workers."""
+        scheduler = make_scheduler(max_workers=4)
+        barrier = threading.Barrier(4, timeout=5)
+
+        def search(query):
+            barrier.wait()
+            return [query]
+
+        futures = [scheduler.submit(("songs", i), search, i) for i in range(4)]
+        assert [f.result() for f in futures] == [[0], [1], [2], [3]]
+        scheduler.shutdown()
+
+    def test_deduplicates_in_flight(self):
+        """The same key submitted while pending runs once."""
+        scheduler = make_scheduler()
+        calls = Counter()
+        release = threading.Event()
+
+        def search(query, filter=None):
+            calls[(query, filter)] += 1
+            release.wait(5)
+            return [query]
+
+        first = scheduler.submit(("songs", "q"), search, "q", filter="songs")
+        second = scheduler.submit(("songs", "q"), search, "q", filter="songs")
+        other = scheduler.submit(("videos", "q"), search, "q", filter="videos")
+        release.set()
+        assert first is second
+        assert first.result() == ["q"]
+        assert other.result() == ["q"]
+        assert calls == Counter({("q", "songs"): 1, ("q", "videos"): 1})
+        assert scheduler.stats["deduplicated_requests"] == 1
+
+        # Once finished, the key can run again
+        assert scheduler.call(("songs", "q"), search, "q", filter="songs") == ["q"]
+        assert calls[("q", "songs")] == 2
+        scheduler.shutdown()
+
+    def test_retries_and_slows_down(self):
+        """A failing call is retried and lowers the rate."""
+        scheduler = make_scheduler(initial_rate=100, max_rate=100)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RuntimeError("HTTP 429")
+            return "ok"
+
+        assert scheduler.call("k", flaky) == "ok"
+        assert len(attempts) == 3
+        assert scheduler.limiter.rate == 25.0
+        assert scheduler.stats["request_errors"] == 2
+        scheduler.shutdown()
+
+    def test_gives_up_after_max_retries(self):
+        """The last error is raised to the caller."""
+        scheduler = make_scheduler()
+
+        def broken():
+            raise RuntimeError("down")
+
+        with pytest.raises(RuntimeError):
+            scheduler.call("k", broken)
+        scheduler.shutdown()
+
+    def test_rate_limited(self):
+        """Calls are paced by the limiter, not a fixed sleep."""
+        scheduler = make_scheduler(initial_rate=20, max_rate=20)
+        start = time.perf_counter()
+        futures = [scheduler.submit(i, lambda: None) for i in range(6)]
+        for f in futures:
+            f.result()
+        assert time.perf_counter() - start >= 5 / 20
+        scheduler.shutdown()
@@ -0,0 +1,149 @@
+"""
+Unit tests for song_linker.py.
+
+Links synthetic listings of the same songs as different sources format them
+and checks the proposals against the true songs, the audit scores and the
+candidate count.
+"""
+import os
+import random
+import sys
+import time
+
+import numpy
+import pandas
+from rapidfuzz import fuzz, utils as fuzz_utils
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+import song_linker
+from song_linker import MinHasher
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "to", "ne", "su", "vi", "da", "ch", "ell", "orn", "ba", "qu", "ze", "pi"]
+COMMON_WORDS = ["Love", "The", "Heart", "Night", "Gold", "Party", "You", "Me", "Dance"]
+
+
+def random_catalog(n, seed=0):
+    rng = random.Random(seed)
+
+    def word():
+        return "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))).title()
+
+    songs = []
+    for _ in range(n):
+        artist = " ".join(word() for _ in range(rng.randint(1, 2)))
+        name = " ".join(word() if rng.random() < 0.6 else rng.choice(COMMON_WORDS) for _ in range(rng.randint(1, 3)))
+        featuring = word() + " " + word() if rng.random() < 0.2 else None
+        songs.append((artist, name, featuring))
+    return songs
+
+
+def reformat(rng, artist, name, featuring):
+    """One source's spelling of a listing."""
+    if rng.random() < 0.3:
+        artist = artist.upper() if rng.random() < 0.5 else artist.lower()
+    if featuring is not None and rng.random() < 0.5:
+        name, featuring = f"{name} (feat. {featuring})", None
+    if rng.random() < 0.2:
+        name = name.replace(" ", "  ")
+    if rng.random() < 0.2:
+        name = f"‘{name}’"
+    return artist, name, featuring
+
+
+def random_listings(n, sources=8, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for song_id, (artist, name, featuring) in enumerate(random_catalog(n, seed)):
+        for source in rng.sample(range(sources), rng.randint(1, 4)):
+            a, s, f = reformat(rng, artist, name, featuring)
+            rows.append({"source": f"src{source}", "artist": a, "name": s, "featuring": f, "id": song_id})
+        if rng.random() < 0.05:
+            # A remix of the song on another list is a different song
+            rows.append({"source": "remixes", "artist": artist, "name": f"{name} (Remix)",
+                         "featuring": featuring, "id": f"remix{song_id}"})
+    return pandas.DataFrame(rows)
+
+
+# =============================================================================
+# MinHash
+# =============================================================================
+
+
+class TestMinHash:
+    """Tests for the signatures."""
+
+    def test_estimates_jaccard(self):
+        """The share of equal values is close to the Jaccard similarity."""
+        a = {f"x{i}" for i in range(100)}
+        b = {f"x{i}" for i in range(50, 150)}
+        signatures = MinHasher(num_perm=512).signatures([a, b, set()])
+        estimate = (signatures[0] == signatures[1]).mean()
+        assert abs(estimate - 50 / 150) < 0.08
+        assert (signatures[2] == 0xFFFFFFFF).all()
+
+    def test_deterministic(self):
+        """Signatures don't depend on the process's hash seed."""
+        sets = [song_linker.listing_shingles("Lorde", "Hammer")]
+        assert (MinHasher().signatures(sets) == MinHasher().signatures(sets)).all()
+
+    def test_formatting_doesnt_change_shingles(self):
+        """Quotes, case and bracketed credits don't change the shingles."""
+        assert song_linker.listing_shingles("LORDE", "‘Hammer’ (feat. X)") == song_linker.listing_shingles(
+            "Lorde", "Hammer"
+        )
+
+
+# =============================================================================
+# Linking
+# =============================================================================
+
+
+class TestProposeLinks:
+    """Tests for propose_links and link_agreement."""
+
+    def test_links_same_songs_across_sources(self):
+        """Nearly every cross-source pair of a song is found, and few others."""
+        df = random_listings(2000)
+        proposals = song_linker.propose_links(df)
+        report = song_linker.link_agreement(proposals, df["id"], df["source"])
+        assert report["recall"] > 0.95
+        assert report["precision"] > 0.98
+        sources = df["source"].to_numpy()
+        assert (sources[proposals["i"]] != sources[proposals["j"]]).all()
+
+    def test_remixes_not_linked(self):
+        """A remix is never proposed as its original."""
+        df = random_listings(2000, seed=1)
+        proposals = song_linker.propose_links(df)
+        ids = df["id"].astype(str).to_numpy()
+        for i, j in zip(proposals["i"], proposals["j"]):
+            assert ids[i].startswith("remix") == ids[j].startswith("remix")
+
+    def test_scores_match_audit(self):
+        """Scores are what audit_match_quality would compute for the pair."""
+        df = random_listings(300, seed=2)
+        proposals = song_linker.propose_links(df)
+        full = [song_linker.listing_full_text(a, n, f) for a, n, f in zip(df["artist"], df["name"], df["featuring"])]
+        for row in proposals.head(100).itertuples():
+            expected = fuzz.token_set_ratio(full[row.i], full[row.j], processor=fuzz_utils.default_process)
+            assert row.token_set == expected >= 90
+
+    def test_link_groups(self):
+        """Proposed pairs join transitively."""
+        proposals = pandas.DataFrame({"i": [0, 1], "j": [1, 3]})
+        assert song_linker.link_groups(5, proposals).tolist() == [0, 0, 1, 0, 2]
+
+    def test_near_linear(self):
+        """Ten times the listings gives about ten times the candidates."""
+        small = random_listings(2000, seed=3)
+        large = random_listings(20000, seed=3)
+        hasher = MinHasher()
+        counts = []
+        for df in (small, large):
+            signatures = hasher.signatures(
+                song_linker.listing_shingles(a, n) for a, n in zip(df["artist"], df["name"])
+            )
+            start = time.perf_counter()
+            counts.append(len(song_linker.lsh_candidate_pairs(signatures)))
+        assert time.perf_counter() - start < 20
+        assert counts[1] < 20 * counts[0]
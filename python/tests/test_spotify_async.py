@@ -0,0 +1,155 @@
+"""
+Unit tests for rate_limit.py and spotify_async.py.
+
+Tests the token bucket and runs the async search client against the local
+Spotify stand-in for concurrency limits, coalescing and 429 handling.
+"""
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from rate_limit import TokenBucket, parse_retry_after
+from spotify_async import AsyncSpotifySearchClient, SpotifyRequestError, run_search_many
+from spotify_standin import SpotifyStandIn, make_fake_track
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# =============================================================================
+# Token bucket
+# =============================================================================
+
+
+class TestTokenBucket:
+    """Tests for TokenBucket with a fake clock."""
+
+    def test_burst_then_rate(self):
+        """A full bucket allows a burst, then refills at rate."""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() == pytest.approx(0.5)
+        clock.now = 0.5
+        assert bucket.try_acquire() == 0
+
+    def test_pause(self):
+        """pause() blocks acquisitions and empties the bucket."""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, capacity=10, clock=clock)
+        bucket.pause(3)
+        assert bucket.try_acquire() == pytest.approx(3)
+        clock.now = 3.0
+        assert bucket.try_acquire() == pytest.approx(0.1)
+        clock.now = 3.1
+        assert bucket.try_acquire() == 0
+
+    def test_set_rate(self):
+        """Changing the rate keeps tokens already earned."""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=5, clock=clock)
+        for _ in range(5):
+            bucket.try_acquire()
+        bucket.set_rate(4)
+        assert bucket.try_acquire() == pytest.approx(0.25)
+
+    def test_parse_retry_after(self):
+        """Retry-After is seconds; junk falls back to the default."""
+        assert parse_retry_after("3") == 3.0
+        assert parse_retry_after(None, default=2) == 2
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 1.0
+
+
+# =============================================================================
+# Async client
+# =============================================================================
+
+
+@pytest.fixture
+def standin():
+    tracks = {t["id"]: t for t in (make_fake_track(i) for i in range(40))}
+    searches = {f"query {i}": [track_id] for i, track_id in enumerate(tracks)}
+    with SpotifyStandIn(tracks, searches=searches, latency_seconds=0.05) as standin:
+        yield standin
+
+
+def make_client(standin, **kwargs):
+    kwargs.setdefault("rate_per_second", 1000)
+    return AsyncSpotifySearchClient(lambda: "token", prefix=standin.url, **kwargs)
+
+
+class TestAsyncSearch:
+    """Tests for AsyncSpotifySearchClient against the stand-in."""
+
+    def test_concurrent_and_bounded(self, standin):
+        """Searches overlap but never exceed max_in_flight."""
+        client = make_client(standin, max_in_flight=4)
+        start = time.perf_counter()
+        results = run_search_many(client, [f"query {i}" for i in range(20)])
+        elapsed = time.perf_counter() - start
+        assert results["query 3"]["tracks"]["items"][0]["id"] == "track000003"
+        assert standin.max_concurrent <= 4
+        assert standin.max_concurrent > 1
+        # 20 requests of 50 ms, four at a time
+        assert elapsed < 20 * 0.05
+
+    def test_coalesces_identical_queries(self, standin):
+        """The same query in flight twice is only sent once."""
+        stats = Counter()
+        client = make_client(standin, stats=stats)
+        results = run_search_many(client, ["query 1", "query 1", "query 2", "query 1"])
+        assert standin.requests["search"] == 2
+        assert stats["coalesced_queries"] == 2
+        assert results["query 1"]["tracks"]["items"][0]["id"] == "track000001"
+
+    def test_not_found(self, standin):
+        """An empty result comes back as None."""
+        stats = Counter()
+        client = make_client(standin, stats=stats)
+        assert run_search_many(client, ["nothing"]) == {"nothing": None}
+        assert stats["main_api_queries_not_found"] == 1
+
+    def test_retry_after(self, standin):
+        """A 429 pauses the whole bucket for Retry-After seconds."""
+        stats = Counter()
+        client = make_client(standin, stats=stats)
+        standin.inject(429, {"Retry-After": "1"})
+        start = time.perf_counter()
+        results = run_search_many(client, ["query 5"])
+        assert time.perf_counter() - start >= 1.0
+        assert results["query 5"] is not None
+        assert stats["retry_after_waits"] == 1
+        assert standin.requests["injected_429"] == 1
+
+    def test_rate_limit(self, standin):
+        """The token bucket caps the request rate."""
+        client = make_client(standin, bucket=TokenBucket(rate=20, capacity=1))
+        start = time.perf_counter()
+        run_search_many(client, [f"query {i}" for i in range(11)])
+        assert time.perf_counter() - start >= 0.5
+
+    def test_client_error_raises(self, standin):
+        """Non-retryable errors surface to every caller."""
+        client = make_client(standin)
+        standin.inject(400)
+        with pytest.raises(SpotifyRequestError):
+            run_search_many(client, ["query 1"])
+
+    def test_on_result_callback(self, standin):
+        """on_result sees every query as it finishes."""
+        client = make_client(standin)
+        seen = {}
+        asyncio.run(client.search_many(["query 1", "nothing"], on_result=seen.__setitem__))
+        assert seen["nothing"] is None
+        assert seen["query 1"] is not None
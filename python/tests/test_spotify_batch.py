@@ -0,0 +1,128 @@
+"""
+Unit tests for spotify_batch.py and spotify_standin.py.
+
+Tests batching of track and artist lookups, and runs the real spotipy client
+against the local stand-in server to count round-trips.
+"""
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from spotify_batch import chunked, fetch_artists, fetch_tracks, missing_ids, unique_ids
+from spotify_standin import (
+    SpotifyStandIn,
+    make_fake_artist,
+    make_fake_track,
+    make_standin_client,
+)
+
+
+class FakeSpotify:
+    """Records calls to the bulk endpoints."""
+
+    def __init__(self, tracks):
+        self.tracks_by_id = tracks
+        self.calls = []
+
+    def tracks(self, ids, market=None):
+        self.calls.append(list(ids))
+        return {"tracks": [self.tracks_by_id.get(i) for i in ids]}
+
+
+# =============================================================================
+# Helpers
+# =============================================================================
+
+
+class TestHelpers:
+    """Tests for ID deduplication and chunking."""
+
+    def test_unique_ids_skips_empty_and_nan(self):
+        """Duplicates, empty strings, None and NaN are dropped."""
+        assert unique_ids(["a", "", None, float("nan"), "b", "a"]) == ["a", "b"]
+
+    def test_chunked(self):
+        """Chunks are at most size long."""
+        assert [len(c) for c in chunked(list(range(120)), 50)] == [50, 50, 20]
+
+    def test_missing_ids(self):
+        """Only uncached IDs are returned."""
+        assert missing_ids(["a", "b", "a", "c"], lambda i: i == "b") == ["a", "c"]
+
+
+# =============================================================================
+# Batching
+# =============================================================================
+
+
+class TestFetchTracks:
+    """Tests for fetch_tracks against a fake client."""
+
+    def test_batches_of_fifty(self):
+        """120 unique IDs take three requests."""
+        tracks = {t["id"]: t for t in (make_fake_track(i) for i in range(120))}
+        sp = FakeSpotify(tracks)
+        found = fetch_tracks(sp, list(tracks) + list(tracks))
+        assert [len(c) for c in sp.calls] == [50, 50, 20]
+        assert found == tracks
+
+    def test_unknown_ids_are_skipped(self):
+        """IDs Spotify returns None for are counted and left out."""
+        track = make_fake_track(1)
+        sp = FakeSpotify({track["id"]: track})
+        stats = Counter()
+        found = fetch_tracks(sp, [track["id"], "missing"], stats=stats)
+        assert list(found) == [track["id"]]
+        assert stats["tracks_batch_not_found"] == 1
+        assert stats["tracks_batch_requests"] == 1
+
+    def test_relinked_track_keyed_by_requested_id(self):
+        """A relinked track is returned under the ID that was asked for."""
+        relinked = make_fake_track(2)
+        sp = FakeSpotify({"old_id": relinked})
+        assert fetch_tracks(sp, ["old_id"])["old_id"]["id"] == relinked["id"]
+
+
+# =============================================================================
+# Stand-in server
+# =============================================================================
+
+
+class TestStandIn:
+    """Runs spotipy against the local stand-in."""
+
+    @pytest.fixture
+    def standin(self):
+        tracks = {t["id"]: t for t in (make_fake_track(i) for i in range(200))}
+        artist_ids = {t["artists"][0]["id"] for t in tracks.values()}
+        artists = {a: make_fake_artist(a) for a in artist_ids}
+        searches = {"artist song": ["track000001"]}
+        with SpotifyStandIn(tracks, artists, searches) as standin:
+            yield standin
+
+    def test_single_and_batched_round_trips(self, standin):
+        """Batching 200 tracks takes four requests instead of 200."""
+        sp = make_standin_client(standin)
+        assert sp.track("track000003")["name"] == "Song 3"
+        assert standin.requests["track"] == 1
+
+        found = fetch_tracks(sp, list(standin.tracks))
+        assert len(found) == 200
+        assert standin.requests["tracks"] == 4
+
+    def test_artists(self, standin):
+        """Artists are fetched in bulk too."""
+        sp = make_standin_client(standin)
+        found = fetch_artists(sp, sorted(standin.artists))
+        assert len(found) == 97
+        assert standin.requests["artists"] == 2
+
+    def test_search(self, standin):
+        """Search returns the configured tracks."""
+        sp = make_standin_client(standin)
+        results = sp.search(q="artist song", type="track", limit=1)
+        assert results["tracks"]["items"][0]["id"] == "track000001"
+        assert sp.search(q="nothing", type="track")["tracks"]["items"] == []
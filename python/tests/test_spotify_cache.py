@@ -0,0 +1,152 @@
+"""
+Unit tests for spotify_cache.py.
+
+Tests that the normalized cache still behaves like the old query -> response
+dict, stores each track once, keeps its secondary indexes in sync, and
+migrates the old un-normalized cache.
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+from api_cache import SPOTIFY_NAMESPACE, CacheStore
+from spotify_cache import SpotifyCache, open_spotify_cache
+
+
+def make_item(spotify_id, isrc, artist_id="artist1", name="Song"):
+    return {
+        "id": spotify_id,
+        "name": name,
+        "artists": [{"id": artist_id, "name": "Artist"}],
+        "external_ids": {"isrc": isrc},
+    }
+
+
+def make_results(*items):
+    return {"tracks": {"items": list(items)}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CacheStore(str(tmp_path / "api_cache.sqlite3"))
+    yield store
+    store.close()
+
+
+# =============================================================================
+# Dict interface
+# =============================================================================
+
+
+class TestDictInterface:
+    """The normalized cache should be a drop-in for the query -> response dict."""
+
+    def test_round_trip(self, store):
+        """A stored response comes back with the same items in order."""
+        cache = SpotifyCache(store)
+        results = make_results(make_item("a", "ISRC1"), make_item("b", "ISRC2"))
+        cache["year:2025 artist song"] = results
+        assert "year:2025 artist song" in cache
+        assert cache["year:2025 artist song"] == results
+        assert cache.get("missing") is None
+        assert len(cache) == 1
+
+    def test_items_are_deduplicated(self, store):
+        """The same track returned by several queries is stored once."""
+        cache = SpotifyCache(store)
+        item = make_item("a", "ISRC1")
+        cache["id:a"] = make_results(item)
+        cache["artist:Artist track:Song"] = make_results(item)
+        cache["year:2025 artist song"] = make_results(item, make_item("b", "ISRC2"))
+        assert len(cache) == 3
+        assert len(cache.items_by_id) == 2
+        assert cache.item("a") == item
+
+    def test_overwrite_and_delete(self, store):
+        """Replacing or deleting a query keeps the id -> queries index in sync."""
+        cache = SpotifyCache(store)
+        cache["q"] = make_results(make_item("a", "ISRC1"))
+        cache["q"] = make_results(make_item("b", "ISRC2"))
+        assert cache.queries_for_id("a") == []
+        assert cache.queries_for_id("b") == ["q"]
+        del cache["q"]
+        assert "q" not in cache
+        assert cache.queries_for_id("b") == []
+
+    def test_persists(self, tmp_path):
+        """Reopening the store sees the same cache."""
+        path = str(tmp_path / "api_cache.sqlite3")
+        store = CacheStore(path)
+        SpotifyCache(store)["q"] = make_results(make_item("a", "ISRC1"))
+        store.close()
+
+        reopened = CacheStore(path)
+        assert SpotifyCache(reopened)["q"]["tracks"]["items"][0]["id"] == "a"
+        reopened.close()
+
+
+# =============================================================================
+# Secondary indexes
+# =============================================================================
+
+
+class TestIndexes:
+    """Tests for lookups by ISRC, artist0 and Spotify ID."""
+
+    def test_isrc_and_artist0(self, store):
+        """Items are indexed by ISRC and primary artist."""
+        cache = SpotifyCache(store)
+        cache["q1"] = make_results(make_item("a", "ISRC1", artist_id="x"))
+        cache["q2"] = make_results(make_item("b", "ISRC1", artist_id="x"))
+        cache["q3"] = make_results(make_item("c", "ISRC3", artist_id="y"))
+        assert cache.ids_for_isrc("ISRC1") == ["a", "b"]
+        assert cache.ids_for_artist0("x") == ["a", "b"]
+        assert cache.ids_for_artist0("y") == ["c"]
+        assert cache.ids_for_isrc("nope") == []
+
+    def test_find_matches_top_item_only(self, store):
+        """find() keeps debug_spotify_cache's top-result semantics."""
+        cache = SpotifyCache(store)
+        cache["top"] = make_results(make_item("a", "ISRC1"), make_item("b", "ISRC2"))
+        cache["second"] = make_results(make_item("b", "ISRC2"), make_item("a", "ISRC1"))
+        assert [q for q, _ in cache.find(spotify_id="a")] == ["top"]
+        assert [q for q, _ in cache.find(isrc="ISRC2")] == ["second"]
+
+    def test_find_requires_a_key(self, store):
+        """find() needs an ID or an ISRC."""
+        with pytest.raises(AssertionError):
+            list(SpotifyCache(store).find())
+
+
+# =============================================================================
+# Migration
+# =============================================================================
+
+
+class TestMigration:
+    """Tests for migrating the old query -> response cache."""
+
+    def test_migrates_store_namespace(self, store):
+        """The old namespace is normalized and then cleared."""
+        legacy = store.namespace(SPOTIFY_NAMESPACE)
+        item = make_item("a", "ISRC1")
+        legacy.update_many([("id:a", make_results(item)), ("q", make_results(item))])
+
+        cache = open_spotify_cache(store)
+        assert sorted(cache) == ["id:a", "q"]
+        assert len(cache.items_by_id) == 1
+        assert len(store.namespace(SPOTIFY_NAMESPACE)) == 0
+
+    def test_migrates_legacy_json_once(self, store, tmp_path):
+        """The JSON file only seeds an empty cache."""
+        legacy = tmp_path / "spotify_cache.json"
+        legacy.write_text(json.dumps({"q": make_results(make_item("a", "ISRC1"))}), encoding="utf-8")
+        cache = open_spotify_cache(store, str(legacy))
+        assert cache["q"]["tracks"]["items"][0]["id"] == "a"
+
+        legacy.write_text(json.dumps({"other": make_results(make_item("b", "ISRC2"))}), encoding="utf-8")
+        cache = open_spotify_cache(store, str(legacy))
+        assert "other" not in cache
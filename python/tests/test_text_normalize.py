@@ -0,0 +1,119 @@
+"""
+Unit tests for text_normalize.py.
+
+Checks the shared cleaners against the nested per-matcher functions they
+replaced, and the column variants against the scalar ones.
+"""
+import os
+import random
+import re
+import sys
+
+import pandas
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../notebooks"))
+import text_normalize
+
+
+def clean_string_reference(text):
+    """create_clean_spotify_query's nested clean_string, before sharing."""
+    text = text.replace("’", "'")
+    text = text.replace("…", "...")
+    text = re.sub(r"[\(\[].*?[\)\]]", "", text)
+    text = re.sub(r"(?i)\b(feat|ft|featuring)\b.*", "", text)
+    text = re.sub(r"(?i)\s+([x]|[+]|w/)\s+", " ", text)
+    text = re.sub(r"(?:[a-zA-Z]\.){2,}", lambda match: match.group(0).replace(".", ""), text)
+    text = text.strip()
+    text = text.casefold().replace(" and ", " & ")
+    return text.replace("f*ck", "fuck").replace("p*ssy", "pussy").replace("sh*t", "shit")
+
+
+def youtube_tokens_reference(text):
+    """verify_youtube_song_match_v4's nested get_clean_tokens."""
+    if not text:
+        return set()
+    text = text.casefold()
+    text = re.sub(r"\b(official|video|audio|music video|lyric|lyrics|visualizer|mv|hq|4k|hd|topic|vevo)\b", "", text)
+    text = re.sub(r"\b(feat|ft|featuring|with|prod|produced|by)\b", "", text)
+    text = re.sub(r"[^a-z0-9\s]", " ", text)
+    return set(text.split())
+
+
+def apple_music_tokens_reference(text):
+    """verify_apple_music_match's nested get_clean_tokens."""
+    if not text:
+        return set()
+    text = text.casefold()
+    noise = r"\b(official|video|audio|music video|lyric|lyrics|visualizer|mv|hq|4k|hd|topic|vevo|feat|ft|featuring|with|prod|produced|by)\b"
+    text = re.sub(noise, "", text)
+    text = re.sub(r"[^a-z0-9\s]", " ", text)
+    return set(text.split())
+
+
+PIECES = [
+    "Lorde", "R.E.M.", "s.n.c.", "(feat. Mustafa)", "[Remix]", "ft.", "featuring", "x", "+", "w/",
+    "Official Music Video", "lyric", "VEVO", "with", "by", "prod.", "Beyoncé", "’", "…", "and",
+    "f*ck", "Sh*t", "4K", "-", "Topic", "Live", "Pinkpantheress", "Bladee", "The", "  ",
+]
+
+
+def random_texts(n, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(PIECES, k=rng.randint(0, 8))) for _ in range(n)]
+
+
+# =============================================================================
+# Cleaners
+# =============================================================================
+
+
+class TestCleaners:
+    """Tests for the memoized cleaners."""
+
+    def test_clean_query_text(self):
+        """Same Spotify query text as the nested clean_string."""
+        for text in random_texts(2000):
+            assert text_normalize.clean_query_text(text) == clean_string_reference(text)
+        assert text_normalize.clean_query_text("R.E.M. and Friends (Live)") == "rem & friends"
+
+    def test_clean_tokens(self):
+        """Same token sets as both matchers' get_clean_tokens."""
+        for text in random_texts(2000, seed=1) + ["", None]:
+            tokens = text_normalize.clean_tokens(text)
+            assert tokens == youtube_tokens_reference(text) == apple_music_tokens_reference(text)
+        assert text_normalize.clean_tokens("Afraid (feat. Nate Sib) [Official Video]") == {"afraid", "nate", "sib"}
+
+    def test_simplify(self):
+        """Letters and digits only, casefolded."""
+        for text in random_texts(500, seed=2):
+            assert text_normalize.simplify(text) == re.sub(r"[^a-z0-9]", "", text.casefold())
+        assert text_normalize.simplify("LilyAllenVEVO") == "lilyallenvevo"
+
+    def test_memoized(self):
+        """Repeated strings are only cleaned once."""
+        text_normalize.clean_tokens.cache_clear()
+        for _ in range(100):
+            text_normalize.clean_tokens("Lorde Man Of The Year")
+        stats = text_normalize.cache_stats()
+        assert stats["clean_tokens.misses"] == 1 and stats["clean_tokens.hits"] == 99
+
+
+# =============================================================================
+# Columns
+# =============================================================================
+
+
+class TestColumns:
+    """Tests for the column variants."""
+
+    def test_columns_match_scalars(self):
+        """Each column variant equals mapping the scalar cleaner."""
+        values = pandas.Series(random_texts(300, seed=3) * 2, index=range(10, 610))
+        for column_func, func in [
+            (text_normalize.clean_query_column, text_normalize.clean_query_text),
+            (text_normalize.clean_tokens_column, text_normalize.clean_tokens),
+            (text_normalize.simplify_column, text_normalize.simplify),
+        ]:
+            result = column_func(values)
+            assert result.index.equals(values.index)
+            assert result.tolist() == [func(v) for v in values]